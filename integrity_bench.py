@@ -0,0 +1,387 @@
+"""
+Замер производительности расчёта контрольных сумм по всем алгоритмам
+из db_init.sql на синтетических данных: буфер в памяти, много мелких файлов,
+несколько больших файлов и таблицы SQLite. Результат выводится в JSON,
+чтобы сравнивать выпуски между собой:
+
+    python integrity_bench.py --algorithms crc32,sha256 --output bench.json
+
+С параметром --pg-url те же таблицы создаются в PostgreSQL, и сравниваются
+способы чтения: select_all_from_table, потоковая выборка и выгрузка COPY.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+from functools import partial
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import create_engine, text
+
+import integrity_lib as ilib
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_VERSION = 4
+PERCENTILES = (50, 90, 99)
+PG_TABLES = ("integrity_bench_narrow", "integrity_bench_wide")
+
+
+def load_algorithms(init_script: str = "db_init.sql") -> List[str]:
+    """
+    Список алгоритмов из скрипта создания вспомогательной БД.
+    :param init_script:
+    :return:
+    """
+    with open(init_script) as script, sqlite3.connect(":memory:") as connection:
+        connection.executescript(script.read())
+        return ilib.select_algorithms(connection)
+
+
+def peak_rss() -> Optional[int]:
+    """
+    Пиковый объём резидентной памяти текущего процесса и завершённых
+    дочерних процессов в байтах; None, если ОС его не сообщает.
+    Это максимум за всё время работы процесса, поэтому он сообщается один раз
+    для всего замера, а не для отдельных сценариев.
+    :return:
+    """
+    if resource is None:
+        return None
+    # В Linux ru_maxrss в килобайтах, в macOS - в байтах
+    scale = 1 if sys.platform == "darwin" else 1024
+    return scale * max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+
+def make_files(directory: str, prefix: str, count: int, size: int) -> List[str]:
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"{prefix}_{i}.bin")
+        with open(path, "wb") as file:
+            for offset in range(0, size, ilib.CHUNK_SIZE):
+                file.write(os.urandom(min(ilib.CHUNK_SIZE, size - offset)))
+        paths.append(path)
+    return paths
+
+
+def make_tables(path: str, rows: int) -> List[str]:
+    """
+    Создаёт БД SQLite с узкой и широкой таблицами по rows записей.
+    :param path:
+    :param rows:
+    :return: названия таблиц
+    """
+    with sqlite3.connect(path) as connection:
+        connection.execute(
+            "CREATE TABLE narrow (id INTEGER PRIMARY KEY, value INTEGER);"
+        )
+        connection.execute(
+            "CREATE TABLE wide (id INTEGER PRIMARY KEY, name TEXT, "
+            "amount REAL, created_at TEXT, payload TEXT);"
+        )
+        connection.executemany(
+            "INSERT INTO narrow (value) VALUES (?);",
+            ((i * 7919,) for i in range(rows)),
+        )
+        connection.executemany(
+            "INSERT INTO wide (name, amount, created_at, payload) VALUES (?, ?, ?, ?);",
+            (
+                (
+                    f"Объект {i}",
+                    i / 7,
+                    f"2024-01-01 00:00:{i % 60:02}",
+                    os.urandom(48).hex(),
+                )
+                for i in range(rows)
+            ),
+        )
+    return ["narrow", "wide"]
+
+
+def make_pg_tables(connection, rows: int) -> List[str]:
+    """
+    Создаёт в PostgreSQL узкую и широкую таблицы по rows записей.
+    :param connection:
+    :param rows:
+    :return: названия таблиц
+    """
+    narrow, wide = PG_TABLES
+    drop_pg_tables(connection)
+    connection.execute(
+        f"CREATE TABLE {narrow} (id SERIAL PRIMARY KEY, value INTEGER);"
+    )
+    connection.execute(
+        f"CREATE TABLE {wide} (id SERIAL PRIMARY KEY, name TEXT, "
+        "amount DOUBLE PRECISION, created_at TIMESTAMP, payload TEXT);"
+    )
+    connection.execute(
+        f"INSERT INTO {narrow} (value) "
+        f"SELECT i * 7919 FROM generate_series(0, {rows - 1}) i;"
+    )
+    connection.execute(
+        text(
+            f"INSERT INTO {wide} (name, amount, created_at, payload) "
+            "VALUES (:name, :amount, :created_at, :payload);"
+        ),
+        [
+            {
+                "name": f"Объект {i}",
+                "amount": i / 7,
+                "created_at": f"2024-01-01 00:00:{i % 60:02}",
+                "payload": os.urandom(48).hex(),
+            }
+            for i in range(rows)
+        ],
+    )
+    return list(PG_TABLES)
+
+
+def drop_pg_tables(connection):
+    for table in PG_TABLES:
+        connection.execute(f"DROP TABLE IF EXISTS {table};")
+
+
+def nearest_rank(values: List[float], percentile: int) -> float:
+    """
+    Перцентиль отсортированного непустого списка по методу ближайшего ранга.
+    :param values:
+    :param percentile:
+    :return:
+    """
+    return values[max(0, -(-len(values) * percentile // 100) - 1)]
+
+
+def run_scenario(
+    scenario: str, algorithm: str, objects: List[Callable[[], int]]
+) -> Dict:
+    """
+    Выполняет расчёт для каждого объекта и собирает статистику.
+    :param scenario:
+    :param algorithm:
+    :param objects: функции расчёта, возвращающие размер данных в байтах
+    :return:
+    """
+    latencies = []
+    total_size = 0
+    started_at = perf_counter()
+    for function in objects:
+        object_started_at = perf_counter()
+        total_size += function()
+        latencies.append(perf_counter() - object_started_at)
+    elapsed = perf_counter() - started_at
+    latencies.sort()
+    return {
+        "scenario": scenario,
+        "algorithm": algorithm,
+        "objects": len(objects),
+        "bytes": total_size,
+        "seconds": elapsed,
+        "mb_per_s": total_size / 1024 / 1024 / elapsed if elapsed else None,
+        "latency_ms": {
+            **{
+                f"p{percentile}": 1000 * nearest_rank(latencies, percentile)
+                for percentile in PERCENTILES
+            },
+            "max": 1000 * latencies[-1],
+        },
+    }
+
+
+def hash_buffer(buffer: bytes, algorithm: str) -> int:
+    ilib.calculate_checksum(buffer, algorithm)
+    return len(buffer)
+
+
+def hash_file(path: str, algorithm: str) -> int:
+    ilib.checksum_file(path, algorithm)
+    return os.path.getsize(path)
+
+
+def hash_files_parallel(
+    paths: List[str], algorithm: str, workers: Optional[int]
+) -> int:
+    tasks = [(i, path, algorithm) for i, path in enumerate(paths)]
+    results = ilib.checksum_files_parallel(tasks, workers)
+    return sum(size for _, _, size, _ in results)
+
+
+def hash_table(connection, table: str, algorithm: str) -> int:
+    # Тот же путь, что и при проверке таблицы, но с подсчётом объёма данных
+    size = 0
+    hasher = ilib.make_hasher(algorithm)
+    encoder = ilib.RowEncoder()
+    for rows in ilib.stream_table(connection, table, "id"):
+        encoded = encoder.encode(rows)
+        hasher.update(encoded)
+        size += len(encoded)
+    hasher.finalize()
+    return size
+
+
+def hash_select_all(connection, table: str, algorithm: str) -> int:
+    # Исходный способ: все записи в одной строке, затем расчёт
+    data = ilib.select_all_from_table(connection, table, "id").encode()
+    ilib.calculate_checksum(data, algorithm)
+    return len(data)
+
+
+def hash_copy(connection, table: str, algorithm: str, binary: bool) -> int:
+    writer = ilib.CopyHasher(ilib.make_hasher(algorithm))
+    ilib.copy_table(connection, table, "id", writer, binary=binary)
+    writer.flush()
+    writer.hasher.finalize()
+    return writer.length
+
+
+def run_algorithm(
+    args: argparse.Namespace,
+    algorithm: str,
+    buffer: bytes,
+    small_files: List[str],
+    huge_files: List[str],
+    connection,
+    tables: List[str],
+    pg_connection=None,
+    pg_tables: Optional[List[str]] = None,
+) -> List[Dict]:
+    scenarios = {
+        "memory": [partial(hash_buffer, buffer, algorithm)] * args.repeat,
+        "small_files": [partial(hash_file, path, algorithm) for path in small_files],
+        "huge_files": [partial(hash_file, path, algorithm) for path in huge_files],
+        # Массовая проверка: все мелкие файлы в пуле процессов как один объект
+        "check_all": [
+            partial(hash_files_parallel, small_files, algorithm, args.workers)
+        ],
+        "tables": [
+            partial(hash_table, connection, table, algorithm) for table in tables
+        ],
+    }
+    if pg_connection is not None:
+        scenarios.update(
+            {
+                "pg_select_all": [
+                    partial(hash_select_all, pg_connection, table, algorithm)
+                    for table in pg_tables
+                ],
+                "pg_stream": [
+                    partial(hash_table, pg_connection, table, algorithm)
+                    for table in pg_tables
+                ],
+                "pg_copy_text": [
+                    partial(hash_copy, pg_connection, table, algorithm, False)
+                    for table in pg_tables
+                ],
+                "pg_copy_binary": [
+                    partial(hash_copy, pg_connection, table, algorithm, True)
+                    for table in pg_tables
+                ],
+            }
+        )
+    results = []
+    for scenario, objects in scenarios.items():
+        results.append(run_scenario(scenario, algorithm, objects))
+        print(
+            f"{algorithm} {scenario}: {results[-1]['mb_per_s'] or 0:.1f} МБ/с",
+            file=sys.stderr,
+        )
+    return results
+
+
+def run(args: argparse.Namespace) -> Dict:
+    algorithms = (
+        args.algorithms.split(",") if args.algorithms else load_algorithms(args.init)
+    )
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        buffer = os.urandom(args.memory_size)
+        small_files = make_files(directory, "small", args.small_count, args.small_size)
+        huge_files = make_files(directory, "huge", args.huge_count, args.huge_size)
+        database = os.path.join(directory, "bench.db")
+        tables = make_tables(database, args.rows)
+        engine = create_engine(f"sqlite:///{database}")
+        pg_engine = create_engine(args.pg_url) if args.pg_url else None
+        with engine.connect() as connection:
+            pg_connection = pg_engine.connect() if pg_engine else None
+            try:
+                pg_tables = (
+                    make_pg_tables(pg_connection, args.rows) if pg_connection else None
+                )
+                for algorithm in algorithms:
+                    results += run_algorithm(
+                        args,
+                        algorithm,
+                        buffer,
+                        small_files,
+                        huge_files,
+                        connection,
+                        tables,
+                        pg_connection,
+                        pg_tables,
+                    )
+            finally:
+                if pg_connection is not None:
+                    drop_pg_tables(pg_connection)
+                    pg_connection.close()
+                    pg_engine.dispose()
+        engine.dispose()
+    return {
+        "version": BENCH_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "parameters": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "pg_url")
+        },
+        "results": results,
+        "peak_rss": peak_rss(),
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Замер производительности расчёта контрольных сумм"
+    )
+    parser.add_argument(
+        "--algorithms", help="алгоритмы через запятую (по умолчанию - все из БД)"
+    )
+    parser.add_argument("--init", default="db_init.sql", help="скрипт создания БД")
+    parser.add_argument("--memory-size", type=int, default=16 * 1024 * 1024)
+    parser.add_argument("--repeat", type=int, default=4, help="повторов для буфера")
+    parser.add_argument("--small-count", type=int, default=500)
+    parser.add_argument("--small-size", type=int, default=4096)
+    parser.add_argument("--huge-count", type=int, default=2)
+    parser.add_argument("--huge-size", type=int, default=64 * 1024 * 1024)
+    parser.add_argument("--rows", type=int, default=20000, help="записей в таблице")
+    parser.add_argument("--workers", type=int, help="процессов для check_all")
+    parser.add_argument(
+        "--pg-url",
+        help="строка соединения SQLAlchemy с PostgreSQL для сравнения выгрузки COPY",
+    )
+    parser.add_argument("--output", help="файл для результата (по умолчанию - stdout)")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    report = json.dumps(run(args), ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            output.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
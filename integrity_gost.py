@@ -0,0 +1,437 @@
+"""
+Табличная реализация функций хэширования ГОСТ Р 34.11-94 и ГОСТ Р 34.11-2012
+(«Стрибог»). Альтернатива PyGOST с теми же результатами: преобразования
+S-блоков и LPS выполняются по таблицам, рассчитанным один раз при импорте,
+а данные обрабатываются по мере поступления, без накопления в памяти.
+"""
+import struct
+from functools import lru_cache
+from typing import List
+
+M32 = 0xFFFFFFFF
+M64 = 0xFFFFFFFFFFFFFFFF
+
+# ГОСТ Р 34.11-2012
+
+STREEBOG_BLOCK_SIZE = 64
+
+STREEBOG_PI = bytes.fromhex(
+    "fceedd11cf6e3116fbc4fada23c5044de977f0db932e99ba1736f1bb14cd5fc1"
+    "f918655ae25cef21811c3c428b018e4f058402aee36a8fa0060bed987fd4d31f"
+    "eb342c51eac848abf22a68a2fd3aceccb5700e56080c7612bf7213479cb75d87"
+    "15a19629107b9ac7f391786f9d9eb2b13275193dff358a7e6d54c680c3bd0d57"
+    "dff524a93ea843c9d779d6f67c22b903e00fecde7a94b0bcdce828504e330a4a"
+    "a79760731e0062441ab83882649f2641ad454692275e552f8ca3a57d69d5953b"
+    "0758b34086ac1df730376be488d9e789e11b83494c3ff8fe8d53aa90cad88561"
+    "207167a42d2b095bcb9b25d0bee56c5259a674d2e6f4b4c0d166afc2394b63b6"
+)
+
+STREEBOG_A = (
+    0x8e20faa72ba0b470, 0x47107ddd9b505a38, 0xad08b0e0c3282d1c, 0xd8045870ef14980e,
+    0x6c022c38f90a4c07, 0x3601161cf205268d, 0x1b8e0b0e798c13c8, 0x83478b07b2468764,
+    0xa011d380818e8f40, 0x5086e740ce47c920, 0x2843fd2067adea10, 0x14aff010bdd87508,
+    0x0ad97808d06cb404, 0x05e23c0468365a02, 0x8c711e02341b2d01, 0x46b60f011a83988e,
+    0x90dab52a387ae76f, 0x486dd4151c3dfdb9, 0x24b86a840e90f0d2, 0x125c354207487869,
+    0x092e94218d243cba, 0x8a174a9ec8121e5d, 0x4585254f64090fa0, 0xaccc9ca9328a8950,
+    0x9d4df05d5f661451, 0xc0a878a0a1330aa6, 0x60543c50de970553, 0x302a1e286fc58ca7,
+    0x18150f14b9ec46dd, 0x0c84890ad27623e0, 0x0642ca05693b9f70, 0x0321658cba93c138,
+    0x86275df09ce8aaa8, 0x439da0784e745554, 0xafc0503c273aa42a, 0xd960281e9d1d5215,
+    0xe230140fc0802984, 0x71180a8960409a42, 0xb60c05ca30204d21, 0x5b068c651810a89e,
+    0x456c34887a3805b9, 0xac361a443d1c8cd2, 0x561b0d22900e4669, 0x2b838811480723ba,
+    0x9bcf4486248d9f5d, 0xc3e9224312c8c1a0, 0xeffa11af0964ee50, 0xf97d86d98a327728,
+    0xe4fa2054a80b329c, 0x727d102a548b194e, 0x39b008152acb8227, 0x9258048415eb419d,
+    0x492c024284fbaec0, 0xaa16012142f35760, 0x550b8e9e21f7a530, 0xa48b474f9ef5dc18,
+    0x70a6a56e2440598e, 0x3853dc371220a247, 0x1ca76e95091051ad, 0x0edd37c48a08a6d8,
+    0x07e095624504536c, 0x8d70c431ac02a736, 0xc83862965601dd1b, 0x641c314b2b8ee083,
+)
+
+STREEBOG_C = tuple(
+    struct.unpack("<8Q", constant)
+    for constant in (
+        bytes.fromhex(
+            "0745a6f2596580dd234d74cc3674760515d360a4082a42a20169679291e07c4b"
+            "fcc485758db84e7116d0452e43766a2f1f7c65c0812fcbebe9daca1eda5b08b1"
+        ),
+        bytes.fromhex(
+            "b79bb121700479e656cdcbd71ba2dd55caa70adbc261b55c5899d6126b17b59a"
+            "3101b5160f5ed561982b230a72eafef3d7b5700f469de34f1a2f9da98ab5a36f"
+        ),
+        bytes.fromhex(
+            "b20aba0af5961e9931db7a8643f4b6c209db6260373ac9c1b19e3590e40fe2d3"
+            "7b7b29b11475eaf28b1f9c525f5ef10635843d6a28fc390ac72fce2bacdc74f5"
+        ),
+        bytes.fromhex(
+            "2ed1e384bcbe0c22f137e893a1ea5334be0352933313b7d875d603ed822cd7a9"
+            "3f355e68ad1c729d7d3c5c337e858e48dde4715da0e148f9d26615e8b3df1fef"
+        ),
+        bytes.fromhex(
+            "57fe6c7cfd581760f563eaa97ea2567a161a2723b700ffdfa3f53a254717cdbf"
+            "bdff0f80d7359e354a1086161f1c157f6323a96c0c413f9a994747adac6bea4b"
+        ),
+        bytes.fromhex(
+            "6e7d64467a4068fa354f903672c571bfb6c6bec2661ff20ab4b79a1cb7a6facf"
+            "c68ef09ab49a7f186ca44251f9c4662dc039307a3bc3a46fd9d33a1daeae4fae"
+        ),
+        bytes.fromhex(
+            "93d4143a4d568688f34a3ca24c45173504054a2883694706372c822dc5ab9209"
+            "c9937a19333e47d3c987bfe6c7c69e39540924bffe86ac51ecc5aaee160ec7f4"
+        ),
+        bytes.fromhex(
+            "1ee702bfd40d7fa4d9a8515935c2ac362fc4a5d12b8dd16990069b92cb2b89f4"
+            "9ac4db4d3b44b4891ede369c71f8b74e41416e0c02aae703a7c9934d425b1f9b"
+        ),
+        bytes.fromhex(
+            "db5a238351446172602a1fcb92dc380e549c07a69a8a2b7bb1ceb2db0b440a80"
+            "84090de0b755d93c244289251b3a7d3ade5f16ecd89a4c949b223116545a8f37"
+        ),
+        bytes.fromhex(
+            "ed9c4598fbc7b474c3b63b15d1fa9836f452763b306c1e7a4b3369af0267e79f"
+            "0361331b8ae1ff1fdb788aff1ce74189f3f3e4b248e52a38526f0580a6debeab"
+        ),
+        bytes.fromhex(
+            "1b2df381cda4ca6b5dd86fc04a59a2de986e477d1dcdbaefcab948eaef711d8a"
+            "79668414218001206107abebbb6bfad894fe5a63cdc60230fb89c8efd09ecd7b"
+        ),
+        bytes.fromhex(
+            "20d71bf14a92bc48991bb2d9d517f4fa5228e188aaa41de786cc91189def805d"
+            "9b9f2130d41220f8771ddfbc323ca4cd7ab14904b08013d2ba3116f167e78e37"
+        ),
+    )
+)
+
+
+def _streebog_lps_tables() -> List[List[int]]:
+    """
+    Таблицы совмещённого преобразования LPS: tables[j][b] - результат
+    линейного преобразования l для байта Pi[b] на позиции j 64-битного слова.
+    :return:
+    """
+    tables = []
+    for j in range(8):
+        images = [STREEBOG_A[63 - 8 * j - k] for k in range(8)]
+        linear = [0] * 256
+        for byte in range(1, 256):
+            low_bit = (byte & -byte).bit_length() - 1
+            linear[byte] = linear[byte & (byte - 1)] ^ images[low_bit]
+        tables.append([linear[STREEBOG_PI[byte]] for byte in range(256)])
+    return tables
+
+
+STREEBOG_LPS = _streebog_lps_tables()
+
+
+def _streebog_lpsx(x, y) -> List[int]:
+    """
+    Преобразование LPS от побитового сложения x и y.
+    :param x:
+    :param y:
+    :return:
+    """
+    t0, t1, t2, t3, t4, t5, t6, t7 = STREEBOG_LPS
+    a0, a1, a2, a3 = x[0] ^ y[0], x[1] ^ y[1], x[2] ^ y[2], x[3] ^ y[3]
+    a4, a5, a6, a7 = x[4] ^ y[4], x[5] ^ y[5], x[6] ^ y[6], x[7] ^ y[7]
+    return [
+        t0[(a0 >> shift) & 0xFF]
+        ^ t1[(a1 >> shift) & 0xFF]
+        ^ t2[(a2 >> shift) & 0xFF]
+        ^ t3[(a3 >> shift) & 0xFF]
+        ^ t4[(a4 >> shift) & 0xFF]
+        ^ t5[(a5 >> shift) & 0xFF]
+        ^ t6[(a6 >> shift) & 0xFF]
+        ^ t7[(a7 >> shift) & 0xFF]
+        for shift in (0, 8, 16, 24, 32, 40, 48, 56)
+    ]
+
+
+def _streebog_g(hsh, n, msg) -> List[int]:
+    key = _streebog_lpsx(hsh, n)
+    state = msg
+    for constant in STREEBOG_C:
+        state = _streebog_lpsx(key, state)
+        key = _streebog_lpsx(key, constant)
+    return [a ^ b ^ c ^ d for a, b, c, d in zip(key, state, hsh, msg)]
+
+
+def _to_words(value: int) -> List[int]:
+    return [(value >> (64 * i)) & M64 for i in range(8)]
+
+
+class GOST34112012:
+    """
+    Потоковый расчёт хэш-функции ГОСТ Р 34.11-2012 с длиной результата
+    512 или 256 бит. Интерфейс совпадает с pygost.gost34112012.
+    """
+
+    block_size = STREEBOG_BLOCK_SIZE
+
+    def __init__(self, data=b"", digest_size: int = 64):
+        self.digest_size = digest_size
+        self._hsh = [0] * 8 if digest_size == 64 else [0x0101010101010101] * 8
+        self._n = 0
+        self._sigma = 0
+        self._buffer = b""
+        self.update(data)
+
+    def copy(self) -> "GOST34112012":
+        other = self.__class__.__new__(self.__class__)
+        other.__dict__.update(self.__dict__)
+        other._hsh = list(self._hsh)
+        return other
+
+    def update(self, data):
+        data = self._buffer + bytes(data)
+        size = len(data) - len(data) % STREEBOG_BLOCK_SIZE
+        hsh, n, sigma = self._hsh, self._n, self._sigma
+        for offset in range(0, size, STREEBOG_BLOCK_SIZE):
+            block = data[offset : offset + STREEBOG_BLOCK_SIZE]
+            hsh = _streebog_g(hsh, _to_words(n), struct.unpack("<8Q", block))
+            n = (n + 512) & ((1 << 512) - 1)
+            sigma = (sigma + int.from_bytes(block, "little")) & ((1 << 512) - 1)
+        self._hsh, self._n, self._sigma = hsh, n, sigma
+        self._buffer = data[size:]
+
+    def digest(self) -> bytes:
+        block = self._buffer + b"\x01" + b"\x00" * (63 - len(self._buffer))
+        hsh = _streebog_g(self._hsh, _to_words(self._n), struct.unpack("<8Q", block))
+        n = (self._n + 8 * len(self._buffer)) & ((1 << 512) - 1)
+        sigma = (self._sigma + int.from_bytes(block, "little")) & ((1 << 512) - 1)
+        hsh = _streebog_g(hsh, [0] * 8, _to_words(n))
+        hsh = _streebog_g(hsh, [0] * 8, _to_words(sigma))
+        return struct.pack("<8Q", *hsh)[-self.digest_size :]
+
+    def hexdigest(self) -> str:
+        return self.digest().hex()
+
+
+class GOST34112012256(GOST34112012):
+    def __init__(self, data=b""):
+        super().__init__(data, digest_size=32)
+
+
+class GOST34112012512(GOST34112012):
+    def __init__(self, data=b""):
+        super().__init__(data, digest_size=64)
+
+
+# ГОСТ Р 34.11-94
+
+GOST341194_BLOCK_SIZE = 32
+
+# Узлы замены id-GostR3411-94-CryptoProParamSet (RFC 4357), K1..K8
+GOST341194_SBOX = (
+    (10, 4, 5, 6, 8, 1, 3, 7, 13, 12, 14, 0, 9, 2, 11, 15),
+    (5, 15, 4, 0, 2, 13, 11, 9, 1, 7, 6, 3, 12, 14, 10, 8),
+    (7, 15, 12, 14, 9, 4, 1, 0, 3, 11, 5, 2, 6, 10, 8, 13),
+    (4, 10, 7, 12, 0, 15, 2, 8, 14, 1, 6, 5, 13, 11, 9, 3),
+    (7, 6, 4, 11, 9, 12, 2, 10, 1, 8, 0, 14, 15, 13, 3, 5),
+    (7, 6, 2, 4, 13, 9, 15, 0, 10, 1, 5, 11, 8, 14, 12, 3),
+    (13, 14, 4, 1, 7, 0, 5, 10, 3, 12, 8, 15, 6, 2, 9, 11),
+    (1, 3, 10, 9, 5, 11, 4, 15, 8, 6, 7, 14, 13, 0, 2, 12),
+)
+
+# Константа C3 в виде 32-битных слов, начиная с младшего
+GOST341194_C3 = (
+    0xFF00FF00,
+    0xFF00FF00,
+    0x00FF00FF,
+    0x00FF00FF,
+    0x00FFFF00,
+    0xFF0000FF,
+    0x000000FF,
+    0xFF00FFFF,
+)
+
+# Порядок подключей в 32 раундах ГОСТ 28147-89
+GOST28147_KEY_ORDER = (0, 1, 2, 3, 4, 5, 6, 7) * 3 + (7, 6, 5, 4, 3, 2, 1, 0)
+
+
+def _gost28147_tables(sbox) -> List[List[int]]:
+    """
+    Таблицы раундовой функции ГОСТ 28147-89: замена пары узлов по байту
+    вместе с циклическим сдвигом на 11 бит.
+    :param sbox:
+    :return:
+    """
+    tables = []
+    for n in range(4):
+        low, high = sbox[2 * n], sbox[2 * n + 1]
+        table = []
+        for byte in range(256):
+            value = ((high[byte >> 4] << 4) | low[byte & 0xF]) << (8 * n)
+            table.append(((value << 11) | (value >> 21)) & M32)
+        tables.append(table)
+    return tables
+
+
+GOST28147_TABLES = _gost28147_tables(GOST341194_SBOX)
+
+
+def _gost28147_encrypt(key, low: int, high: int):
+    t0, t1, t2, t3 = GOST28147_TABLES
+    for i in range(0, 32, 2):
+        value = (low + key[GOST28147_KEY_ORDER[i]]) & M32
+        high ^= (
+            t0[value & 0xFF]
+            ^ t1[(value >> 8) & 0xFF]
+            ^ t2[(value >> 16) & 0xFF]
+            ^ t3[value >> 24]
+        )
+        value = (high + key[GOST28147_KEY_ORDER[i + 1]]) & M32
+        low ^= (
+            t0[value & 0xFF]
+            ^ t1[(value >> 8) & 0xFF]
+            ^ t2[(value >> 16) & 0xFF]
+            ^ t3[value >> 24]
+        )
+    return high, low
+
+
+def _gost341194_p(w) -> List[int]:
+    key = []
+    for odd in (0, 1):
+        for shift in (0, 8, 16, 24):
+            key.append(
+                ((w[odd] >> shift) & 0xFF)
+                | (((w[odd + 2] >> shift) & 0xFF) << 8)
+                | (((w[odd + 4] >> shift) & 0xFF) << 16)
+                | (((w[odd + 6] >> shift) & 0xFF) << 24)
+            )
+    return key
+
+
+def _psi(value: int) -> int:
+    feedback = (
+        value
+        ^ (value >> 16)
+        ^ (value >> 32)
+        ^ (value >> 48)
+        ^ (value >> 192)
+        ^ (value >> 240)
+    ) & 0xFFFF
+    return (value >> 16) | (feedback << 240)
+
+
+@lru_cache(maxsize=4)
+def _psi_power_tables(power: int) -> List[List[int]]:
+    """
+    Таблицы линейного отображения psi^power по байтам 256-битного аргумента.
+    :param power:
+    :return:
+    """
+    images = []
+    for bit in range(256):
+        value = 1 << bit
+        for _ in range(power):
+            value = _psi(value)
+        images.append(value)
+    tables = []
+    for k in range(32):
+        table = [0] * 256
+        for byte in range(1, 256):
+            low_bit = (byte & -byte).bit_length() - 1
+            table[byte] = table[byte & (byte - 1)] ^ images[8 * k + low_bit]
+        tables.append(table)
+    return tables
+
+
+def _apply(tables, value: int) -> int:
+    res = 0
+    for k, table in enumerate(tables):
+        res ^= table[(value >> (8 * k)) & 0xFF]
+    return res
+
+
+def _gost341194_compress(hsh: int, msg: int) -> int:
+    """
+    Шаговая функция хэширования: H' = psi^61(H ^ psi(M ^ psi^12(S))),
+    где S - результат зашифрования H на ключах, выработанных из H и M.
+    Все перемешивания psi выполняются по таблицам.
+    :param hsh:
+    :param msg:
+    :return:
+    """
+    h = [(hsh >> (32 * i)) & M32 for i in range(8)]
+    u, v = list(h), [(msg >> (32 * i)) & M32 for i in range(8)]
+    s = []
+    for i in range(0, 8, 2):
+        key = _gost341194_p([a ^ b for a, b in zip(u, v)])
+        s.extend(_gost28147_encrypt(key, h[i], h[i + 1]))
+        if i == 6:
+            break
+        u = u[2:] + [u[0] ^ u[2], u[1] ^ u[3]]
+        if i == 2:
+            u = [a ^ b for a, b in zip(u, GOST341194_C3)]
+        v = v[4:] + [v[0] ^ v[2], v[1] ^ v[3], v[2] ^ v[4], v[3] ^ v[5]]
+    state = 0
+    for i, word in enumerate(s):
+        state |= word << (32 * i)
+    return (
+        _apply(_psi_power_tables(61), hsh)
+        ^ _apply(_psi_power_tables(62), msg)
+        ^ _apply(_psi_power_tables(74), state)
+    )
+
+
+class GOST341194:
+    """
+    Потоковый расчёт хэш-функции ГОСТ Р 34.11-94 с параметрами
+    id-GostR3411-94-CryptoProParamSet. Интерфейс совпадает с pygost.gost341194.
+    """
+
+    block_size = GOST341194_BLOCK_SIZE
+    digest_size = 32
+
+    def __init__(self, data=b""):
+        self._hsh = 0
+        self._sum = 0
+        self._length = 0
+        self._buffer = b""
+        self.update(data)
+
+    def copy(self) -> "GOST341194":
+        other = self.__class__.__new__(self.__class__)
+        other.__dict__.update(self.__dict__)
+        return other
+
+    def update(self, data):
+        data = self._buffer + bytes(data)
+        size = len(data) - len(data) % GOST341194_BLOCK_SIZE
+        hsh, checksum = self._hsh, self._sum
+        for offset in range(0, size, GOST341194_BLOCK_SIZE):
+            block = int.from_bytes(
+                data[offset : offset + GOST341194_BLOCK_SIZE], "little"
+            )
+            hsh = _gost341194_compress(hsh, block)
+            checksum = (checksum + block) & ((1 << 256) - 1)
+        self._hsh, self._sum = hsh, checksum
+        self._length += size * 8
+        self._buffer = data[size:]
+
+    def digest(self) -> bytes:
+        hsh, checksum, length = self._hsh, self._sum, self._length
+        if self._buffer:
+            block = int.from_bytes(self._buffer, "little")
+            hsh = _gost341194_compress(hsh, block)
+            checksum = (checksum + block) & ((1 << 256) - 1)
+            length += len(self._buffer) * 8
+        hsh = _gost341194_compress(hsh, length)
+        hsh = _gost341194_compress(hsh, checksum)
+        return hsh.to_bytes(32, "little")
+
+    def hexdigest(self) -> str:
+        return self.digest().hex()
+
+
+def new(algorithm: str, data=b""):
+    """
+    Создаёт объект расчёта хэш-функции по названию алгоритма
+    во вспомогательной БД: gost94, gost_256 или gost_512.
+    :param algorithm:
+    :param data:
+    :return:
+    """
+    return {
+        "gost94": GOST341194,
+        "gost_256": GOST34112012256,
+        "gost_512": GOST34112012512,
+    }[algorithm](data)
@@ -64,37 +64,36 @@ class MainWindow(QMainWindow):
         super(MainWindow, self).__init__()
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
+        # Отдельное соединение: удаления копятся в транзакции до подтверждения
         self.aux_connection = ilib.connect_to_auxiliary_db()
-        self.aux_connection.execute("PRAGMA foreign_keys = ON;")
         self.connection = None
+        self.repl = None  # Создаётся при первой проверке и используется повторно
         self.info_label_template = "Страница {} из {}. Всего записей: {}"
         number_of_files = ilib.select_count_aux(self.aux_connection, "files")
         self.table_config = (
             {
                 "table": "files",
-                "errors_table": "file_errors",
                 "widget": self.ui.tableFiles,
                 "total": number_of_files,
                 "total_pages": int((number_of_files - 1) / 10) + 1,
                 "current_page": 0,
                 "page_size": 10,
+                "after_id": None,
                 "info_widget": self.ui.filesInfo,
                 "name_field": "path",
-                "fk_field": "file_id",
                 "database_id": None,
                 "id_list": None,
             },
             {
                 "table": "tables",
-                "errors_table": "table_errors",
                 "widget": self.ui.tableTables,
                 "total": 0,
                 "total_pages": 0,
                 "current_page": 0,
                 "page_size": 10,
+                "after_id": None,
                 "info_widget": self.ui.tablesInfo,
                 "name_field": "table_name",
-                "fk_field": "table_id",
                 "database_id": None,
                 "id_list": None,
             },
@@ -125,7 +124,7 @@ class MainWindow(QMainWindow):
     def updateScriptResult(self, msg: str):
         self.ui.scriptResult.appendPlainText(msg)
 
-    def _set_table_data(self, index, only_incorrect=False):
+    def _set_table_data(self, index, only_incorrect=False, before_id=None):
         def readonly_item(content):
             item = QTableWidgetItem(content)
             item.setFlags(item.flags() ^ Qt.ItemIsEditable)
@@ -137,12 +136,14 @@ class MainWindow(QMainWindow):
                 self.aux_connection,
                 t["table"],
                 t["name_field"],
-                t["fk_field"],
-                t["errors_table"],
                 t["page_size"],
-                t["page_size"] * t["current_page"],
                 only_incorrect=only_incorrect,
+                # Страницы выбираются по id соседней записи, а не смещением
+                after_id=t["after_id"] if before_id is None else None,
+                before_id=before_id,
             )
+            if raw_data:
+                t["after_id"] = raw_data[0][-1] - 1
             t["widget"].setRowCount(len(raw_data))
             t["id_list"] = []
             for i, row in enumerate(raw_data):
@@ -182,12 +183,15 @@ class MainWindow(QMainWindow):
         enable_sender_afterwards = True
         index = self.ui.tabs.currentIndex()
         t = self.table_config[index]
+        if direction > 0 and t["id_list"]:
+            t["after_id"] = t["id_list"][-1]
+        before_id = t["id_list"][0] if direction < 0 and t["id_list"] else None
         t["current_page"] += direction
         if t["current_page"] == 0 or t["current_page"] == t["total_pages"] - 1:
             enable_sender_afterwards = False
         if t["total_pages"] > 1:
             counterpart.setEnabled(True)
-        self._set_table_data(index)
+        self._set_table_data(index, before_id=before_id)
         sender.setEnabled(enable_sender_afterwards)
 
     @pyqtSlot()
@@ -235,6 +239,8 @@ class MainWindow(QMainWindow):
             dialog = ConnectToDatabaseDialog(self.aux_connection)
             dialog.exec_()
             if dialog.connection:
+                if self.connection:
+                    self.connection.close()  # Соединение возвращается в пул
                 self.connection = dialog.connection
                 self.ui.headerTables.setText(
                     f"Текущая база данных: {self.connection.engine.url[5]}"
@@ -248,6 +254,7 @@ class MainWindow(QMainWindow):
                     ),
                 )
                 self.table_config[1]["current_page"] = 0
+                self.table_config[1]["after_id"] = None
                 self.table_config[1]["page_size"] = 10
                 number_of_tables = ilib.select_count_aux(self.aux_connection, "tables")
                 self.table_config[1]["total"] = number_of_tables
@@ -281,17 +288,7 @@ class MainWindow(QMainWindow):
                 dialog = AddFileDialog()
                 dialog.exec_()
             if self.ui.tabs.currentIndex() == 1:
-                con = self.connection.engine.url
-                dialog = AddTableDialog(
-                    (
-                        con.host,
-                        con.port,
-                        con.database,
-                        con.username,
-                        con.password,
-                        con.drivername.split("+")[0],
-                    )
-                )
+                dialog = AddTableDialog(self.connection)
                 dialog.exec_()
             if dialog.message:
                 msg_box = QMessageBox(self)
@@ -330,6 +327,7 @@ class MainWindow(QMainWindow):
         if value != table_conf["page_size"]:
             table_conf["page_size"] = value
             table_conf["current_page"] = 0
+            table_conf["after_id"] = None
             table_conf["total_pages"] = int((table_conf["total"] - 1) / value) + 1
             if index == 0:
                 self.ui.filesForwardButton.setEnabled(table_conf["total_pages"] > 1)
@@ -351,7 +349,11 @@ class MainWindow(QMainWindow):
     def _check_record(self, position):
         index = self.ui.tabs.currentIndex()
         t = self.table_config[index]
-        repl = irepl.REPL()
+        if self.repl is None:
+            self.repl = irepl.REPL()
+        repl = self.repl
+        repl.error = False
+        repl.last_check_no_error = None
         if index == 1:
             repl.connection = self.connection
         result = repl.check(
@@ -515,7 +517,7 @@ class AddFileDialog(QDialog):
 
 
 class AddTableDialog(QDialog):
-    def __init__(self, connection_params: tuple):
+    def __init__(self, connection):
         super(AddTableDialog, self).__init__()
         self.ui = Ui_AddTableDialog()
         self.ui.setupUi(self)
@@ -523,7 +525,8 @@ class AddTableDialog(QDialog):
         self.ui.algorithmInput.addItems(
             ilib.select_algorithms(self.repl.aux_connection)
         )
-        self.repl.db_connect(*connection_params)
+        # Используется уже установленное соединение главного окна
+        self.repl.connection = connection
         self.success = False
         self.message = None
 
@@ -1,18 +1,78 @@
+import atexit
 import hashlib
+import math
+import mmap
+import multiprocessing
 import os
 import sqlite3
+import stat
+import struct
+import sys
+import threading
+import uuid
 import zlib
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from functools import lru_cache, partial
+from itertools import chain, islice, repeat
+from operator import add
 from pathlib import Path
-from os.path import exists
-from typing import List, Tuple, Dict, Optional
+from queue import Full, Queue
+from os.path import exists, getsize
+from typing import Callable, List, Tuple, Dict, Optional, Iterable, Iterator, Union
 
-from crc64iso.crc64iso import format_crc64_pair, crc64_pair
 from pygost import gost341194, gost34112012256, gost34112012512
 from pygost.utils import hexenc
-from sqlalchemy import create_engine
-from sqlalchemy.engine import Connectable
-from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connectable, Engine
+from sqlalchemy.exc import (
+    CompileError,
+    OperationalError,
+    ProgrammingError,
+    SQLAlchemyError,
+)
+from sqlalchemy.pool import QueuePool
+
+import integrity_gost
+
+try:
+    import numpy as np
+except ImportError:  # Без NumPy CRC-64 рассчитывается медленнее
+    np = None
+
+CHUNK_SIZE = 1024 * 1024  # Размер блока при потоковом чтении файлов
+USE_MMAP = False  # Отображать файлы в память при расчёте контрольных сумм
+HASH_THREADS = 1  # Число потоков для расчёта CRC-32/Adler-32/CRC-64 по сегментам
+PARALLEL_MIN_SEGMENT = 16 * CHUNK_SIZE  # Минимальный размер сегмента файла
+COMBINABLE_ALGORITHMS = ("crc32", "adler32", "crc64")
+MERKLE_CHUNK_SIZE = CHUNK_SIZE  # Размер блока файла на один лист дерева Меркла
+GOST_ALGORITHMS = ("gost94", "gost_256", "gost_512")
+FINGERPRINT_FIELDS = ("st_dev", "st_ino", "file_size", "st_mtime_ns")
+GOST_BACKEND = "pygost"  # Реализация ГОСТ: "pygost" или "tables" (integrity_gost)
+GOST_PROCESSES = os.cpu_count() or 1  # Процессы для ГОСТ; 0 - в текущем процессе
+GOST_OFFLOAD_MIN_SIZE = 4 * CHUNK_SIZE  # Объекты меньше хэшируются в процессе
+GOST_QUEUE_SIZE = 8  # Число порций данных в очереди к процессу ГОСТ
+GOST_QUEUE_TIMEOUT = 0.1  # Интервал проверки процесса ГОСТ при полной очереди, с
+BATCH_SIZE = 500  # Число изменений во вспомогательной БД на одну транзакцию
+AUX_DB_PATH = "integrity_db.db"
+AUX_BUSY_TIMEOUT_MS = 30000  # Ожидание блокировки вспомогательной БД
+AUX_SYNCHRONOUS = "NORMAL"  # С журналом WAL не теряет согласованности при сбое
+AUX_CACHE_SIZE = -64 * 1024  # Кэш страниц в КиБ (отрицательное значение)
+AUX_MMAP_SIZE = 256 * 1024 * 1024  # Объём файла БД, отображаемого в память
+ROW_FORMAT_TEXT = 1  # Поля записей приводятся к строкам и конкатенируются
+ROW_FORMAT_BINARY = 2  # Поля записей кодируются с типом и длиной
+ROW_FORMATS = (ROW_FORMAT_TEXT, ROW_FORMAT_BINARY)
+ROW_FORMAT = ROW_FORMAT_BINARY  # Формат новых эталонов таблиц
+TABLE_BATCH_SIZE = 10000  # Число записей таблицы, получаемых с сервера за раз
+PARTITION_ROWS = 100000  # Число записей в диапазоне первичного ключа таблицы
+TABLE_WORKERS = 1  # Число соединений для параллельного расчёта по таблице
+TABLE_QUEUE_SIZE = 4  # Число порций записей в очереди от каждого соединения
+POOL_SIZE = 5  # Число постоянных соединений в пуле каждой защищаемой БД
+POOL_MAX_OVERFLOW = 10  # Число дополнительных соединений сверх POOL_SIZE
+POOL_PRE_PING = True  # Проверять соединение из пула перед использованием
+POOL_RECYCLE = 3600  # Пересоздавать соединения старше заданного числа секунд
+NETWORK_FS_TYPES = ("nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs", "9p")
 
 
 class IntegrityLibError(Exception):
@@ -57,353 +117,2223 @@ def get_connection_name(connection_string):
 # Общий функционал
 
 
-def calculate_checksum(obj: bytes, algorithm: str = "crc32") -> str:
+# CRC-64 (ISO 3309) и объединение циклических контрольных сумм
+
+
+CRC64_POLY = 0xD800000000000000  # x^64 + x^4 + x^3 + x + 1, отражённая запись
+CRC32_POLY = 0xEDB88320  # Полином zlib.crc32, отражённая запись
+ADLER32_BASE = 65521
+CRC64_MIN_LANE = 64  # Минимальная длина полосы при векторизованном расчёте
+CRC64_MAX_LANES = 16384
+CRC64_NP_MIN_SIZE = 8192  # Данные меньше считаются без NumPy
+
+
+def _crc64_make_tables() -> List[List[int]]:
     """
-    Рассчитывает контрольную сумму объекта и возвращает строку-hexdigest.
-    :param obj:
-    :param algorithm:
+    Таблицы для расчёта CRC-64 по 8 байтов за шаг (slicing-by-8):
+    tables[k][b] - остаток для байта b, за которым следуют k нулевых байтов.
     :return:
     """
-    if not isinstance(obj, bytes):
-        raise ParamTypeError(
-            "Расчёт контрольной суммы возможен только для последовательности байтов"
-        )
-    if algorithm in ("crc32", "adler32"):
-        return hex(getattr(zlib, algorithm)(obj))[2:]
-    if algorithm in hashlib.algorithms_guaranteed:
-        try:
-            return getattr(hashlib, algorithm)(obj).hexdigest()
-        except TypeError:
-            return getattr(hashlib, algorithm)(obj).hexdigest(256)
-    if algorithm == "crc64":
-        return format_crc64_pair(crc64_pair(obj)).lower()
-    if algorithm in ("gost94", "gost_256", "gost_512"):
-        return hexenc(
-            {
-                "gost94": gost341194,
-                "gost_256": gost34112012256,
-                "gost_512": gost34112012512,
-            }[algorithm]
-            .new(obj)
-            .digest()
-        )
-    raise ParamError("Указан неправильный алгоритм")
+    first = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ CRC64_POLY if crc & 1 else crc >> 1
+        first.append(crc)
+    tables = [first]
+    for _ in range(7):
+        prev = tables[-1]
+        tables.append([(crc >> 8) ^ first[crc & 0xFF] for crc in prev])
+    return tables
 
 
-def make_compressed_copy(
-    obj: bytes, obj_type: str, checksum: str, backup_dir: Optional[str]
-) -> bool:
+CRC64_TABLES = _crc64_make_tables()
+CRC64_NP_TABLES = np.array(CRC64_TABLES, dtype=np.uint64) if np is not None else None
+
+
+def _crc_operator_tables(images: List[int]) -> List[List[int]]:
     """
-    Сохраняет сжатую копию защищаемого объекта
-    :param obj:
-    :param obj_type:
-    :param checksum:
-    :param backup_dir:
+    Представляет линейное отображение значений CRC, заданное образами
+    единичных векторов, в виде таблиц по 256 значений для каждого байта аргумента.
+    :param images:
     :return:
     """
-    try:
-        compressed_data = zlib.compress(obj, 9)
-    except zlib.error:
-        return False
-    backup_path = backup_dir if backup_dir is not None else os.getcwd() + "/backups"
-    backup_path += "/" + obj_type + "s"
-    Path(backup_path).mkdir(parents=True, exist_ok=True)
-    with open(backup_path + "/" + checksum, "wb") as file:
-        file.write(compressed_data)
-    return True
-
-
-def restore_backup(obj_type: str, path_or_name: str, algorithm: str, checksum: str):
-    if obj_type == "table":
-        raise ParamError("Восстановление резервной копии таблицы не реализовано")
-    try:
-        with open(f"backups/{obj_type}s/{checksum}", "rb") as backup:
-            backup_data = zlib.decompress(backup.read())
-    except FileNotFoundError:
-        raise ParamError("Резервная копия не найдена")
-    backup_checksum = calculate_checksum(backup_data, algorithm)
-    if int(backup_checksum, base=16) != int(checksum, base=16):
-        raise ParamError("Резервная копия повреждена, восстановление невозможно")
-    with open(path_or_name, "wb") as file:
-        file.write(backup_data)
+    tables = []
+    for k in range(len(images) // 8):
+        table = [0] * 256
+        for byte in range(1, 256):
+            low_bit = (byte & -byte).bit_length() - 1
+            table[byte] = table[byte & (byte - 1)] ^ images[8 * k + low_bit]
+        tables.append(table)
+    return tables
 
 
-# Работа с вспомогательной БД
+def _crc_apply(tables: List[List[int]], value: int) -> int:
+    res = 0
+    for k, table in enumerate(tables):
+        res ^= table[(value >> (8 * k)) & 0xFF]
+    return res
 
 
-def connect_to_auxiliary_db() -> sqlite3.Connection:
+@lru_cache(maxsize=128)
+def _crc_shift_operator(poly: int, width: int, length: int) -> List[List[int]]:
     """
-    Обеспечивает соединение со вспомогательной базой данных.
-    Если её ещё нет, создаёт её.
-    :return: объект соединения
+    Таблицы отображения, дописывающего к данным length нулевых байтов,
+    для отражённого CRC с полиномом poly разрядности width:
+    crc(A + B) = shift(crc(A), len(B)) ^ crc(B).
+    :param poly:
+    :param width:
+    :param length: число байтов
+    :return:
     """
-    if not exists("integrity_db.db"):
-        with open("db_init.sql") as init_script, sqlite3.connect(
-            "integrity_db.db"
-        ) as init_con:
-            cur = init_con.cursor()
-            cur.executescript(init_script.read())
-    return sqlite3.connect("integrity_db.db")
 
+    def zero_byte(value):
+        for _ in range(8):
+            value = (value >> 1) ^ poly if value & 1 else value >> 1
+        return value
 
-def select_algorithms(connection: sqlite3.Connection) -> List[str]:
+    def compose(first, second):
+        return _crc_operator_tables(
+            [_crc_apply(first, _crc_apply(second, 1 << i)) for i in range(width)]
+        )
+
+    if length > 1 and not length & (length - 1):
+        # Степень двойки - из закэшированной половины за одну композицию
+        half = _crc_shift_operator(poly, width, length // 2)
+        return compose(half, half)
+    result = _crc_operator_tables([1 << i for i in range(width)])
+    base = _crc_operator_tables([zero_byte(1 << i) for i in range(width)])
+    while length:
+        if length & 1:
+            result = compose(base, result)
+        length >>= 1
+        if length:
+            base = compose(base, base)
+    return result
+
+
+@lru_cache(maxsize=64)
+def _crc64_np_shift_operator(length: int):
+    return np.array(_crc_shift_operator(CRC64_POLY, 64, length), dtype=np.uint64)
+
+
+def _crc64_update_scalar(crc: int, view: memoryview) -> int:
+    t0, t1, t2, t3, t4, t5, t6, t7 = CRC64_TABLES
+    size = len(view) - len(view) % 8
+    for (word,) in struct.iter_unpack("<Q", view[:size]):
+        crc ^= word
+        crc = (
+            t7[crc & 0xFF]
+            ^ t6[(crc >> 8) & 0xFF]
+            ^ t5[(crc >> 16) & 0xFF]
+            ^ t4[(crc >> 24) & 0xFF]
+            ^ t3[(crc >> 32) & 0xFF]
+            ^ t2[(crc >> 40) & 0xFF]
+            ^ t1[(crc >> 48) & 0xFF]
+            ^ t0[crc >> 56]
+        )
+    for byte in view[size:]:
+        crc = (crc >> 8) ^ t0[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def _crc64_update_lanes(crc: int, view: memoryview) -> Tuple[int, memoryview]:
     """
-    Запрос списка алгоритмов расчёта контрольных сумм.
-    :param connection:
+    Векторизованный расчёт: данные делятся на полосы равной длины, остатки
+    всех полос считаются одновременно средствами NumPy, затем попарно
+    объединяются. Число полос и их длина - степени двойки, поэтому таблицы
+    объединения строятся для небольшого набора длин и берутся из кэша;
+    не вошедшая в полосы часть обрабатывается следующим проходом.
+    Возвращает CRC и необработанный хвост данных.
+    :param crc:
+    :param view:
     :return:
     """
-    try:
-        query = connection.execute("SELECT name FROM algorithms ORDER BY id;")
-        return [row[0] for row in query.fetchall()]
-    except sqlite3.OperationalError:
-        raise ParamError("Не удалось выполнить запрос")
+    tables = CRC64_NP_TABLES
+    mask, shifts = np.uint64(0xFF), [np.uint64(8 * k) for k in range(8)]
+    while len(view) >= CRC64_NP_MIN_SIZE:
+        words_total = 1 << ((len(view) // 8).bit_length() - 1)
+        lanes = min(CRC64_MAX_LANES, words_total * 8 // CRC64_MIN_LANE)
+        lane_words = words_total // lanes
+        size = words_total * 8
+        words = np.frombuffer(view[:size], dtype="<u8").reshape(lanes, lane_words)
+        state = np.zeros(lanes, dtype=np.uint64)
+        state[0] = crc
+        for column in np.ascontiguousarray(words.T):
+            state ^= column
+            res = tables[7][state & mask]
+            for k in range(1, 8):
+                res ^= tables[7 - k][(state >> shifts[k]) & mask]
+            state = res
+        length = lane_words * 8
+        while len(state) > 1:
+            operator = _crc64_np_shift_operator(length)
+            head, tail = state[0::2], state[1::2]
+            res = operator[0][head & mask]
+            for k in range(1, 8):
+                res ^= operator[k][(head >> shifts[k]) & mask]
+            state = res ^ tail
+            length *= 2
+        crc, view = int(state[0]), view[size:]
+    return crc, view
 
 
-def insert_into_aux_table(
-    connection: sqlite3.Connection, table: str, fields: List[str], values: List[str]
-):
+def combine_crc64(crc1: int, crc2: int, length2: int) -> int:
     """
-    Добавление записи в таблицу вспомогательной базы данных.
-    :param connection:
-    :param table:
-    :param fields:
-    :param values:
+    CRC-64 объединения двух блоков данных по их CRC-64 и длине второго блока.
+    :param crc1:
+    :param crc2:
+    :param length2:
     :return:
     """
-    try:
-        if len(fields) != len(values):
-            raise ParamError("Число полей не совпадает с числом значений")
-    except TypeError:
-        raise ParamTypeError("Список полей и список значений должны иметь тип list")
-    try:
-        fields_str = ", ".join([f'"{field}"' for field in fields])
-        values_str = ", ".join([f"'{value}'" for value in values])
-        connection.execute(
-            f'INSERT INTO "{table}" ({fields_str}) VALUES ({values_str});'
-        )
-    except sqlite3.OperationalError:
-        raise DatabaseError("Не удалось добавить запись")
+    return _crc_apply(_crc_shift_operator(CRC64_POLY, 64, length2), crc1) ^ crc2
 
 
-def get_algorithm_id(connection: sqlite3.Connection, name: str) -> int:
+def combine_crc32(crc1: int, crc2: int, length2: int) -> int:
     """
-    Определяет id алгоритма во вспомогательной базе данных по его названию.
-    :param connection:
-    :param name:
+    Аналог zlib crc32_combine: CRC-32 объединения двух блоков данных
+    по их CRC-32 и длине второго блока.
+    :param crc1:
+    :param crc2:
+    :param length2:
     :return:
     """
-    try:
-        query = connection.execute("SELECT id FROM algorithms WHERE name = ?;", (name,))
-        res = query.fetchone()
-        if not res:
-            raise ParamError("Алгоритм не найден")
-        return res[0]
-    except sqlite3.OperationalError:
-        raise DatabaseError("Не удалось выполнить запрос")
+    return _crc_apply(_crc_shift_operator(CRC32_POLY, 32, length2), crc1) ^ crc2
 
 
-def get_database_id(connection: sqlite3.Connection, name: str) -> int:
+def combine_adler32(adler1: int, adler2: int, length2: int) -> int:
     """
-    Определяет id защищаемой БД во вспомогательной БД по названию её соединения.
-    :param connection:
-    :param name:
+    Аналог zlib adler32_combine: Adler-32 объединения двух блоков данных
+    по их Adler-32 и длине второго блока.
+    :param adler1:
+    :param adler2:
+    :param length2:
     :return:
     """
-    try:
-        query = connection.execute(
-            "SELECT id FROM databases WHERE connection = ?;", (name,)
-        )
-        res = query.fetchone()
-        if not res:
-            raise ParamError("База данных не найдена")
-        return res[0]
-    except sqlite3.OperationalError:
-        raise DatabaseError("Не удалось выполнить запрос")
+    remainder = length2 % ADLER32_BASE
+    sum1 = adler1 & 0xFFFF
+    sum2 = remainder * sum1 % ADLER32_BASE
+    sum1 = (sum1 + (adler2 & 0xFFFF) + ADLER32_BASE - 1) % ADLER32_BASE
+    sum2 = (
+        sum2 + (adler1 >> 16) + (adler2 >> 16) + ADLER32_BASE - remainder
+    ) % ADLER32_BASE
+    return sum1 | (sum2 << 16)
 
 
-def get_reference_checksum(
-    connection: sqlite3.Connection, table: str, table_fields: Tuple, query_params: Dict
-):
+def combine_checksums(
+    algorithm: str, checksum1: str, checksum2: str, length2: int
+) -> str:
     """
-    Запрос эталонной контрольной суммы заданного объекта.
-    :param connection:
-    :param table:
-    :param table_fields:
-    :param query_params:
+    Контрольная сумма объединения двух блоков данных по строкам-hexdigest
+    их контрольных сумм и длине второго блока (для COMBINABLE_ALGORITHMS).
+    :param algorithm:
+    :param checksum1:
+    :param checksum2:
+    :param length2:
     :return:
     """
-    try:
-        params_str = " AND ".join([f't."{field}" = ?' for field in query_params])
-        fields_str = ", ".join([f't."{field}"' for field in table_fields])
-        query = connection.execute(
-            f'SELECT {fields_str}, a.name FROM "{table}" t '
-            "INNER JOIN algorithms a ON a.id = t.algorithm_id "
-            f"WHERE {params_str};",
-            tuple(query_params.values()),
-        )
-        res = query.fetchone()
-        if not res:
-            raise ParamError("Запись не найдена")
-        return res
-    except sqlite3.OperationalError:
-        raise DatabaseError("Не удалось выполнить запрос")
+    crc1, crc2 = int(checksum1, 16), int(checksum2, 16)
+    if algorithm == "crc64":
+        return format(combine_crc64(crc1, crc2, length2), "016x")
+    if algorithm == "crc32":
+        return hex(combine_crc32(crc1, crc2, length2))[2:]
+    if algorithm == "adler32":
+        return hex(combine_adler32(crc1, crc2, length2))[2:]
+    raise ParamError("Алгоритм не поддерживает объединение контрольных сумм")
 
 
-def delete_from_aux_table(
-    connection: sqlite3.Connection, table: str, query_params: Dict
-):
+class Crc64:
     """
-    Удаление записи из таблицы вспомогательной БД
-    :param connection:
-    :param table:
-    :param query_params:
-    :return:
+    Потоковый расчёт CRC-64 по ISO 3309 (полином x^64 + x^4 + x^3 + x + 1,
+    начальное значение и итоговая маска нулевые).
+    Результат совпадает с crc64iso.format_crc64_pair в нижнем регистре.
     """
-    try:
-        params_str = " AND ".join([f'"{field}" = ?' for field in query_params])
-        connection.execute(
-            f'DELETE FROM "{table}" WHERE {params_str};', tuple(query_params.values())
-        )
-    except sqlite3.OperationalError as e:
-        raise DatabaseError("Не удалось выполнить запрос")
 
+    def __init__(self, data=b""):
+        self.crc = 0
+        self.update(data)
 
-def select_incorrect(
-    connection: sqlite3.Connection,
-    table: str,
-    field: str,
-    join_field: str,
-    limit: int = None,
-    offset: int = None,
-):
+    def update(self, data):
+        view = memoryview(data).cast("B")
+        if np is not None and len(view) >= CRC64_NP_MIN_SIZE:
+            self.crc, view = _crc64_update_lanes(self.crc, view)
+        self.crc = _crc64_update_scalar(self.crc, view)
+
+    def copy(self) -> "Crc64":
+        clone = Crc64()
+        clone.crc = self.crc
+        return clone
+
+    def digest(self) -> bytes:
+        return self.crc.to_bytes(8, "big")
+
+    def hexdigest(self) -> str:
+        return format(self.crc, "016x")
+
+
+class Hasher:
     """
-    Запрос списка объектов с нарушенной целостностью
-    из таблицы вспомогательной БД
-    :param connection:
-    :param table:
-    :param field:
-    :param join_field:
-    :param limit:
-    :param offset:
-    :return:
+    Инкрементальный расчёт контрольной суммы.
+    Данные передаются частями через update(), результат возвращает finalize()
+    в том же виде, что и calculate_checksum.
     """
-    try:
-        limit_str = f" LIMIT {limit}" if limit else ""
-        offset_str = f" OFFSET {offset}" if offset else ""
-        if table == "files":
-            join_table = "file_errors"
-        elif table == "tables":
-            join_table = "table_errors"
+
+    def __init__(self, algorithm: str = "crc32", gost_backend: Optional[str] = None):
+        self.algorithm = algorithm
+        if algorithm in ("crc32", "adler32"):
+            self._state = getattr(zlib, algorithm)(b"")
+        elif algorithm in hashlib.algorithms_guaranteed:
+            self._state = getattr(hashlib, algorithm)()
+        elif algorithm == "crc64":
+            self._state = Crc64()
+        elif algorithm in GOST_ALGORITHMS:
+            if (gost_backend or GOST_BACKEND) == "tables":
+                self._state = integrity_gost.new(algorithm)
+            else:
+                self._state = {
+                    "gost94": gost341194,
+                    "gost_256": gost34112012256,
+                    "gost_512": gost34112012512,
+                }[algorithm].new()
         else:
-            raise ParamError("Указана неправильная таблица")
-        query = connection.execute(
-            f'SELECT t."{field}", MAX(e.checked_at) FROM "{table}" t '
-            f'INNER JOIN {join_table} e on e."{join_field}" = t.id '
-            'WHERE NOT t."is_correct" '
-            f'ORDER BY t."id"{limit_str}{offset_str};',
+            raise ParamError("Указан неправильный алгоритм")
+
+    def update(self, data):
+        """
+        Добавляет очередную порцию данных.
+        :param data: bytes, bytearray или memoryview
+        :return:
+        """
+        if self.algorithm in ("crc32", "adler32"):
+            self._state = getattr(zlib, self.algorithm)(data, self._state)
+        elif self.algorithm in GOST_ALGORITHMS:
+            self._state.update(bytes(data))
+        else:
+            self._state.update(data)
+
+    def copy(self) -> "Hasher":
+        """
+        Копия объекта с текущим состоянием расчёта.
+        :return:
+        """
+        clone = Hasher.__new__(Hasher)
+        clone.algorithm = self.algorithm
+        clone._state = (
+            self._state if isinstance(self._state, int) else self._state.copy()
         )
-        res = query.fetchall()
-        if not res:
-            raise ParamError("Записи не найдены")
-        return res
-    except sqlite3.OperationalError:
-        raise DatabaseError("Не удалось выполнить запрос")
+        return clone
+
+    def combine(self, other: "Hasher", length: int):
+        """
+        Дописывает к уже переданным данным следующий блок длиной length,
+        обработанный другим объектом. Поддерживается только для CRC-32,
+        Adler-32 и CRC-64, см. COMBINABLE_ALGORITHMS.
+        :param other:
+        :param length:
+        :return:
+        """
+        if self.algorithm == "crc32":
+            self._state = combine_crc32(self._state, other._state, length)
+        elif self.algorithm == "adler32":
+            self._state = combine_adler32(self._state, other._state, length)
+        elif self.algorithm == "crc64":
+            self._state.crc = combine_crc64(self._state.crc, other._state.crc, length)
+        else:
+            raise ParamError("Алгоритм не поддерживает объединение контрольных сумм")
 
+    def finalize(self) -> str:
+        """
+        Возвращает строку-hexdigest для всех переданных данных.
+        :return:
+        """
+        if self.algorithm in ("crc32", "adler32"):
+            return hex(self._state)[2:]
+        if self.algorithm in GOST_ALGORITHMS:
+            return hexenc(self._state.digest())
+        try:
+            return self._state.hexdigest()
+        except TypeError:
+            return self._state.hexdigest(256)
 
-def mark_as_incorrect(connection: sqlite3.Connection, table: str, pk: int):
+
+def _hash_queue(algorithm: str, gost_backend: str, chunks) -> str:
+    hasher = Hasher(algorithm, gost_backend)
+    while True:
+        chunk = chunks.get()
+        if chunk is None:
+            return hasher.finalize()
+        hasher.update(chunk)
+
+
+@lru_cache(maxsize=1)
+def _gost_pool():
     """
-    Отметка объекта защиты как имеющего нарушение целостности
-    :param connection:
-    :param table:
-    :param pk:
+    Пул процессов для расчёта ГОСТ, менеджер очередей для передачи им данных
+    и семафор по числу процессов: хэш-объект получает процесс, только если
+    тот свободен, иначе расчёт ждал бы в очереди пула и блокировал чтение.
     :return:
     """
-    try:
-        connection.execute(f"UPDATE {table} SET is_correct = 0 WHERE id = {pk};")
-    except sqlite3.OperationalError:
-        raise DatabaseError("Не удалось выполнить запрос")
+    workers = max(GOST_PROCESSES, len(GOST_ALGORITHMS))
+    return (
+        ProcessPoolExecutor(max_workers=workers),
+        multiprocessing.Manager(),
+        threading.BoundedSemaphore(workers),
+    )
 
 
-def select_count_aux(connection: sqlite3.Connection, table: str) -> int:
+def shutdown_gost_pool():
     """
-    Запрос числа записей в таблице вспомогательной базы данных.
-    :param connection:
-    :param table:
+    Завершает процессы пула ГОСТ и менеджер очередей, если они были созданы.
+    Вызывается при завершении интерпретатора; после вызова пул создаётся
+    заново при следующем расчёте.
     :return:
     """
-    try:
-        query = connection.execute(f'SELECT COUNT(*) cnt FROM "{table}";')
-        return query.fetchone()[0]
-    except sqlite3.OperationalError:
-        raise ParamError("Не удалось выполнить запрос")
+    if not _gost_pool.cache_info().currsize:
+        return
+    executor, manager, _ = _gost_pool()
+    _gost_pool.cache_clear()
+    executor.shutdown()
+    manager.shutdown()
 
 
-def select_from_aux_db(
-    connection: sqlite3.Connection,
-    table: str,
-    name_field: str,
-    fk_field: str,
-    errors_table: str,
-    limit: int,
-    offset: int,
-    database_id: int = None,
-    only_incorrect: bool = False,
-):
-    try:
-        where_clause = f"WHERE t.database_id = {database_id} " if database_id else ""
-        if only_incorrect:
-            where_clause += "AND " if where_clause else "WHERE "
-            where_clause += "NOT is_correct "
-        query = connection.execute(
-            f"SELECT t.{name_field}, a.name, t.checksum, "
-            f't.calculated_at, MAX(e.checked_at), t.id FROM "{table}" t '
-            f'LEFT OUTER JOIN "{errors_table}" e ON e.{fk_field} = t.id '
-            f'INNER JOIN "algorithms" a ON a.id = t.algorithm_id {where_clause}'
-            f"GROUP BY t.id ORDER BY t.id LIMIT {limit} OFFSET {offset};"
+atexit.register(shutdown_gost_pool)
+
+
+class OffloadedHasher:
+    """
+    Расчёт контрольной суммы ГОСТ в отдельном процессе пула.
+    Порции данных передаются через очередь ограниченного размера, так что
+    чтение данных и расчёт других контрольных сумм идут параллельно с ним,
+    а расход памяти не растёт. Интерфейс совпадает с Hasher.
+    """
+
+    def __init__(self, algorithm: str):
+        executor, manager, self._slots = _gost_pool()
+        self.algorithm = algorithm
+        self._chunks = manager.Queue(GOST_QUEUE_SIZE)
+        self._future = executor.submit(
+            _hash_queue, algorithm, GOST_BACKEND, self._chunks
         )
-        return query.fetchall()
-    except sqlite3.OperationalError:
-        raise ParamError("Не удалось выполнить запрос")
+        self._finished = False
 
+    def update(self, data):
+        if not self._put(bytes(data)):
+            self._finish()
+            raise ParamError("Процесс расчёта контрольной суммы ГОСТ завершился")
 
-def select_watched_files(connection: sqlite3.Connection):
-    try:
-        query = connection.execute("SELECT path FROM files WHERE is_watched IS true;")
-        return [row[0] for row in query.fetchall()]
-    except sqlite3.OperationalError:
-        return []
+    def finalize(self) -> str:
+        self._finish()
+        return self._future.result()
 
+    def _put(self, item) -> bool:
+        # Очередь освобождается, только пока процесс расчёта работает:
+        # если он завершился, данные не передаются
+        while not self._future.done():
+            try:
+                self._chunks.put(item, timeout=GOST_QUEUE_TIMEOUT)
+                return True
+            except Full:
+                pass
+        return False
 
-def select_file_id(connection: sqlite3.Connection, path: str):
-    try:
-        query = connection.execute(f"SELECT id FROM files WHERE path = '{path}';")
-        return query.fetchone()[0]
-    except sqlite3.OperationalError:
-        raise ParamError("Файл не найден")
+    def _finish(self):
+        if not self._finished:
+            self._finished = True
+            self._slots.release()
+            self._put(None)
 
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
 
-# Работа с защищаемой БД
 
+def _make_single_hasher(
+    algorithm: str, size: Optional[int]
+) -> Union[Hasher, OffloadedHasher]:
+    if (
+        algorithm in GOST_ALGORITHMS
+        and GOST_PROCESSES > 0
+        and size is not None
+        and size >= GOST_OFFLOAD_MIN_SIZE
+        and _gost_pool()[2].acquire(blocking=False)
+    ):
+        try:
+            return OffloadedHasher(algorithm)
+        except Exception:
+            # Процесс пула не получен - место в нём освобождается
+            _gost_pool()[2].release()
+            raise
+    return Hasher(algorithm)
 
-def connect_to_db(
+
+class MultiHasher:
+    """
+    Расчёт контрольных сумм по нескольким алгоритмам за один проход:
+    каждая порция данных передаётся всем алгоритмам.
+    """
+
+    def __init__(self, algorithms: Iterable[str], size: Optional[int] = None):
+        self.hashers = {
+            algorithm: _make_single_hasher(algorithm, size) for algorithm in algorithms
+        }
+        if not self.hashers:
+            raise ParamError("Не указан ни один алгоритм")
+
+    def update(self, data):
+        for hasher in self.hashers.values():
+            hasher.update(data)
+
+    def combine(self, other: "MultiHasher", length: int):
+        for algorithm, hasher in self.hashers.items():
+            hasher.combine(other.hashers[algorithm], length)
+
+    def copy(self) -> "MultiHasher":
+        clone = MultiHasher.__new__(MultiHasher)
+        clone.hashers = {
+            algorithm: hasher.copy() for algorithm, hasher in self.hashers.items()
+        }
+        return clone
+
+    def finalize(self) -> Dict[str, str]:
+        """
+        Возвращает словарь {алгоритм: hexdigest}.
+        :return:
+        """
+        return {
+            algorithm: hasher.finalize() for algorithm, hasher in self.hashers.items()
+        }
+
+
+def make_hasher(
+    algorithm: Union[str, Iterable[str]], size: Optional[int] = None
+) -> Union[Hasher, OffloadedHasher, MultiHasher]:
+    """
+    Создаёт объект расчёта контрольной суммы для одного алгоритма
+    или для набора алгоритмов. Если известен размер данных и он не меньше
+    GOST_OFFLOAD_MIN_SIZE, суммы ГОСТ рассчитываются в пуле процессов.
+    :param algorithm: название алгоритма или последовательность названий
+    :param size: размер данных в байтах
+    :return:
+    """
+    if isinstance(algorithm, str):
+        return _make_single_hasher(algorithm, size)
+    return MultiHasher(algorithm, size)
+
+
+def calculate_checksum(
+    obj: bytes, algorithm: Union[str, Iterable[str]] = "crc32"
+) -> Union[str, Dict[str, str]]:
+    """
+    Рассчитывает контрольную сумму объекта и возвращает строку-hexdigest.
+    Если передана последовательность алгоритмов, все суммы рассчитываются
+    за один проход и возвращается словарь {алгоритм: hexdigest}.
+    :param obj:
+    :param algorithm:
+    :return:
+    """
+    if not isinstance(obj, bytes):
+        raise ParamTypeError(
+            "Расчёт контрольной суммы возможен только для последовательности байтов"
+        )
+    hasher = make_hasher(algorithm, len(obj))
+    hasher.update(obj)
+    return hasher.finalize()
+
+
+def _is_network_path(path: str) -> bool:
+    """
+    Определяет, расположен ли файл на сетевом ресурсе.
+    Отображение таких файлов в память ненадёжно: при обрыве соединения
+    обращение к странице завершает процесс.
+    :param path:
+    :return:
+    """
+    path = os.path.realpath(path)
+    if sys.platform == "win32":
+        if path.startswith("\\\\"):
+            return True
+        import ctypes
+
+        drive = os.path.splitdrive(path)[0] + "\\"
+        return ctypes.windll.kernel32.GetDriveTypeW(drive) == 4  # DRIVE_REMOTE
+    try:
+        with open("/proc/self/mounts") as mounts:
+            entries = [line.split()[1:3] for line in mounts]
+    except OSError:
+        return False
+    fs_type, mount_len = None, -1
+    for mount_point, mount_fs_type in entries:
+        mount_point = mount_point.replace("\\040", " ")
+        if (
+            path == mount_point
+            or path.startswith(mount_point.rstrip("/") + "/")
+        ) and len(mount_point) > mount_len:
+            fs_type, mount_len = mount_fs_type, len(mount_point)
+    return fs_type in NETWORK_FS_TYPES
+
+
+def _hash_buffered(file, hasher: Union[Hasher, MultiHasher], chunk_size: int):
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    while True:
+        size = file.readinto(buffer)
+        if not size:
+            break
+        hasher.update(view[:size])
+
+
+def _hash_mmap(file, hasher: Union[Hasher, MultiHasher], chunk_size: int) -> bool:
+    """
+    Передаёт алгоритму срезы отображённого в память файла без копирования.
+    Возвращает False, если файл нельзя отобразить в память
+    (пустой, специальный или сетевой файл) и нужно читать его обычным образом.
+    :param file:
+    :param hasher:
+    :param chunk_size:
+    :return:
+    """
+    info = os.fstat(file.fileno())
+    if (
+        not stat.S_ISREG(info.st_mode)
+        or info.st_size == 0
+        or _is_network_path(file.name)
+    ):
+        return False
+    try:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return False
+    with mapped:
+        if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        with memoryview(mapped) as view:
+            for offset in range(0, len(view), chunk_size):
+                with view[offset : offset + chunk_size] as part:
+                    hasher.update(part)
+    return True
+
+
+def _hash_range(
+    path: str, hasher, offset: int, length: int, chunk_size: int = CHUNK_SIZE
+) -> int:
+    buffer = bytearray(max(min(chunk_size, length), 1))
+    view = memoryview(buffer)
+    done = 0
+    with open(path, "rb") as file:
+        file.seek(offset)
+        while done < length:
+            size = file.readinto(view[: min(chunk_size, length - done)])
+            if not size:
+                break
+            hasher.update(view[:size])
+            done += size
+    return done
+
+
+def _hash_segment(
+    path: str,
+    algorithm: Union[str, Iterable[str]],
+    offset: int,
+    length: int,
+    chunk_size: int,
+) -> Tuple[Union[Hasher, MultiHasher], int]:
+    hasher = make_hasher(algorithm)
+    return hasher, _hash_range(path, hasher, offset, length, chunk_size)
+
+
+def _hash_parallel(
+    file, algorithm: Union[str, Iterable[str]], chunk_size: int, threads: int
+) -> Optional[Union[Hasher, MultiHasher]]:
+    """
+    Рассчитывает CRC-32/Adler-32/CRC-64 большого файла по сегментам
+    в пуле потоков (zlib освобождает GIL) и объединяет результаты.
+    Возвращает None, если алгоритм или файл для этого не подходят.
+    :param file:
+    :param algorithm:
+    :param chunk_size:
+    :param threads:
+    :return:
+    """
+    algorithms = [algorithm] if isinstance(algorithm, str) else list(algorithm)
+    if not all(name in COMBINABLE_ALGORITHMS for name in algorithms):
+        return None
+    info = os.fstat(file.fileno())
+    if not stat.S_ISREG(info.st_mode):
+        return None
+    segment_size = max(-(-info.st_size // threads), PARALLEL_MIN_SEGMENT)
+    if segment_size >= info.st_size:
+        return None
+    offsets = range(0, info.st_size, segment_size)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        segments = list(
+            executor.map(
+                lambda offset: _hash_segment(
+                    file.name, algorithm, offset, segment_size, chunk_size
+                ),
+                offsets,
+            )
+        )
+    hasher, _ = segments[0]
+    for other, length in segments[1:]:
+        hasher.combine(other, length)
+    return hasher
+
+
+def checksum_file(
+    path: str,
+    algorithm: Union[str, Iterable[str]] = "crc32",
+    chunk_size: int = CHUNK_SIZE,
+    use_mmap: Optional[bool] = None,
+    threads: Optional[int] = None,
+    offload: bool = True,
+) -> Union[str, Dict[str, str]]:
+    """
+    Рассчитывает контрольную сумму файла, читая его блоками фиксированного
+    размера, так что расход памяти не зависит от размера файла.
+    :param path:
+    :param algorithm: название алгоритма или последовательность названий,
+    см. calculate_checksum
+    :param chunk_size: размер блока чтения в байтах
+    :param use_mmap: отображать файл в память вместо чтения;
+    по умолчанию берётся значение USE_MMAP
+    :param threads: число потоков для расчёта CRC-32/Adler-32/CRC-64
+    по сегментам файла; по умолчанию берётся значение HASH_THREADS
+    :param offload: рассчитывать суммы ГОСТ больших файлов в пуле процессов
+    :return:
+    """
+    if chunk_size <= 0:
+        raise ParamError("Размер блока должен быть положительным")
+    if use_mmap is None:
+        use_mmap = USE_MMAP
+    if threads is None:
+        threads = HASH_THREADS
+    with open(path, "rb") as file:
+        hasher = None
+        if threads > 1:
+            hasher = _hash_parallel(file, algorithm, chunk_size, threads)
+        if hasher is None:
+            size = os.fstat(file.fileno()).st_size if offload else None
+            hasher = make_hasher(algorithm, size)
+            if not (use_mmap and _hash_mmap(file, hasher, chunk_size)):
+                _hash_buffered(file, hasher, chunk_size)
+    return hasher.finalize()
+
+
+def file_fingerprint(path: str) -> Tuple[int, int, int, int]:
+    """
+    Отпечаток метаданных файла: устройство, inode, размер
+    и время изменения в наносекундах (см. FINGERPRINT_FIELDS).
+    :param path:
+    :return:
+    """
+    info = os.stat(path)
+    return info.st_dev, info.st_ino, info.st_size, info.st_mtime_ns
+
+
+def checksum_file_fingerprinted(
+    path: str, algorithm: Union[str, Iterable[str]] = "crc32", **kwargs
+) -> Tuple[Union[str, Dict[str, str]], Optional[Tuple[int, int, int, int]]]:
+    """
+    Рассчитывает контрольную сумму файла (параметры как у checksum_file)
+    и возвращает её вместе с отпечатком метаданных. Если файл изменялся
+    во время расчёта, вместо отпечатка возвращается None.
+    :param path:
+    :param algorithm:
+    :return:
+    """
+    before = file_fingerprint(path)
+    digest = checksum_file(path, algorithm, **kwargs)
+    return digest, before if file_fingerprint(path) == before else None
+
+
+def _checksum_file_task(
+    task: Tuple[int, str, Union[str, Tuple[str, ...]]], chunk_size: int, use_mmap: bool
+) -> Tuple[int, Union[str, Dict[str, str], None], int, Optional[Tuple]]:
+    pk, path, algorithm = task
+    try:
+        digest, fingerprint = checksum_file_fingerprinted(
+            path, algorithm, chunk_size=chunk_size, use_mmap=use_mmap, offload=False
+        )
+        return pk, digest, getsize(path), fingerprint
+    except OSError:
+        return pk, None, 0, None
+
+
+def checksum_files_parallel(
+    tasks: Iterable[Tuple[int, str, Union[str, Tuple[str, ...]]]],
+    workers: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[Tuple[int, Union[str, Dict[str, str], None], int, Optional[Tuple]]]:
+    """
+    Рассчитывает контрольные суммы набора файлов в пуле процессов.
+    Для каждой задачи (id, путь, алгоритм или кортеж алгоритмов)
+    в исходном порядке возвращает (id, результат checksum_file, размер файла,
+    отпечаток метаданных, см. checksum_file_fingerprinted);
+    если файл прочитать не удалось, вместо результата возвращается None.
+    :param tasks:
+    :param workers: число процессов, по умолчанию - число ядер
+    :param chunk_size:
+    :return:
+    """
+    if workers is not None and workers <= 0:
+        raise ParamError("Число процессов должно быть положительным")
+    task = partial(_checksum_file_task, chunk_size=chunk_size, use_mmap=USE_MMAP)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(task, tasks, chunksize=16)
+
+
+# Дерево Меркла: файл делится на блоки по MERKLE_CHUNK_SIZE байт,
+# листья - контрольные суммы блоков, узел - контрольная сумма
+# конкатенации строк-hexdigest дочерних узлов.
+
+
+class MerkleHasher:
+    """
+    Инкрементальный расчёт листьев дерева Меркла: данные, переданные
+    через update(), делятся на блоки по chunk_size байт.
+    """
+
+    def __init__(self, algorithm: str, chunk_size: Optional[int] = None):
+        if chunk_size is None:
+            chunk_size = MERKLE_CHUNK_SIZE
+        if chunk_size <= 0:
+            raise ParamError("Размер блока должен быть положительным")
+        self.algorithm = algorithm
+        self.chunk_size = chunk_size
+        self.leaves = []
+        self._leaf = Hasher(algorithm)
+        self._filled = 0
+
+    def update(self, data):
+        view = memoryview(data).cast("B")
+        while view:
+            size = min(self.chunk_size - self._filled, len(view))
+            self._leaf.update(view[:size])
+            self._filled += size
+            view = view[size:]
+            if self._filled == self.chunk_size:
+                self.leaves.append(self._leaf.finalize())
+                self._leaf = Hasher(self.algorithm)
+                self._filled = 0
+
+    def copy(self) -> "MerkleHasher":
+        """
+        Копия объекта с текущим состоянием расчёта.
+        :return:
+        """
+        clone = MerkleHasher.__new__(MerkleHasher)
+        clone.algorithm = self.algorithm
+        clone.chunk_size = self.chunk_size
+        clone.leaves = list(self.leaves)
+        clone._leaf = self._leaf.copy()
+        clone._filled = self._filled
+        return clone
+
+    def finalize(self) -> List[str]:
+        """
+        Возвращает список листьев; неполный последний блок образует
+        отдельный лист.
+        :return:
+        """
+        if self._filled:
+            return [*self.leaves, self._leaf.finalize()]
+        return list(self.leaves)
+
+
+def merkle_leaves(
+    path: str,
+    algorithm: str,
+    chunk_size: Optional[int] = None,
+    first_leaf: int = 0,
+    size: Optional[int] = None,
+) -> List[str]:
+    """
+    Рассчитывает листья дерева Меркла файла, начиная с листа first_leaf.
+    :param path:
+    :param algorithm:
+    :param chunk_size: размер блока на один лист, по умолчанию MERKLE_CHUNK_SIZE
+    :param first_leaf: номер первого рассчитываемого листа
+    :param size: учитывать только первые size байт файла
+    :return:
+    """
+    if chunk_size is None:
+        chunk_size = MERKLE_CHUNK_SIZE
+    offset = first_leaf * chunk_size
+    if size is None:
+        size = getsize(path)
+    hasher = MerkleHasher(algorithm, chunk_size)
+    if size > offset:
+        _hash_range(path, hasher, offset, size - offset)
+    return hasher.finalize()
+
+
+def merkle_root(leaves: List[str], algorithm: str) -> str:
+    """
+    Корень дерева Меркла по его листьям. Узел без пары
+    переносится на следующий уровень без изменений.
+    :param leaves:
+    :param algorithm:
+    :return:
+    """
+    level = list(leaves)
+    if not level:
+        return calculate_checksum(b"", algorithm)
+    while len(level) > 1:
+        level = [
+            calculate_checksum("".join(level[i : i + 2]).encode(), algorithm)
+            if i + 1 < len(level)
+            else level[i]
+            for i in range(0, len(level), 2)
+        ]
+    return level[0]
+
+
+def merkle_changed_ranges(
+    old_leaves: List[str],
+    new_leaves: List[str],
+    chunk_size: int,
+    old_size: int,
+    new_size: int,
+) -> List[Tuple[int, int]]:
+    """
+    Диапазоны байтов [начало, конец), в которых файл изменился:
+    блоки с отличающимися листьями, соседние блоки объединяются.
+    :param old_leaves:
+    :param new_leaves:
+    :param chunk_size:
+    :param old_size:
+    :param new_size:
+    :return:
+    """
+    end = max(old_size, new_size)
+    ranges = []
+    for i in range(max(len(old_leaves), len(new_leaves))):
+        old = old_leaves[i] if i < len(old_leaves) else None
+        new = new_leaves[i] if i < len(new_leaves) else None
+        if old is not None and new is not None and int(old, 16) == int(new, 16):
+            continue
+        start = i * chunk_size
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], min(start + chunk_size, end))
+        else:
+            ranges.append((start, min(start + chunk_size, end)))
+    return ranges
+
+
+def checksum_file_range(
+    path: str, algorithm: Union[str, Iterable[str]], offset: int, length: int
+) -> Union[str, Dict[str, str]]:
+    """
+    Контрольная сумма length байт файла, начиная с offset.
+    :param path:
+    :param algorithm: название алгоритма или последовательность названий
+    :param offset:
+    :param length:
+    :return:
+    """
+    hasher = make_hasher(algorithm)
+    if _hash_range(path, hasher, offset, length) < length:
+        raise ParamError("Файл короче ожидаемого")
+    return hasher.finalize()
+
+
+class _TeeHasher:
+    """
+    Передаёт данные нескольким объектам расчёта за одно чтение.
+    """
+
+    def __init__(self, *hashers):
+        self.hashers = [hasher for hasher in hashers if hasher is not None]
+
+    def update(self, data):
+        for hasher in self.hashers:
+            hasher.update(data)
+
+
+def extend_checksums(
+    path: str,
+    checksums: Dict[str, str],
+    old_size: int,
+    new_size: int,
+    algorithm: str,
+    chunk_size: int,
+    verify: bool = False,
+) -> Tuple[int, Dict[str, str], Dict[str, str], List[str], List[str]]:
+    """
+    Контрольные суммы и листья дерева Меркла файла, дописанного в конец
+    с old_size до new_size байт, за один проход чтения.
+    Суммы по COMBINABLE_ALGORITHMS объединяются с суммами дописанной части
+    без чтения прежней части файла, остальные (и все при verify)
+    рассчитываются с начала файла. Листья рассчитываются с первого
+    прочитанного блока: блока, содержащего old_size, или с начала файла.
+    :param path:
+    :param checksums: прежние суммы {алгоритм: hexdigest}
+    :param old_size:
+    :param new_size:
+    :param algorithm: алгоритм дерева Меркла
+    :param chunk_size: размер блока дерева Меркла
+    :param verify: проверять прежнюю часть файла по всем суммам
+    :return: (номер первого рассчитанного листа, суммы прежней части файла
+        по прочитанным с начала алгоритмам, новые суммы, листья прежней
+        части файла и листья нового файла с первого рассчитанного)
+    """
+    combinable = (
+        [] if verify else [name for name in checksums if name in COMBINABLE_ALGORITHMS]
+    )
+    full = [name for name in checksums if name not in combinable]
+    first_leaf = 0 if full else old_size // chunk_size
+    start = first_leaf * chunk_size
+    full_hasher = MultiHasher(full) if full else None
+    tail_hasher = MultiHasher(combinable) if combinable else None
+    leaves = MerkleHasher(algorithm, chunk_size)
+    length = old_size - start
+    if _hash_range(path, _TeeHasher(full_hasher, leaves), start, length) < length:
+        raise ParamError("Файл короче ожидаемого")
+    prefix = full_hasher.copy().finalize() if full_hasher else {}
+    old_leaves = leaves.copy().finalize()
+    length = new_size - old_size
+    tee = _TeeHasher(full_hasher, leaves, tail_hasher)
+    if _hash_range(path, tee, old_size, length) < length:
+        raise ParamError("Файл короче ожидаемого")
+    digests = full_hasher.finalize() if full_hasher else {}
+    if tail_hasher:
+        tail = tail_hasher.finalize()
+        for name in combinable:
+            digests[name] = combine_checksums(name, checksums[name], tail[name], length)
+    return (
+        first_leaf,
+        prefix,
+        {name: digests[name] for name in checksums},
+        old_leaves,
+        leaves.finalize(),
+    )
+
+
+def make_compressed_copy(
+    obj: bytes, obj_type: str, checksum: str, backup_dir: Optional[str]
+) -> bool:
+    """
+    Сохраняет сжатую копию защищаемого объекта
+    :param obj:
+    :param obj_type:
+    :param checksum:
+    :param backup_dir:
+    :return:
+    """
+    try:
+        compressed_data = zlib.compress(obj, 9)
+    except zlib.error:
+        return False
+    backup_path = backup_dir if backup_dir is not None else os.getcwd() + "/backups"
+    backup_path += "/" + obj_type + "s"
+    Path(backup_path).mkdir(parents=True, exist_ok=True)
+    with open(backup_path + "/" + checksum, "wb") as file:
+        file.write(compressed_data)
+    return True
+
+
+def restore_backup(obj_type: str, path_or_name: str, algorithm: str, checksum: str):
+    if obj_type == "table":
+        raise ParamError("Восстановление резервной копии таблицы не реализовано")
+    try:
+        with open(f"backups/{obj_type}s/{checksum}", "rb") as backup:
+            backup_data = zlib.decompress(backup.read())
+    except FileNotFoundError:
+        raise ParamError("Резервная копия не найдена")
+    backup_checksum = calculate_checksum(backup_data, algorithm)
+    if int(backup_checksum, base=16) != int(checksum, base=16):
+        raise ParamError("Резервная копия повреждена, восстановление невозможно")
+    with open(path_or_name, "wb") as file:
+        file.write(backup_data)
+
+
+# Работа с вспомогательной БД
+
+
+# Изменения схемы поверх db_init.sql. Номер последнего применённого
+# изменения хранится в PRAGMA user_version; новые изменения добавляются
+# только в конец кортежа.
+MIGRATIONS = (
+    # 1. Дополнительные эталонные контрольные суммы объектов
+    """
+    CREATE TABLE file_checksums(
+        id            INTEGER PRIMARY KEY,
+        file_id       INTEGER,
+        algorithm_id  INTEGER,
+        checksum      TEXT,
+        calculated_at INTEGER,
+        FOREIGN KEY(file_id) REFERENCES files(id) ON DELETE CASCADE,
+        FOREIGN KEY(algorithm_id) REFERENCES algorithms(id) ON DELETE CASCADE
+    );
+    CREATE TABLE table_checksums(
+        id            INTEGER PRIMARY KEY,
+        table_id      INTEGER,
+        algorithm_id  INTEGER,
+        checksum      TEXT,
+        calculated_at INTEGER,
+        FOREIGN KEY(table_id) REFERENCES tables(id) ON DELETE CASCADE,
+        FOREIGN KEY(algorithm_id) REFERENCES algorithms(id) ON DELETE CASCADE
+    );
+    """,
+    # 2. Отпечаток метаданных файлов для быстрой проверки
+    """
+    ALTER TABLE files ADD COLUMN st_dev INTEGER;
+    ALTER TABLE files ADD COLUMN st_ino INTEGER;
+    ALTER TABLE files ADD COLUMN st_mtime_ns INTEGER;
+    """,
+    # 3. Деревья Меркла файлов (листья через перевод строки)
+    """
+    CREATE TABLE file_merkle_trees(
+        file_id       INTEGER PRIMARY KEY,
+        chunk_size    INTEGER,
+        leaves        TEXT,
+        root          TEXT,
+        calculated_at INTEGER,
+        FOREIGN KEY(file_id) REFERENCES files(id) ON DELETE CASCADE
+    );
+    """,
+    # 4. Способ расчёта контрольной суммы таблицы: client или server
+    """
+    ALTER TABLE tables ADD COLUMN digest_mode TEXT DEFAULT 'client';
+    """,
+    # 5. Контрольные суммы диапазонов первичного ключа таблиц
+    """
+    CREATE TABLE table_partitions(
+        id            INTEGER PRIMARY KEY,
+        table_id      INTEGER,
+        lower_bound,
+        checksum      TEXT,
+        row_count     INTEGER,
+        calculated_at INTEGER,
+        FOREIGN KEY(table_id) REFERENCES tables(id) ON DELETE CASCADE
+    );
+    ALTER TABLE tables ADD COLUMN partition_root TEXT;
+    """,
+    # 6. Признак изменения таблицы по данным СУБД
+    """
+    ALTER TABLE tables ADD COLUMN change_marker TEXT;
+    """,
+    # 7. Формат кодирования записей таблицы; существующие эталоны
+    # рассчитаны в текстовом формате и переводятся в новый при обновлении
+    """
+    ALTER TABLE tables ADD COLUMN row_format INTEGER DEFAULT 1;
+    """,
+    # 8. Защищаемые поля и условие отбора записей таблицы
+    """
+    ALTER TABLE tables ADD COLUMN column_list TEXT;
+    ALTER TABLE tables ADD COLUMN row_filter TEXT;
+    """,
+    # 9. Индексы для поиска объектов по пути и названию и для соединений
+    # с журналами ошибок. Перед созданием уникальных индексов удаляются
+    # повторные записи: остаётся первая, которую и находили запросы
+    # без индекса (внешние ключи при обновлении схемы не включены)
+    """
+    UPDATE tables SET database_id = (
+        SELECT MIN(d.id) FROM databases d WHERE d.connection = (
+            SELECT connection FROM databases WHERE id = tables.database_id
+        )
+    );
+    DELETE FROM databases
+    WHERE id NOT IN (SELECT MIN(id) FROM databases GROUP BY connection);
+
+    CREATE TEMP TABLE duplicate_files AS
+    SELECT id FROM files
+    WHERE id NOT IN (SELECT MIN(id) FROM files GROUP BY path);
+    DELETE FROM file_errors WHERE file_id IN duplicate_files;
+    DELETE FROM file_checksums WHERE file_id IN duplicate_files;
+    DELETE FROM file_merkle_trees WHERE file_id IN duplicate_files;
+    DELETE FROM files WHERE id IN duplicate_files;
+    DROP TABLE duplicate_files;
+
+    CREATE TEMP TABLE duplicate_tables AS
+    SELECT id FROM tables
+    WHERE id NOT IN (SELECT MIN(id) FROM tables GROUP BY database_id, table_name);
+    DELETE FROM table_errors WHERE table_id IN duplicate_tables;
+    DELETE FROM table_checksums WHERE table_id IN duplicate_tables;
+    DELETE FROM table_partitions WHERE table_id IN duplicate_tables;
+    DELETE FROM tables WHERE id IN duplicate_tables;
+    DROP TABLE duplicate_tables;
+
+    CREATE UNIQUE INDEX databases_connection ON databases(connection);
+    CREATE UNIQUE INDEX files_path ON files(path);
+    CREATE UNIQUE INDEX tables_database_table ON tables(database_id, table_name);
+    CREATE INDEX files_watched ON files(path) WHERE is_watched IS true;
+    CREATE INDEX file_errors_file ON file_errors(file_id, checked_at);
+    CREATE INDEX table_errors_table ON table_errors(table_id, checked_at);
+    CREATE INDEX file_checksums_file ON file_checksums(file_id, algorithm_id);
+    CREATE INDEX table_checksums_table ON table_checksums(table_id, algorithm_id);
+    CREATE INDEX table_partitions_table ON table_partitions(table_id);
+    """,
+    # 10. Значения полей записей раньше подставлялись в запрос строками,
+    # и отсутствующий первичный ключ таблицы сохранялся как "None"
+    """
+    UPDATE tables SET pk_field = NULL WHERE pk_field = 'None';
+    """,
+    # 11. Время последней ошибки и число ошибок объекта хранятся в его записи
+    # и поддерживаются триггерами журналов ошибок, чтобы списки объектов
+    # не соединялись с журналами. Частичные индексы - для списков нарушений
+    """
+    ALTER TABLE files ADD COLUMN last_error_at INTEGER;
+    ALTER TABLE files ADD COLUMN error_count INTEGER NOT NULL DEFAULT 0;
+    UPDATE files SET
+        last_error_at = (
+            SELECT MAX(checked_at) FROM file_errors WHERE file_id = files.id
+        ),
+        error_count = (SELECT COUNT(*) FROM file_errors WHERE file_id = files.id);
+    CREATE TRIGGER file_errors_insert AFTER INSERT ON file_errors BEGIN
+        UPDATE files SET
+            last_error_at = MAX(IFNULL(last_error_at, 0), NEW.checked_at),
+            error_count = error_count + 1
+        WHERE id = NEW.file_id;
+    END;
+    CREATE TRIGGER file_errors_delete AFTER DELETE ON file_errors BEGIN
+        UPDATE files SET
+            last_error_at = (
+                SELECT MAX(checked_at) FROM file_errors WHERE file_id = files.id
+            ),
+            error_count = (SELECT COUNT(*) FROM file_errors WHERE file_id = files.id)
+        WHERE id = OLD.file_id;
+    END;
+    CREATE TRIGGER file_errors_update AFTER UPDATE ON file_errors BEGIN
+        UPDATE files SET
+            last_error_at = (
+                SELECT MAX(checked_at) FROM file_errors WHERE file_id = files.id
+            ),
+            error_count = (SELECT COUNT(*) FROM file_errors WHERE file_id = files.id)
+        WHERE id IN (OLD.file_id, NEW.file_id);
+    END;
+    CREATE INDEX files_incorrect ON files(id) WHERE NOT is_correct;
+
+    ALTER TABLE tables ADD COLUMN last_error_at INTEGER;
+    ALTER TABLE tables ADD COLUMN error_count INTEGER NOT NULL DEFAULT 0;
+    UPDATE tables SET
+        last_error_at = (
+            SELECT MAX(checked_at) FROM table_errors WHERE table_id = tables.id
+        ),
+        error_count = (SELECT COUNT(*) FROM table_errors WHERE table_id = tables.id);
+    CREATE TRIGGER table_errors_insert AFTER INSERT ON table_errors BEGIN
+        UPDATE tables SET
+            last_error_at = MAX(IFNULL(last_error_at, 0), NEW.checked_at),
+            error_count = error_count + 1
+        WHERE id = NEW.table_id;
+    END;
+    CREATE TRIGGER table_errors_delete AFTER DELETE ON table_errors BEGIN
+        UPDATE tables SET
+            last_error_at = (
+                SELECT MAX(checked_at) FROM table_errors WHERE table_id = tables.id
+            ),
+            error_count = (SELECT COUNT(*) FROM table_errors WHERE table_id = tables.id)
+        WHERE id = OLD.table_id;
+    END;
+    CREATE TRIGGER table_errors_update AFTER UPDATE ON table_errors BEGIN
+        UPDATE tables SET
+            last_error_at = (
+                SELECT MAX(checked_at) FROM table_errors WHERE table_id = tables.id
+            ),
+            error_count = (SELECT COUNT(*) FROM table_errors WHERE table_id = tables.id)
+        WHERE id IN (OLD.table_id, NEW.table_id);
+    END;
+    CREATE INDEX tables_incorrect ON tables(id) WHERE NOT is_correct;
+    """,
+    # 12. Эталоны, рассчитанные на стороне СУБД одной строкой, до разбиения
+    # на порции (см. checksum_table_server)
+    """
+    UPDATE tables SET digest_mode = 'server_concat' WHERE digest_mode = 'server';
+    """,
+    # 13. Контрольные суммы диапазонов первичного ключа таблиц
+    # по дополнительным алгоритмам
+    """
+    CREATE TABLE table_partition_checksums(
+        id           INTEGER PRIMARY KEY,
+        partition_id INTEGER,
+        algorithm_id INTEGER,
+        checksum     TEXT,
+        FOREIGN KEY(partition_id) REFERENCES table_partitions(id) ON DELETE CASCADE,
+        FOREIGN KEY(algorithm_id) REFERENCES algorithms(id) ON DELETE CASCADE
+    );
+    CREATE INDEX table_partition_checksums_partition
+        ON table_partition_checksums(partition_id);
+    ALTER TABLE table_checksums ADD COLUMN partition_root TEXT;
+    """,
+)
+
+EXTRA_CHECKSUMS = {
+    "files": ("file_checksums", "file_id"),
+    "tables": ("table_checksums", "table_id"),
+}
+ERRORS_TABLES = {
+    "files": ("file_errors", "file_id"),
+    "tables": ("table_errors", "table_id"),
+}
+
+
+def migrate_auxiliary_db(connection: sqlite3.Connection):
+    """
+    Применяет к вспомогательной БД недостающие изменения схемы из MIGRATIONS.
+    Каждое изменение выполняется в отдельной транзакции вместе
+    с обновлением номера версии.
+    :param connection:
+    :return:
+    """
+    try:
+        version = connection.execute("PRAGMA user_version;").fetchone()[0]
+        for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+            connection.executescript(
+                f"BEGIN;\n{script}\nPRAGMA user_version = {number};\nCOMMIT;"
+            )
+    except (sqlite3.OperationalError, sqlite3.IntegrityError):
+        connection.rollback()
+        raise DatabaseError("Не удалось обновить схему вспомогательной базы данных")
+
+
+def configure_auxiliary_db(connection: sqlite3.Connection):
+    """
+    Настройка соединения со вспомогательной БД: журнал WAL, при котором
+    чтение не блокируется записью из другого процесса (GUI, REPL, наблюдатель),
+    ожидание освобождения блокировки вместо ошибки "database is locked",
+    размер кэша страниц, отображение файла БД в память и внешние ключи.
+    :param connection:
+    :return:
+    """
+    try:
+        connection.execute("PRAGMA journal_mode = WAL;")
+        connection.execute(f"PRAGMA busy_timeout = {AUX_BUSY_TIMEOUT_MS};")
+        connection.execute(f"PRAGMA synchronous = {AUX_SYNCHRONOUS};")
+        connection.execute(f"PRAGMA cache_size = {AUX_CACHE_SIZE};")
+        connection.execute(f"PRAGMA mmap_size = {AUX_MMAP_SIZE};")
+        connection.execute("PRAGMA foreign_keys = ON;")
+    except sqlite3.OperationalError:
+        raise DatabaseError("Не удалось настроить соединение со вспомогательной БД")
+
+
+def connect_to_auxiliary_db() -> sqlite3.Connection:
+    """
+    Обеспечивает соединение со вспомогательной базой данных.
+    Если её ещё нет, создаёт её; схему существующей БД обновляет
+    до текущей версии. Каждый вызов открывает новое соединение,
+    для повторного использования соединения см. get_auxiliary_db.
+    :return: объект соединения
+    """
+    if not exists(AUX_DB_PATH):
+        with open("db_init.sql") as init_script, sqlite3.connect(
+            AUX_DB_PATH
+        ) as init_con:
+            cur = init_con.cursor()
+            cur.executescript(init_script.read())
+    connection = sqlite3.connect(AUX_DB_PATH)
+    configure_auxiliary_db(connection)
+    migrate_auxiliary_db(connection)
+    return connection
+
+
+_aux_connections = threading.local()
+
+
+def get_auxiliary_db() -> sqlite3.Connection:
+    """
+    Соединение со вспомогательной БД, общее для всех вызовов в текущем потоке:
+    открывается при первом обращении и далее используется повторно
+    (объект соединения SQLite нельзя использовать из других потоков).
+    :return:
+    """
+    connection = getattr(_aux_connections, "connection", None)
+    if connection is None:
+        connection = connect_to_auxiliary_db()
+        _aux_connections.connection = connection
+    return connection
+
+
+def close_auxiliary_db():
+    """
+    Закрытие общего соединения со вспомогательной БД текущего потока.
+    :return:
+    """
+    connection = getattr(_aux_connections, "connection", None)
+    if connection is not None:
+        _aux_connections.connection = None
+        connection.close()
+
+
+def select_algorithms(connection: sqlite3.Connection) -> List[str]:
+    """
+    Запрос списка алгоритмов расчёта контрольных сумм.
+    :param connection:
+    :return:
+    """
+    try:
+        query = connection.execute("SELECT name FROM algorithms ORDER BY id;")
+        return [row[0] for row in query.fetchall()]
+    except sqlite3.OperationalError:
+        raise ParamError("Не удалось выполнить запрос")
+
+
+def _chunks(items: Iterable, size: Optional[int]) -> Iterator[List]:
+    """
+    Разбиение последовательности на списки заданной длины.
+    :param items:
+    :param size: длина списков; если не задана, возвращается один список
+    :return:
+    """
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size or None))
+        if not chunk:
+            return
+        yield chunk
+        if not size:
+            return
+
+
+def _execute_batched(
+    connection: sqlite3.Connection,
+    sql: str,
+    rows: Iterable[Tuple],
+    batch_size: Optional[int] = None,
+) -> int:
+    """
+    Выполнение запроса вспомогательной БД для каждого набора параметров.
+    Если задан размер порции, наборы передаются порциями, каждая из которых
+    фиксируется отдельной транзакцией; иначе фиксацию выполняет вызывающий.
+    :param connection:
+    :param sql: запрос с параметрами "?"
+    :param rows: наборы параметров
+    :param batch_size: число наборов в транзакции
+    :return: число переданных наборов
+    """
+    total = 0
+    try:
+        for batch in _chunks(rows, batch_size):
+            connection.executemany(sql, batch)
+            total += len(batch)
+            if batch_size:
+                connection.commit()
+    except sqlite3.IntegrityError:
+        raise ParamError("Запись уже существует")
+    except sqlite3.ProgrammingError:
+        raise ParamError("Число полей не совпадает с числом значений")
+    except sqlite3.OperationalError:
+        raise DatabaseError("Не удалось выполнить запрос")
+    return total
+
+
+def insert_into_aux_table(
+    connection: sqlite3.Connection, table: str, fields: List[str], values: List
+):
+    """
+    Добавление записи в таблицу вспомогательной базы данных.
+    :param connection:
+    :param table:
+    :param fields:
+    :param values:
+    :return: id добавленной записи
+    """
+    try:
+        if len(fields) != len(values):
+            raise ParamError("Число полей не совпадает с числом значений")
+    except TypeError:
+        raise ParamTypeError("Список полей и список значений должны иметь тип list")
+    try:
+        fields_str = ", ".join([f'"{field}"' for field in fields])
+        values_str = ", ".join(["?"] * len(fields))
+        cursor = connection.execute(
+            f'INSERT INTO "{table}" ({fields_str}) VALUES ({values_str});',
+            tuple(values),
+        )
+        return cursor.lastrowid
+    except sqlite3.IntegrityError:
+        raise ParamError("Запись уже существует")
+    except sqlite3.OperationalError:
+        raise DatabaseError("Не удалось добавить запись")
+
+
+def insert_many_into_aux_table(
+    connection: sqlite3.Connection,
+    table: str,
+    fields: List[str],
+    rows: Iterable[Tuple],
+    batch_size: Optional[int] = None,
+) -> int:
+    """
+    Добавление записей в таблицу вспомогательной базы данных.
+    :param connection:
+    :param table:
+    :param fields:
+    :param rows: значения полей записей
+    :param batch_size: число записей в транзакции, см. _execute_batched
+    :return: число добавленных записей
+    """
+    fields_str = ", ".join([f'"{field}"' for field in fields])
+    values_str = ", ".join(["?"] * len(fields))
+    return _execute_batched(
+        connection,
+        f'INSERT INTO "{table}" ({fields_str}) VALUES ({values_str});',
+        rows,
+        batch_size,
+    )
+
+
+def upsert_into_aux_table(
+    connection: sqlite3.Connection,
+    table: str,
+    fields: List[str],
+    rows: Iterable[Tuple],
+    key_fields: List[str],
+    batch_size: Optional[int] = None,
+) -> int:
+    """
+    Добавление записей в таблицу вспомогательной базы данных с заменой
+    остальных полей у уже существующих. Для ключевых полей должен быть
+    создан уникальный индекс.
+    :param connection:
+    :param table:
+    :param fields:
+    :param rows: значения полей записей
+    :param key_fields: поля, по которым определяется существующая запись
+    :param batch_size: число записей в транзакции, см. _execute_batched
+    :return: число обработанных записей
+    """
+    fields_str = ", ".join([f'"{field}"' for field in fields])
+    values_str = ", ".join(["?"] * len(fields))
+    keys_str = ", ".join([f'"{field}"' for field in key_fields])
+    update_str = ", ".join(
+        [
+            f'"{field}" = excluded."{field}"'
+            for field in fields
+            if field not in key_fields
+        ]
+    )
+    action = f"DO UPDATE SET {update_str}" if update_str else "DO NOTHING"
+    return _execute_batched(
+        connection,
+        f'INSERT INTO "{table}" ({fields_str}) VALUES ({values_str}) '
+        f"ON CONFLICT ({keys_str}) {action};",
+        rows,
+        batch_size,
+    )
+
+
+def get_algorithm_id(connection: sqlite3.Connection, name: str) -> int:
+    """
+    Определяет id алгоритма во вспомогательной базе данных по его названию.
+    :param connection:
+    :param name:
+    :return:
+    """
+    try:
+        query = connection.execute("SELECT id FROM algorithms WHERE name = ?;", (name,))
+        res = query.fetchone()
+        if not res:
+            raise ParamError("Алгоритм не найден")
+        return res[0]
+    except sqlite3.OperationalError:
+        raise DatabaseError("Не удалось выполнить запрос")
+
+
+def get_database_id(connection: sqlite3.Connection, name: str) -> int:
+    """
+    Определяет id защищаемой БД во вспомогательной БД по названию её соединения.
+    :param connection:
+    :param name:
+    :return:
+    """
+    try:
+        query = connection.execute(
+            "SELECT id FROM databases WHERE connection = ?;", (name,)
+        )
+        res = query.fetchone()
+        if not res:
+            raise ParamError("База данных не найдена")
+        return res[0]
+    except sqlite3.OperationalError:
+        raise DatabaseError("Не удалось выполнить запрос")
+
+
+def get_reference_checksum(
+    connection: sqlite3.Connection, table: str, table_fields: Tuple, query_params: Dict
+):
+    """
+    Запрос эталонной контрольной суммы заданного объекта.
+    :param connection:
+    :param table:
+    :param table_fields:
+    :param query_params:
+    :return:
+    """
+    try:
+        params_str = " AND ".join([f't."{field}" = ?' for field in query_params])
+        fields_str = ", ".join([f't."{field}"' for field in table_fields])
+        query = connection.execute(
+            f'SELECT {fields_str}, a.name FROM "{table}" t '
+            "INNER JOIN algorithms a ON a.id = t.algorithm_id "
+            f"WHERE {params_str};",
+            tuple(query_params.values()),
+        )
+        res = query.fetchone()
+        if not res:
+            raise ParamError("Запись не найдена")
+        return res
+    except sqlite3.OperationalError:
+        raise DatabaseError("Не удалось выполнить запрос")
+
+
+def get_extra_checksums(
+    connection: sqlite3.Connection, table: str, pk: Optional[int] = None
+) -> Dict[int, Dict[str, str]]:
+    """
+    Запрос дополнительных эталонных контрольных сумм объектов.
+    :param connection:
+    :param table: files или tables
+    :param pk: id объекта; если не указан, возвращаются суммы всех объектов
+    :return: словарь {id объекта: {алгоритм: контрольная сумма}}
+    """
+    try:
+        checksums_table, fk_field = EXTRA_CHECKSUMS[table]
+    except KeyError:
+        raise ParamError("Указана неправильная таблица")
+    try:
+        where_str = f'WHERE c."{fk_field}" = ? ' if pk is not None else ""
+        query = connection.execute(
+            f'SELECT c."{fk_field}", a.name, c.checksum FROM "{checksums_table}" c '
+            f"INNER JOIN algorithms a ON a.id = c.algorithm_id {where_str}"
+            "ORDER BY c.id;",
+            (pk,) if pk is not None else (),
+        )
+        res = {}
+        for object_id, algorithm, checksum in query.fetchall():
+            res.setdefault(object_id, {})[algorithm] = checksum
+        return res
+    except sqlite3.OperationalError:
+        raise DatabaseError("Не удалось выполнить запрос")
+
+
+def update_reference_checksums(
+    connection: sqlite3.Connection,
+    table: str,
+    pk: int,
+    algorithm: str,
+    digests: Dict[str, str],
+    fields: Optional[Dict] = None,
+):
+    """
+    Замена эталонных контрольных сумм объекта (основной и дополнительных)
+    новыми значениями; объект отмечается как не имеющий нарушений.
+    :param connection:
+    :param table: files или tables
+    :param pk: id объекта
+    :param algorithm: основной алгоритм объекта
+    :param digests: словарь {алгоритм: контрольная сумма}
+    :param fields: другие обновляемые поля записи объекта
+    :return:
+    """
+    try:
+        checksums_table, fk_field = EXTRA_CHECKSUMS[table]
+    except KeyError:
+        raise ParamError("Указана неправильная таблица")
+    calculated_at = get_current_timestamp()
+    values = {
+        "checksum": digests[algorithm],
+        "is_correct": 1,
+        "calculated_at": calculated_at,
+        **(fields or {}),
+    }
+    try:
+        values_str = ", ".join([f'"{field}" = ?' for field in values])
+        connection.execute(
+            f'UPDATE "{table}" SET {values_str} WHERE id = ?;',
+            (*values.values(), pk),
+        )
+        connection.executemany(
+            f'UPDATE "{checksums_table}" SET checksum = ?, calculated_at = ? '
+            f'WHERE "{fk_field}" = ? '
+            "AND algorithm_id = (SELECT id FROM algorithms WHERE name = ?);",
+            [
+                (checksum, calculated_at, pk, name)
+                for name, checksum in digests.items()
+                if name != algorithm
+            ],
+        )
+    except sqlite3.OperationalError:
+        raise DatabaseError("Не удалось выполнить запрос")
+
+
+def delete_from_aux_table(
+    connection: sqlite3.Connection, table: str, query_params: Dict
+):
+    """
+    Удаление записи из таблицы вспомогательной БД
+    :param connection:
+    :param table:
+    :param query_params:
+    :return:
+    """
+    try:
+        params_str = " AND ".join([f'"{field}" = ?' for field in query_params])
+        connection.execute(
+            f'DELETE FROM "{table}" WHERE {params_str};', tuple(query_params.values())
+        )
+    except sqlite3.OperationalError as e:
+        raise DatabaseError("Не удалось выполнить запрос")
+
+
+def _keyset_page(
+    after_id: Optional[int], before_id: Optional[int]
+) -> Tuple[List[str], List, str]:
+    """
+    Условие и порядок выборки страницы записей по ключу t.id: записи
+    после заданной (следующая страница) или перед ней (предыдущая страница,
+    выбирается в обратном порядке). В отличие от OFFSET стоимость запроса
+    не зависит от номера страницы.
+    :param after_id: id последней записи предыдущей страницы
+    :param before_id: id первой записи следующей страницы
+    :return: условия, их параметры и направление сортировки
+    """
+    if after_id is not None and before_id is not None:
+        raise ParamError("Страница задаётся либо после записи, либо перед ней")
+    if before_id is not None:
+        return ["t.id < ?"], [before_id], "DESC"
+    if after_id is not None:
+        return ["t.id > ?"], [after_id], "ASC"
+    return [], [], "ASC"
+
+
+def select_incorrect(
+    connection: sqlite3.Connection,
+    table: str,
+    field: str,
+    limit: int = None,
+    offset: int = None,
+    after_id: int = None,
+    before_id: int = None,
+):
+    """
+    Запрос списка объектов с нарушенной целостностью
+    из таблицы вспомогательной БД
+    :param connection:
+    :param table:
+    :param field:
+    :param limit:
+    :param offset:
+    :param after_id: выбираются записи после заданной, см. _keyset_page
+    :param before_id: выбираются записи перед заданной, см. _keyset_page
+    :return: список (название объекта, время последней ошибки, id)
+    """
+    if table not in ERRORS_TABLES:
+        raise ParamError("Указана неправильная таблица")
+    conditions, params, order = _keyset_page(after_id, before_id)
+    where_str = " AND ".join(
+        ['NOT t."is_correct"', "t.last_error_at IS NOT NULL", *conditions]
+    )
+    limit_str = " LIMIT ?" if limit else ""
+    offset_str = " OFFSET ?" if offset else ""
+    params += [value for value in (limit, offset) if value]
+    try:
+        query = connection.execute(
+            f'SELECT t."{field}", t.last_error_at, t.id FROM "{table}" t '
+            f'WHERE {where_str} ORDER BY t."id" {order}{limit_str}{offset_str};',
+            params,
+        )
+        res = query.fetchall()
+    except sqlite3.OperationalError:
+        raise DatabaseError("Не удалось выполнить запрос")
+    if not res:
+        raise ParamError("Записи не найдены")
+    return res[::-1] if before_id is not None else res
+
+
+def mark_as_incorrect(connection: sqlite3.Connection, table: str, pk: int):
+    """
+    Отметка объекта защиты как имеющего нарушение целостности
+    :param connection:
+    :param table:
+    :param pk:
+    :return:
+    """
+    mark_many_as_incorrect(connection, table, (pk,))
+
+
+def mark_many_as_incorrect(
+    connection: sqlite3.Connection,
+    table: str,
+    pks: Iterable[int],
+    batch_size: Optional[int] = None,
+) -> int:
+    """
+    Отметка объектов защиты как имеющих нарушение целостности
+    :param connection:
+    :param table: files или tables
+    :param pks: id объектов
+    :param batch_size: число объектов в транзакции, см. _execute_batched
+    :return: число объектов
+    """
+    if table not in ERRORS_TABLES:
+        raise ParamError("Указана неправильная таблица")
+    return _execute_batched(
+        connection,
+        f'UPDATE "{table}" SET is_correct = 0 WHERE id = ?;',
+        ((pk,) for pk in pks),
+        batch_size,
+    )
+
+
+def register_violations(
+    connection: sqlite3.Connection,
+    table: str,
+    pks: Iterable[int],
+    manual: bool = True,
+    batch_size: Optional[int] = None,
+) -> int:
+    """
+    Регистрация нарушений целостности объектов защиты: объекты отмечаются
+    как некорректные, в журнал ошибок добавляются записи о проверке.
+    :param connection:
+    :param table: files или tables
+    :param pks: id объектов
+    :param manual: нарушение выявлено проверкой, а не наблюдателем (для файлов)
+    :param batch_size: число объектов в транзакции, см. _execute_batched
+    :return: число объектов
+    """
+    try:
+        errors_table, fk_field = ERRORS_TABLES[table]
+    except KeyError:
+        raise ParamError("Указана неправильная таблица")
+    fields = [fk_field, "checked_at"]
+    extra = ()
+    if table == "files":
+        fields.append("manual")
+        extra = (int(manual),)
+    total = 0
+    for batch in _chunks(pks, batch_size):
+        checked_at = get_current_timestamp()
+        mark_many_as_incorrect(connection, table, batch)
+        total += insert_many_into_aux_table(
+            connection,
+            errors_table,
+            fields,
+            [(pk, checked_at, *extra) for pk in batch],
+        )
+        if batch_size:
+            connection.commit()
+    return total
+
+
+def select_count_aux(connection: sqlite3.Connection, table: str) -> int:
+    """
+    Запрос числа записей в таблице вспомогательной базы данных.
+    :param connection:
+    :param table:
+    :return:
+    """
+    try:
+        query = connection.execute(f'SELECT COUNT(*) cnt FROM "{table}";')
+        return query.fetchone()[0]
+    except sqlite3.OperationalError:
+        raise ParamError("Не удалось выполнить запрос")
+
+
+def select_from_aux_db(
+    connection: sqlite3.Connection,
+    table: str,
+    name_field: str,
+    limit: int,
+    offset: int = 0,
+    database_id: int = None,
+    only_incorrect: bool = False,
+    after_id: int = None,
+    before_id: int = None,
+):
+    """
+    Запрос страницы списка объектов защиты с датой последней ошибки.
+    Страница задаётся смещением или, что не замедляется на последних страницах,
+    id соседней записи (after_id, before_id, см. _keyset_page).
+    :param connection:
+    :param table:
+    :param name_field:
+    :param limit:
+    :param offset:
+    :param database_id:
+    :param only_incorrect:
+    :param after_id:
+    :param before_id:
+    :return: список (название, алгоритм, контрольная сумма, время расчёта,
+    время последней ошибки, id)
+    """
+    conditions, params, order = _keyset_page(after_id, before_id)
+    if database_id:
+        conditions.append("t.database_id = ?")
+        params.append(database_id)
+    if only_incorrect:
+        conditions.append("NOT t.is_correct")
+    where_clause = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    try:
+        query = connection.execute(
+            f"SELECT t.{name_field}, a.name, t.checksum, "
+            f't.calculated_at, t.last_error_at, t.id FROM "{table}" t '
+            f'INNER JOIN "algorithms" a ON a.id = t.algorithm_id {where_clause}'
+            f"ORDER BY t.id {order} LIMIT ? OFFSET ?;",
+            (*params, limit, offset),
+        )
+        res = query.fetchall()
+    except sqlite3.OperationalError:
+        raise ParamError("Не удалось выполнить запрос")
+    return res[::-1] if before_id is not None else res
+
+
+def select_watched_files(connection: sqlite3.Connection):
+    try:
+        query = connection.execute("SELECT path FROM files WHERE is_watched IS true;")
+        return [row[0] for row in query.fetchall()]
+    except sqlite3.OperationalError:
+        return []
+
+
+def select_file_id(connection: sqlite3.Connection, path: str):
+    try:
+        query = connection.execute("SELECT id FROM files WHERE path = ?;", (path,))
+        res = query.fetchone()
+    except sqlite3.OperationalError:
+        raise ParamError("Файл не найден")
+    if not res:
+        raise ParamError("Файл не найден")
+    return res[0]
+
+
+def select_file_ids(connection: sqlite3.Connection, paths: Iterable[str]) -> Dict:
+    """
+    Определение id файлов по их путям; пути, отсутствующие во вспомогательной
+    БД, пропускаются.
+    :param connection:
+    :param paths:
+    :return: словарь {путь: id файла}
+    """
+    res = {}
+    try:
+        for batch in _chunks(paths, BATCH_SIZE):
+            query = connection.execute(
+                "SELECT path, id FROM files "
+                f"WHERE path IN ({', '.join(['?'] * len(batch))});",
+                batch,
+            )
+            res.update(query.fetchall())
+    except sqlite3.OperationalError:
+        raise DatabaseError("Не удалось выполнить запрос")
+    return res
+
+
+def select_files_inventory(connection: sqlite3.Connection) -> List[Tuple]:
+    """
+    Запрос всех защищаемых файлов с эталонными контрольными суммами.
+    :param connection:
+    :return: список (id, путь, контрольная сумма, алгоритм, признак корректности,
+    поля отпечатка метаданных FINGERPRINT_FIELDS)
+    """
+    try:
+        query = connection.execute(
+            "SELECT t.id, t.path, t.checksum, a.name, t.is_correct, "
+            "t.st_dev, t.st_ino, t.file_size, t.st_mtime_ns FROM files t "
+            "INNER JOIN algorithms a ON a.id = t.algorithm_id ORDER BY t.id;"
+        )
+        return query.fetchall()
+    except sqlite3.OperationalError:
+        raise DatabaseError("Не удалось выполнить запрос")
+
+
+def update_file_fingerprints(
+    connection: sqlite3.Connection, fingerprints: Iterable[Tuple[int, Tuple]]
+):
+    """
+    Сохранение отпечатков метаданных файлов.
+    :param connection:
+    :param fingerprints: пары (id файла, отпечаток из file_fingerprint)
+    :return:
+    """
+    try:
+        fields_str = ", ".join([f'"{field}" = ?' for field in FINGERPRINT_FIELDS])
+        connection.executemany(
+            f"UPDATE files SET {fields_str} WHERE id = ?;",
+            [(*fingerprint, pk) for pk, fingerprint in fingerprints],
+        )
+    except sqlite3.OperationalError:
+        raise DatabaseError("Не удалось выполнить запрос")
+
+
+def save_merkle_tree(
+    connection: sqlite3.Connection,
+    file_id: int,
+    chunk_size: int,
+    leaves: List[str],
+    root: str,
+):
+    """
+    Сохранение (замена) дерева Меркла файла.
+    :param connection:
+    :param file_id:
+    :param chunk_size:
+    :param leaves:
+    :param root:
+    :return:
+    """
+    try:
+        connection.execute(
+            "INSERT OR REPLACE INTO file_merkle_trees "
+            "(file_id, chunk_size, leaves, root, calculated_at) "
+            "VALUES (?, ?, ?, ?, ?);",
+            (file_id, chunk_size, "\n".join(leaves), root, get_current_timestamp()),
+        )
+    except sqlite3.OperationalError:
+        raise DatabaseError("Не удалось выполнить запрос")
+
+
+def get_merkle_tree(
+    connection: sqlite3.Connection, file_id: int
+) -> Optional[Tuple[int, List[str], str]]:
+    """
+    Запрос дерева Меркла файла.
+    :param connection:
+    :param file_id:
+    :return: (размер блока, листья, корень) или None, если дерево не построено
+    """
+    try:
+        res = connection.execute(
+            "SELECT chunk_size, leaves, root FROM file_merkle_trees WHERE file_id = ?;",
+            (file_id,),
+        ).fetchone()
+    except sqlite3.OperationalError:
+        raise DatabaseError("Не удалось выполнить запрос")
+    if not res:
+        return None
+    chunk_size, leaves, root = res
+    return chunk_size, leaves.split("\n") if leaves else [], root
+
+
+def save_table_partitions(
+    connection: sqlite3.Connection,
+    table_id: int,
+    algorithm: str,
+    partitions: List[Tuple],
+    roots: Dict[str, str],
+):
+    """
+    Сохранение (замена) контрольных сумм диапазонов первичного ключа таблицы
+    по основному и дополнительным алгоритмам.
+    :param connection:
+    :param table_id:
+    :param algorithm: основной алгоритм таблицы
+    :param partitions: список (нижняя граница, словарь {алгоритм: контрольная
+    сумма}, число записей) в порядке первичного ключа; нижняя граница первого
+    диапазона - None
+    :param roots: словарь {алгоритм: контрольная сумма, объединяющая суммы
+    диапазонов}
+    :return:
+    """
+    calculated_at = get_current_timestamp()
+    try:
+        connection.execute(
+            "DELETE FROM table_partitions WHERE table_id = ?;", (table_id,)
+        )
+        extra_checksums = []
+        for lower, digests, count in partitions:
+            partition_id = connection.execute(
+                "INSERT INTO table_partitions "
+                "(table_id, lower_bound, checksum, row_count, calculated_at) "
+                "VALUES (?, ?, ?, ?, ?);",
+                (
+                    table_id,
+                    # Значения ключа типов, не поддерживаемых SQLite
+                    # (дата, Decimal, UUID), хранятся строками
+                    lower
+                    if lower is None or isinstance(lower, (int, float, str, bytes))
+                    else str(lower),
+                    digests[algorithm],
+                    count,
+                    calculated_at,
+                ),
+            ).lastrowid
+            extra_checksums += [
+                (partition_id, checksum, name)
+                for name, checksum in digests.items()
+                if name != algorithm
+            ]
+        connection.executemany(
+            "INSERT INTO table_partition_checksums "
+            "(partition_id, algorithm_id, checksum) "
+            "SELECT ?, id, ? FROM algorithms WHERE name = ?;",
+            extra_checksums,
+        )
+        connection.execute(
+            "UPDATE tables SET partition_root = ? WHERE id = ?;",
+            (roots[algorithm], table_id),
+        )
+        connection.executemany(
+            "UPDATE table_checksums SET partition_root = ? WHERE table_id = ? "
+            "AND algorithm_id = (SELECT id FROM algorithms WHERE name = ?);",
+            [
+                (root, table_id, name)
+                for name, root in roots.items()
+                if name != algorithm
+            ],
+        )
+    except sqlite3.OperationalError:
+        raise DatabaseError("Не удалось выполнить запрос")
+
+
+def get_table_partitions(
+    connection: sqlite3.Connection, table_id: int
+) -> Optional[Tuple[List[Tuple], Dict[str, str]]]:
+    """
+    Запрос контрольных сумм диапазонов первичного ключа таблицы.
+    Дополнительные алгоритмы, для которых суммы диапазонов не рассчитаны
+    (диапазоны построены до версии 13 схемы), в результат не входят.
+    :param connection:
+    :param table_id:
+    :return: (список (нижняя граница, словарь {алгоритм: контрольная сумма},
+    число записей), словарь {алгоритм: объединяющая контрольная сумма})
+    или None, если диапазоны не построены
+    """
+    try:
+        root = connection.execute(
+            "SELECT a.name, t.partition_root FROM tables t "
+            "INNER JOIN algorithms a ON a.id = t.algorithm_id WHERE t.id = ?;",
+            (table_id,),
+        ).fetchone()
+        if not root or root[1] is None:
+            return None
+        roots = dict(
+            [
+                tuple(root),
+                *connection.execute(
+                    "SELECT a.name, c.partition_root FROM table_checksums c "
+                    "INNER JOIN algorithms a ON a.id = c.algorithm_id "
+                    "WHERE c.table_id = ? AND c.partition_root IS NOT NULL;",
+                    (table_id,),
+                ),
+            ]
+        )
+        partitions = {
+            partition_id: (lower, {root[0]: checksum}, count)
+            for partition_id, lower, checksum, count in connection.execute(
+                "SELECT id, lower_bound, checksum, row_count FROM table_partitions "
+                "WHERE table_id = ? ORDER BY id;",
+                (table_id,),
+            )
+        }
+        for partition_id, name, checksum in connection.execute(
+            "SELECT c.partition_id, a.name, c.checksum "
+            "FROM table_partition_checksums c "
+            "INNER JOIN table_partitions p ON p.id = c.partition_id "
+            "INNER JOIN algorithms a ON a.id = c.algorithm_id "
+            "WHERE p.table_id = ?;",
+            (table_id,),
+        ):
+            if name in roots:
+                partitions[partition_id][1][name] = checksum
+        return list(partitions.values()), roots
+    except sqlite3.OperationalError:
+        raise DatabaseError("Не удалось выполнить запрос")
+
+
+def update_change_marker(
+    connection: sqlite3.Connection, table_id: int, marker: Optional[str]
+):
+    """
+    Сохранение признака изменения таблицы, см. select_change_marker.
+    :param connection:
+    :param table_id:
+    :param marker:
+    :return:
+    """
+    try:
+        connection.execute(
+            "UPDATE tables SET change_marker = ? WHERE id = ?;", (marker, table_id)
+        )
+    except sqlite3.OperationalError:
+        raise DatabaseError("Не удалось выполнить запрос")
+
+
+def update_table_selection(
+    connection: sqlite3.Connection,
+    table_id: int,
+    columns: Optional[List[str]],
+    row_filter: Optional[str],
+):
+    """
+    Сохранение защищаемых полей и условия отбора записей таблицы.
+    :param connection:
+    :param table_id:
+    :param columns: None - все поля
+    :param row_filter: условие WHERE, None - все записи
+    :return:
+    """
+    try:
+        connection.execute(
+            "UPDATE tables SET column_list = ?, row_filter = ? WHERE id = ?;",
+            (",".join(columns) if columns else None, row_filter, table_id),
+        )
+    except sqlite3.OperationalError:
+        raise DatabaseError("Не удалось выполнить запрос")
+
+
+# Работа с защищаемой БД
+
+
+_engines: Dict[str, Engine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(connection_string: str) -> Engine:
+    """
+    Движок защищаемой БД из реестра процесса. Движки создаются один раз
+    на строку соединения (ключ - get_connection_name), так что повторные
+    соединения берутся из пула уже установленных.
+    :param connection_string:
+    :return:
+    """
+    name = get_connection_name(connection_string)
+    with _engines_lock:
+        if name not in _engines:
+            _engines[name] = create_engine(
+                connection_string,
+                pool_size=max(POOL_SIZE, TABLE_WORKERS),
+                max_overflow=POOL_MAX_OVERFLOW,
+                pool_pre_ping=POOL_PRE_PING,
+                pool_recycle=POOL_RECYCLE,
+            )
+        return _engines[name]
+
+
+def dispose_engines():
+    """
+    Закрывает соединения всех движков реестра и очищает его.
+    :return:
+    """
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+def connect_to_db(
     connection_string: str, aux_connection: sqlite3.Connection
 ) -> Connectable:
     """
     Обеспечивает соединение с защищаемой базой данных.
     Если это первое соединение с ней, регистрирует его во вспомогательной БД.
+    Соединение берётся из пула движка, см. get_engine.
     :param aux_connection:
     :param connection_string:
     :return: объект соединения
     """
-    engine = create_engine(connection_string)
+    engine = get_engine(connection_string)
     try:
         connection_name = get_connection_name(connection_string)
-        try:
-            get_database_id(aux_connection, connection_name)
-        except ParamError:
-            aux_connection.execute(
-                "INSERT INTO databases (connection) VALUES (?)", (connection_name,)
-            )
+        upsert_into_aux_table(
+            aux_connection,
+            "databases",
+            ["connection"],
+            [(connection_name,)],
+            ["connection"],
+        )
         return engine.connect()
     except (OperationalError, ProgrammingError):
         raise ParamError("Не удалось соединиться с указанной базой данных")
@@ -424,6 +2354,311 @@ def select_count(connection: Connectable, table: str) -> int:
         raise ParamError("Не удалось выполнить запрос")
 
 
+def _quote_name(connection: Connectable, name: str) -> str:
+    q = '"' if connection.engine.url.drivername == "postgresql" else "`"
+    return f"{q}{name}{q}"
+
+
+def pk_range_condition(
+    connection: Connectable, pk_field: str, lower=None, upper=None
+) -> Tuple[Optional[str], Dict]:
+    """
+    Условие отбора записей с первичным ключом в диапазоне [lower, upper);
+    отсутствующая граница диапазона не ограничивает.
+    :param connection:
+    :param pk_field:
+    :param lower:
+    :param upper:
+    :return: (условие для WHERE или None, параметры запроса)
+    """
+    pk = _quote_name(connection, pk_field)
+    conditions, params = [], {}
+    if lower is not None:
+        conditions.append(f"{pk} >= :lower")
+        params["lower"] = lower
+    if upper is not None:
+        conditions.append(f"{pk} < :upper")
+        params["upper"] = upper
+    return " AND ".join(conditions) or None, params
+
+
+def select_partition_bounds(
+    connection: Connectable,
+    table: str,
+    pk_field: str,
+    rows_per_partition: Optional[int] = None,
+) -> List:
+    """
+    Нижние границы диапазонов первичного ключа по rows_per_partition записей:
+    каждая rows_per_partition-я запись в порядке первичного ключа.
+    По сети передаются только значения ключа.
+    :param connection:
+    :param table:
+    :param pk_field:
+    :param rows_per_partition: по умолчанию берётся значение PARTITION_ROWS
+    :return:
+    """
+    if rows_per_partition is None:
+        rows_per_partition = PARTITION_ROWS
+    if rows_per_partition <= 0:
+        raise ParamError("Число записей в диапазоне должно быть положительным")
+    pk = _quote_name(connection, pk_field)
+    try:
+        query = connection.execute(
+            text(
+                f"SELECT pk FROM (SELECT {pk} AS pk, "
+                f"ROW_NUMBER() OVER (ORDER BY {pk}) AS rn "
+                f"FROM {_quote_name(connection, table)}) s "
+                "WHERE (rn - 1) % :rows = 0 ORDER BY pk;"
+            ),
+            {"rows": rows_per_partition},
+        )
+        return [row[0] for row in query.fetchall()]
+    except (OperationalError, ProgrammingError):
+        raise ParamError("Не удалось выполнить запрос")
+
+
+def _rows_to_str(rows) -> str:
+    return "".join(["".join([str(field) for field in row]) for row in rows])
+
+
+def _encode_int(value: int) -> bytes:
+    return value.to_bytes(value.bit_length() // 8 + 1, "big", signed=True)
+
+
+def _map_column(convert: Callable) -> Callable[[List], List[bytes]]:
+    # Преобразование столбца по одному значению
+    return lambda values: list(map(convert, values))
+
+
+def _ascii_column(convert: Callable[..., str]) -> Callable[[List], List[bytes]]:
+    # Строковые представления без переводов строки кодируются одним вызовом
+    return lambda values: "\n".join(map(convert, values)).encode("ascii").split(b"\n")
+
+
+# Преобразователи столбцов в байты для ROW_FORMAT_BINARY:
+# тип значений -> (метка типа, функция преобразования списка значений)
+_FIELD_ENCODERS = {
+    str: (b"s", _map_column(str.encode)),
+    int: (b"i", _map_column(_encode_int)),
+    bool: (b"?", _map_column(lambda value: b"\x01" if value else b"\x00")),
+    float: (b"f", _map_column(struct.Struct(">d").pack)),
+    Decimal: (b"n", _ascii_column(str)),
+    bytes: (b"x", _map_column(bytes)),
+    bytearray: (b"x", _map_column(bytes)),
+    memoryview: (b"x", _map_column(bytes)),
+    datetime: (b"t", _ascii_column(datetime.isoformat)),
+    date: (b"d", _ascii_column(date.isoformat)),
+    time: (b"h", _ascii_column(time.isoformat)),
+    timedelta: (b"p", _ascii_column(str)),
+    uuid.UUID: (b"u", _map_column(lambda value: value.bytes)),
+}
+# Значения прочих типов кодируются строковым представлением
+_DEFAULT_ENCODER = (b"o", _map_column(lambda value: str(value).encode("utf-8")))
+_FIELD_HEADER = struct.Struct(">cI")  # Метка типа и длина значения
+_NULL_FIELD = _FIELD_HEADER.pack(b"N", 0)  # NULL - метка с нулевой длиной
+
+
+def _encode_values(values: List, value_type: type) -> List[bytes]:
+    tag, convert = _FIELD_ENCODERS.get(value_type, _DEFAULT_ENCODER)
+    data = convert(values)
+    return list(map(add, map(_FIELD_HEADER.pack, repeat(tag), map(len, data)), data))
+
+
+class RowEncoder:
+    """
+    Кодирование порций записей таблицы в байты для расчёта контрольной суммы.
+    В формате ROW_FORMAT_TEXT поля приводятся к строкам и конкатенируются
+    (формат эталонов до версии 2, в нём ("ab", "c") и ("a", "bc") неразличимы).
+    В формате ROW_FORMAT_BINARY каждое поле записывается как метка типа,
+    длина (4 байта) и значение; NULL записывается меткой с нулевой длиной.
+    Формат однозначен, но кодируется медленнее текстового.
+    Порция кодируется по столбцам: если все значения столбца, кроме NULL,
+    одного типа, преобразователь выбирается один раз на столбец.
+    """
+
+    def __init__(self, row_format: int = None, encoding: str = "utf-8"):
+        """
+        :param row_format: по умолчанию берётся значение ROW_FORMAT
+        :param encoding: кодировка соединения с защищаемой БД для ROW_FORMAT_TEXT
+        """
+        self.row_format = ROW_FORMAT if row_format is None else row_format
+        if self.row_format not in ROW_FORMATS:
+            raise ParamError(f"Неизвестный формат записей таблицы: {row_format}")
+        self.encoding = encoding
+
+    @staticmethod
+    def _encode_column(column: tuple) -> List[bytes]:
+        types = set(map(type, column))
+        nulls = type(None) in types
+        types.discard(type(None))
+        if not types:
+            return [_NULL_FIELD] * len(column)
+        if len(types) > 1:
+            return [
+                _encode_values([value], type(value))[0] if value is not None
+                else _NULL_FIELD
+                for value in column
+            ]
+        if not nulls:
+            return _encode_values(column, types.pop())
+        values = [value for value in column if value is not None]
+        fields = iter(_encode_values(values, types.pop()))
+        return [_NULL_FIELD if value is None else next(fields) for value in column]
+
+    def _encode_fields(self, rows) -> Iterator[tuple]:
+        # Поля столбцов собираются обратно по записям
+        return zip(*map(self._encode_column, zip(*rows)))
+
+    def encode(self, rows) -> bytes:
+        """
+        :param rows: порция записей
+        :return:
+        """
+        if self.row_format == ROW_FORMAT_TEXT:
+            return _rows_to_str(rows).encode(self.encoding)
+        return b"".join(chain.from_iterable(self._encode_fields(rows)))
+
+    def encode_rows(self, rows) -> List[bytes]:
+        """
+        Кодирование каждой записи порции по отдельности.
+        :param rows: порция записей
+        :return:
+        """
+        if self.row_format == ROW_FORMAT_TEXT:
+            return [_rows_to_str([row]).encode(self.encoding) for row in rows]
+        return list(map(b"".join, self._encode_fields(rows)))
+
+
+def and_conditions(*conditions: Optional[str]) -> Optional[str]:
+    """
+    Объединение условий отбора записей через AND, пустые условия пропускаются.
+    :param conditions:
+    :return: None, если ни одного условия не задано
+    """
+    conditions = [f"({condition})" for condition in conditions if condition]
+    return " AND ".join(conditions) or None
+
+
+def literal_condition(condition: Optional[str]) -> Optional[str]:
+    """
+    Условие отбора записей, заданное пользователем, для подстановки в text():
+    двоеточия экранируются, чтобы литералы вида '10:00' и приведения ::
+    не принимались за параметры запроса.
+    :param condition:
+    :return:
+    """
+    return condition.replace(":", "\\:") if condition else None
+
+
+def validate_table_selection(
+    connection: Connectable,
+    table: str,
+    columns: Optional[List[str]],
+    row_filter: Optional[str],
+):
+    """
+    Проверка защищаемых полей и условия отбора записей перед сохранением:
+    имена полей не экранируются и хранятся через запятую, а условие
+    подставляется во все запросы к таблице, поэтому условие с ";"
+    и имена с кавычками и запятыми не принимаются, а запрос с полями
+    и условием выполняется без чтения записей (LIMIT 0).
+    :param connection:
+    :param table:
+    :param columns: None - все поля
+    :param row_filter: условие WHERE, None - все записи
+    :return:
+    """
+    for column in columns or []:
+        if not column or any(char in column for char in "\"`',"):
+            raise ParamError(f'Недопустимое имя поля "{column}"')
+    if row_filter is not None and (not row_filter.strip() or ";" in row_filter):
+        raise ParamError("Недопустимое условие отбора записей")
+    select_list = (
+        ", ".join([_quote_name(connection, column) for column in columns])
+        if columns
+        else "1"
+    )
+    where_clause = f" WHERE ({literal_condition(row_filter)})" if row_filter else ""
+    try:
+        connection.execute(
+            text(
+                f"SELECT {select_list} FROM {_quote_name(connection, table)}"
+                f"{where_clause} LIMIT 0;"
+            )
+        )
+    except (OperationalError, ProgrammingError):
+        raise ParamError(
+            f'Поля или условие отбора записей таблицы "{table}" недопустимы'
+        )
+
+
+def _select_query(
+    connection: Connectable,
+    table: str,
+    pk_field: str,
+    condition: Optional[str] = None,
+    ordered: bool = True,
+    columns: Optional[List[str]] = None,
+) -> str:
+    select_list = (
+        ", ".join([_quote_name(connection, column) for column in columns])
+        if columns
+        else "*"
+    )
+    where_clause = f" WHERE {condition}" if condition else ""
+    order_clause = f" ORDER BY {_quote_name(connection, pk_field)}" if ordered else ""
+    return (
+        f"SELECT {select_list} FROM {_quote_name(connection, table)}"
+        f"{where_clause}{order_clause}"
+    )
+
+
+def stream_table(
+    connection: Connectable,
+    table: str,
+    pk_field: str,
+    batch_size: int = TABLE_BATCH_SIZE,
+    condition: Optional[str] = None,
+    params: Optional[Dict] = None,
+    ordered: bool = True,
+    columns: Optional[List[str]] = None,
+) -> Iterator[List]:
+    """
+    Потоковый запрос всех записей из таблицы защищаемой базы данных
+    через курсор на стороне сервера порциями по batch_size записей,
+    так что в памяти одновременно находится только одна порция.
+    :param connection:
+    :param table:
+    :param pk_field:
+    :param batch_size:
+    :param condition: условие отбора записей, см. pk_range_condition
+    :param params: параметры условия
+    :param ordered: упорядочивать записи по первичному ключу; без сортировки
+    СУБД отдаёт записи в порядке чтения
+    :param columns: запрашиваемые поля, по умолчанию - все
+    :return:
+    """
+    try:
+        query = connection.execution_options(stream_results=True).execute(
+            text(
+                _select_query(connection, table, pk_field, condition, ordered, columns)
+                + ";"
+            ),
+            params or {},
+        )
+        try:
+            while True:
+                rows = query.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            query.close()
+    except (OperationalError, ProgrammingError):
+        raise ParamError("Не удалось выполнить запрос")
+
+
 def select_all_from_table(connection: Connectable, table: str, pk_field: str) -> str:
     """
     Запрос всех записей из таблицы защищаемой базы данных.
@@ -433,11 +2668,867 @@ def select_all_from_table(connection: Connectable, table: str, pk_field: str) ->
     :param pk_field:
     :return:
     """
+    return "".join(
+        [_rows_to_str(rows) for rows in stream_table(connection, table, pk_field)]
+    )
+
+
+def checksum_table(
+    connection: Connectable,
+    table: str,
+    pk_field: str,
+    algorithm: Union[str, Iterable[str]] = "crc32",
+    encoding: str = "utf-8",
+    batch_size: int = TABLE_BATCH_SIZE,
+    condition: Optional[str] = None,
+    params: Optional[Dict] = None,
+    row_format: Optional[int] = None,
+    columns: Optional[List[str]] = None,
+) -> Tuple[Union[str, Dict[str, str]], int]:
+    """
+    Рассчитывает контрольную сумму таблицы защищаемой базы данных,
+    передавая закодированные порции записей в инкрементальный алгоритм,
+    так что расход памяти не зависит от размера таблицы. В формате
+    ROW_FORMAT_TEXT результат совпадает с контрольной суммой закодированного
+    результата select_all_from_table.
+    :param connection:
+    :param table:
+    :param pk_field:
+    :param algorithm: название алгоритма или последовательность названий,
+    см. calculate_checksum
+    :param encoding: кодировка соединения с защищаемой БД для ROW_FORMAT_TEXT
+    :param batch_size:
+    :param condition: условие отбора записей, см. pk_range_condition
+    :param params: параметры условия
+    :param row_format: формат кодирования записей, см. RowEncoder
+    :param columns: защищаемые поля, по умолчанию - все
+    :return: (контрольная сумма, число записей)
+    """
+    hasher = make_hasher(algorithm)
+    count, _ = _hash_table_rows(
+        connection,
+        table,
+        pk_field,
+        hasher,
+        RowEncoder(row_format, encoding),
+        batch_size,
+        condition,
+        params,
+        columns,
+    )
+    return hasher.finalize(), count
+
+
+def _hash_table_rows(
+    connection: Connectable,
+    table: str,
+    pk_field: str,
+    hasher: Union[Hasher, MultiHasher],
+    encoder: RowEncoder,
+    batch_size: int,
+    condition: Optional[str],
+    params: Optional[Dict],
+    columns: Optional[List[str]] = None,
+) -> Tuple[int, int]:
+    count = length = 0
+    for rows in stream_table(
+        connection, table, pk_field, batch_size, condition, params, columns=columns
+    ):
+        data = encoder.encode(rows)
+        hasher.update(data)
+        count += len(rows)
+        length += len(data)
+    return count, length
+
+
+def _open_snapshot(connection: Connectable, workers: int) -> List[Connectable]:
+    """
+    Открывает workers соединений из пула движка connection с транзакциями
+    REPEATABLE READ. PostgreSQL передаёт снимок первой транзакции остальным
+    (pg_export_snapshot), так что все соединения видят один снимок данных.
+    В MySQL согласованный снимок открывается в соединениях по очереди,
+    и транзакция, зафиксированная между ними, видна только части соединений:
+    снимки совпадают, только если таблица в это время не изменялась.
+    Для других СУБД общий снимок не гарантируется.
+    :param connection:
+    :param workers:
+    :return:
+    """
+    dialect = connection.engine.dialect.name
+    engine = connection.engine
+    capacity = _pool_capacity(engine)
+    if capacity is not None and workers > capacity:
+        raise ParamError(
+            f"Число соединений превышает размер пула защищаемой БД: не более {capacity}"
+        )
+    if dialect in ("postgresql", "mysql"):
+        engine = engine.execution_options(isolation_level="REPEATABLE READ")
+    connections = []
     try:
-        q = '"' if connection.engine.url.drivername == "postgresql" else "`"
-        query = connection.execute(f'SELECT * FROM {q}{table}{q} ORDER BY "{pk_field}";')
-        return "".join(
-            ["".join([str(field) for field in row]) for row in query.fetchall()]
+        for _ in range(workers):
+            connections.append(engine.connect())
+            connections[-1].begin()
+        if dialect == "postgresql":
+            snapshot = (
+                connections[0].execute("SELECT pg_export_snapshot();").fetchone()[0]
+            )
+            for worker in connections[1:]:
+                worker.execute(f"SET TRANSACTION SNAPSHOT '{snapshot}';")
+        elif dialect == "mysql":
+            for worker in connections:
+                worker.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT;")
+    except SQLAlchemyError:
+        # В том числе TimeoutError, если пул исчерпан другими соединениями
+        _close_snapshot(connections)
+        raise ParamError("Не удалось открыть снимок данных защищаемой БД")
+    return connections
+
+
+def _pool_capacity(engine: Engine) -> Optional[int]:
+    # Сколько ещё соединений можно взять из пула движка сверх соединения
+    # вызывающего; None - пул не ограничен
+    pool = engine.pool
+    if not isinstance(pool, QueuePool) or pool._max_overflow < 0:
+        return None
+    return pool.size() + pool._max_overflow - 1
+
+
+def _close_snapshot(connections: List[Connectable]):
+    for worker in connections:
+        worker.close()  # Незавершённая транзакция откатывается
+
+
+def _pk_ranges(
+    connection: Connectable,
+    pk_field: str,
+    bounds: List,
+    condition: Optional[str] = None,
+    params: Optional[Dict] = None,
+) -> List[Tuple[Optional[str], Dict]]:
+    # Диапазоны первичного ключа между соседними нижними границами bounds;
+    # первый не ограничен снизу, последний - сверху. Дополнительное условие
+    # condition добавляется к каждому диапазону
+    bounds = [None, *bounds[1:]]
+    ranges = []
+    for i, lower in enumerate(bounds):
+        range_condition, range_params = pk_range_condition(
+            connection,
+            pk_field,
+            lower,
+            bounds[i + 1] if i + 1 < len(bounds) else None,
+        )
+        ranges.append(
+            (
+                and_conditions(condition, range_condition),
+                {**(params or {}), **range_params},
+            )
+        )
+    return ranges
+
+
+def _split_ranges(
+    connection: Connectable,
+    table: str,
+    pk_field: str,
+    workers: int,
+    condition: Optional[str] = None,
+    params: Optional[Dict] = None,
+) -> List[Tuple[Optional[str], Dict]]:
+    # Не более workers диапазонов первичного ключа с равным числом записей
+    count = select_count(connection, table)
+    rows_per_range = max(math.ceil(count / workers), 1)
+    bounds = select_partition_bounds(connection, table, pk_field, rows_per_range)
+    return _pk_ranges(connection, pk_field, bounds, condition, params)
+
+
+def _split_key_ranges(
+    connection: Connectable,
+    table: str,
+    pk_field: str,
+    workers: int,
+    condition: Optional[str] = None,
+    params: Optional[Dict] = None,
+) -> List[Tuple[Optional[str], Dict]]:
+    # Не более workers диапазонов равной длины между MIN и MAX целочисленного
+    # первичного ключа: оба значения берутся из индекса без чтения таблицы,
+    # но при неравномерном распределении ключей диапазоны неравны по числу
+    # записей. Для нецелочисленного ключа - см. _split_ranges
+    pk = _quote_name(connection, pk_field)
+    try:
+        lowest, highest = connection.execute(
+            f"SELECT MIN({pk}), MAX({pk}) FROM {_quote_name(connection, table)};"
+        ).fetchone()
+    except (OperationalError, ProgrammingError):
+        raise ParamError("Не удалось выполнить запрос")
+    if lowest is None:
+        return _pk_ranges(connection, pk_field, [None], condition, params)
+    if not isinstance(lowest, int) or not isinstance(highest, int):
+        return _split_ranges(connection, table, pk_field, workers, condition, params)
+    step = max(math.ceil((highest - lowest + 1) / workers), 1)
+    bounds = list(range(lowest, highest + 1, step))
+    return _pk_ranges(connection, pk_field, bounds, condition, params)
+
+
+def _hash_ranges_combined(
+    connections, table, pk_field, algorithm, encoder, batch_size, ranges, columns
+):
+    # Каждое соединение рассчитывает сумму своего диапазона целиком,
+    # результаты объединяются по длинам диапазонов (COMBINABLE_ALGORITHMS)
+    def hash_range(i):
+        hasher = make_hasher(algorithm)
+        count, length = _hash_table_rows(
+            connections[i],
+            table,
+            pk_field,
+            hasher,
+            encoder,
+            batch_size,
+            *ranges[i],
+            columns,
+        )
+        return hasher, count, length
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        results = list(executor.map(hash_range, range(len(ranges))))
+    hasher, count, _ = results[0]
+    for other, other_count, length in results[1:]:
+        hasher.combine(other, length)
+        count += other_count
+    return hasher.finalize(), count
+
+
+def _hash_ranges_ordered(
+    connections, table, pk_field, algorithm, encoder, batch_size, ranges, columns
+):
+    # Соединения читают свои диапазоны параллельно в ограниченные очереди,
+    # а данные передаются алгоритму строго в порядке первичного ключа
+    queues = [Queue(TABLE_QUEUE_SIZE) for _ in ranges]
+    cancelled = threading.Event()
+
+    def put(i, item) -> bool:
+        while not cancelled.is_set():
+            try:
+                queues[i].put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def read_range(i):
+        try:
+            for rows in stream_table(
+                connections[i],
+                table,
+                pk_field,
+                batch_size,
+                *ranges[i],
+                columns=columns,
+            ):
+                if not put(i, (len(rows), encoder.encode(rows))):
+                    return
+        except Exception as e:
+            put(i, e)
+            return
+        put(i, None)
+
+    hasher = make_hasher(algorithm)
+    count = 0
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        for i in range(len(ranges)):
+            executor.submit(read_range, i)
+        try:
+            for chunks in queues:
+                for item in iter(chunks.get, None):
+                    if isinstance(item, Exception):
+                        raise item
+                    hasher.update(item[1])
+                    count += item[0]
+        finally:
+            cancelled.set()
+    return hasher.finalize(), count
+
+
+def checksum_table_parallel(
+    connection: Connectable,
+    table: str,
+    pk_field: str,
+    algorithm: Union[str, Iterable[str]] = "crc32",
+    encoding: str = "utf-8",
+    workers: Optional[int] = None,
+    batch_size: int = TABLE_BATCH_SIZE,
+    row_format: Optional[int] = None,
+    columns: Optional[List[str]] = None,
+    condition: Optional[str] = None,
+    params: Optional[Dict] = None,
+) -> Tuple[Union[str, Dict[str, str]], int]:
+    """
+    Рассчитывает контрольную сумму таблицы, читая непересекающиеся диапазоны
+    первичного ключа через workers соединений из пула, см. _open_snapshot.
+    Результат совпадает с результатом checksum_table: для CRC-32/Adler-32/CRC-64
+    суммы диапазонов рассчитываются параллельно и объединяются, для остальных
+    алгоритмов параллельно только чтение, а данные хэшируются по порядку.
+    :param connection:
+    :param table:
+    :param pk_field:
+    :param algorithm: название алгоритма или последовательность названий
+    :param encoding: кодировка соединения с защищаемой БД для ROW_FORMAT_TEXT
+    :param workers: число соединений, по умолчанию берётся значение TABLE_WORKERS
+    :param batch_size:
+    :param row_format: формат кодирования записей, см. RowEncoder
+    :param columns: защищаемые поля, по умолчанию - все
+    :param condition: условие отбора записей; параметры с именами lower и upper
+    заняты диапазонами первичного ключа
+    :param params: параметры условия
+    :return: (контрольная сумма, число записей)
+    """
+    if workers is None:
+        workers = TABLE_WORKERS
+    if workers <= 0:
+        raise ParamError("Число соединений должно быть положительным")
+    if workers == 1:
+        return checksum_table(
+            connection,
+            table,
+            pk_field,
+            algorithm,
+            encoding,
+            batch_size,
+            condition,
+            params,
+            row_format,
+            columns,
+        )
+    algorithms = [algorithm] if isinstance(algorithm, str) else list(algorithm)
+    connections = _open_snapshot(connection, workers)
+    try:
+        ranges = _split_ranges(
+            connections[0], table, pk_field, workers, condition, params
+        )
+        hash_ranges = (
+            _hash_ranges_combined
+            if all(name in COMBINABLE_ALGORITHMS for name in algorithms)
+            else _hash_ranges_ordered
+        )
+        return hash_ranges(
+            connections,
+            table,
+            pk_field,
+            algorithm,
+            RowEncoder(row_format, encoding),
+            batch_size,
+            ranges,
+            columns,
+        )
+    finally:
+        _close_snapshot(connections)
+
+
+class CopyHasher:
+    """
+    Файлоподобный объект для copy_expert: данные COPY, приходящие
+    по одной записи, передаются алгоритму порциями не меньше CHUNK_SIZE.
+    """
+
+    def __init__(self, hasher: Union[Hasher, MultiHasher]):
+        self.hasher = hasher
+        self.length = 0
+        self._buffer = bytearray()
+
+    def write(self, data: bytes):
+        self._buffer += data
+        if len(self._buffer) >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.hasher.update(bytes(self._buffer))
+            self.length += len(self._buffer)
+            self._buffer.clear()
+
+
+def copy_table(
+    connection: Connectable,
+    table: str,
+    pk_field: str,
+    file,
+    condition: Optional[str] = None,
+    params: Optional[Dict] = None,
+    columns: Optional[List[str]] = None,
+    binary: bool = False,
+) -> int:
+    """
+    Выгрузка записей таблицы PostgreSQL в порядке первичного ключа командой
+    COPY (SELECT ...) TO STDOUT через соединение psycopg2, минуя построчную
+    выборку SQLAlchemy. Параметры условия подставляются в запрос литералами
+    средствами psycopg2 (cursor.mogrify), так как COPY их не поддерживает.
+    :param connection:
+    :param table:
+    :param pk_field:
+    :param file: объект с методом write(bytes)
+    :param condition: условие отбора записей, см. pk_range_condition
+    :param params: параметры условия
+    :param columns: выгружаемые поля, по умолчанию - все
+    :param binary: двоичный формат COPY вместо текстового
+    :return: число выгруженных записей
+    """
+    if connection.engine.dialect.name != "postgresql":
+        raise ParamError("Выгрузка командой COPY поддерживается только PostgreSQL")
+    # Запрос компилируется в стиле параметров psycopg2, в котором символ "%"
+    # удваивается; mogrify подставляет параметры и возвращает его обратно
+    try:
+        query = (
+            text(_select_query(connection, table, pk_field, condition, columns=columns))
+            .bindparams(**(params or {}))
+            .compile(dialect=connection.dialect)
+        )
+    except CompileError:
+        raise ParamError("Не удалось выполнить запрос")
+    copy_format = b" (FORMAT binary)" if binary else b""
+    cursor = connection.connection.cursor()
+    try:
+        select = cursor.mogrify(str(query), query.params)
+        cursor.copy_expert(b"COPY (" + select + b") TO STDOUT" + copy_format, file)
+        return cursor.rowcount
+    except connection.dialect.dbapi.Error:
+        raise ParamError("Не удалось выполнить запрос")
+    finally:
+        cursor.close()
+
+
+def checksum_table_copy(
+    connection: Connectable,
+    table: str,
+    pk_field: str,
+    algorithm: Union[str, Iterable[str]] = "crc32",
+    condition: Optional[str] = None,
+    params: Optional[Dict] = None,
+    columns: Optional[List[str]] = None,
+    binary: bool = False,
+) -> Tuple[Union[str, Dict[str, str]], int]:
+    """
+    Рассчитывает контрольную сумму потока COPY таблицы PostgreSQL,
+    см. copy_table. В текстовом формате COPY записи разделены переводом
+    строки, поля - табуляцией, а эти символы внутри значений экранируются,
+    поэтому поток однозначен. Значение отличается от рассчитанного
+    checksum_table и хранится с отдельным способом расчёта (tables.digest_mode).
+    :param connection:
+    :param table:
+    :param pk_field:
+    :param algorithm: название алгоритма или последовательность названий
+    :param condition: условие отбора записей, см. pk_range_condition
+    :param params: параметры условия
+    :param columns: защищаемые поля, по умолчанию - все
+    :param binary: двоичный формат COPY вместо текстового
+    :return: (контрольная сумма, число записей)
+    """
+    writer = CopyHasher(make_hasher(algorithm))
+    count = copy_table(
+        connection, table, pk_field, writer, condition, params, columns, binary
+    )
+    writer.flush()
+    return writer.hasher.finalize(), count
+
+
+def _row_digest_function(algorithm: str) -> Tuple[Callable[[bytes], int], int]:
+    """
+    Функция расчёта контрольной суммы одной записи в виде числа
+    и разрядность контрольной суммы в битах.
+    :param algorithm:
+    :return:
+    """
+    if algorithm in ("crc32", "adler32"):
+        return getattr(zlib, algorithm), 32
+    if algorithm in hashlib.algorithms_guaranteed and not algorithm.startswith(
+        "shake"
+    ):
+        constructor = getattr(hashlib, algorithm)
+        return (
+            lambda data: int.from_bytes(constructor(data).digest(), "big"),
+            8 * constructor().digest_size,
+        )
+
+    def digest(data: bytes) -> int:
+        hasher = Hasher(algorithm)
+        hasher.update(data)
+        return int(hasher.finalize(), base=16)
+
+    return digest, 4 * len(Hasher(algorithm).finalize())
+
+
+def _sum_row_digests(
+    connection: Connectable,
+    table: str,
+    pk_field: str,
+    functions: List[Tuple[Callable[[bytes], int], int]],
+    encoder: RowEncoder,
+    batch_size: int,
+    condition: Optional[str],
+    params: Optional[Dict],
+    columns: Optional[List[str]] = None,
+) -> Tuple[List[int], int]:
+    sums = [0] * len(functions)
+    count = 0
+    for rows in stream_table(
+        connection,
+        table,
+        pk_field,
+        batch_size,
+        condition,
+        params,
+        ordered=False,
+        columns=columns,
+    ):
+        encoded = encoder.encode_rows(rows)
+        for i, (function, bits) in enumerate(functions):
+            sums[i] = (sums[i] + sum(map(function, encoded))) % (1 << bits)
+        count += len(rows)
+    return sums, count
+
+
+def checksum_table_unordered(
+    connection: Connectable,
+    table: str,
+    pk_field: str,
+    algorithm: Union[str, Iterable[str]] = "crc32",
+    encoding: str = "utf-8",
+    workers: Optional[int] = None,
+    batch_size: int = TABLE_BATCH_SIZE,
+    condition: Optional[str] = None,
+    params: Optional[Dict] = None,
+    row_format: Optional[int] = None,
+    columns: Optional[List[str]] = None,
+) -> Tuple[Union[str, Dict[str, str]], int]:
+    """
+    Порядконезависимая контрольная сумма таблицы: сумма контрольных сумм
+    отдельных записей по модулю 2 ** (разрядность алгоритма). Записи читаются
+    без ORDER BY, а при workers > 1 диапазоны первичного ключа между его
+    MIN и MAX читаются параллельно (см. _open_snapshot), и их суммы
+    складываются. В отличие от XOR, сложение учитывает повторяющиеся
+    записи. Результат не совпадает с результатом checksum_table.
+    :param connection:
+    :param table:
+    :param pk_field:
+    :param algorithm: название алгоритма или последовательность названий
+    :param encoding: кодировка соединения с защищаемой БД для ROW_FORMAT_TEXT
+    :param workers: число соединений, по умолчанию берётся значение TABLE_WORKERS
+    :param batch_size:
+    :param condition: условие отбора записей; параметры с именами lower и upper
+    при workers > 1 заняты диапазонами первичного ключа
+    :param params: параметры условия
+    :param row_format: формат кодирования записей, см. RowEncoder
+    :param columns: защищаемые поля, по умолчанию - все
+    :return: (контрольная сумма, число записей)
+    """
+    if workers is None:
+        workers = TABLE_WORKERS
+    if workers <= 0:
+        raise ParamError("Число соединений должно быть положительным")
+    algorithms = [algorithm] if isinstance(algorithm, str) else list(algorithm)
+    if not algorithms:
+        raise ParamError("Не указан ни один алгоритм")
+    functions = [_row_digest_function(name) for name in algorithms]
+    encoder = RowEncoder(row_format, encoding)
+    if workers == 1:
+        sums, count = _sum_row_digests(
+            connection,
+            table,
+            pk_field,
+            functions,
+            encoder,
+            batch_size,
+            condition,
+            params,
+            columns,
+        )
+    else:
+        connections = _open_snapshot(connection, workers)
+        try:
+            ranges = _split_key_ranges(
+                connections[0], table, pk_field, workers, condition, params
+            )
+            with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+                results = list(
+                    executor.map(
+                        lambda i: _sum_row_digests(
+                            connections[i],
+                            table,
+                            pk_field,
+                            functions,
+                            encoder,
+                            batch_size,
+                            *ranges[i],
+                            columns,
+                        ),
+                        range(len(ranges)),
+                    )
+                )
+        finally:
+            _close_snapshot(connections)
+        sums = [sum(column) for column in zip(*[result[0] for result in results])]
+        count = sum(result[1] for result in results)
+    digests = {
+        name: f"{total % (1 << bits):0{bits // 4}x}"
+        for name, total, (_, bits) in zip(algorithms, sums, functions)
+    }
+    if isinstance(algorithm, str):
+        return digests[algorithm], count
+    return digests, count
+
+
+# Функции СУБД, рассчитывающие hexdigest строкового выражения {}
+SERVER_DIGEST_FUNCTIONS = {
+    "postgresql": {
+        "md5": "md5({})",
+        **{
+            f"sha{bits}": f"encode(sha{bits}(convert_to({{}}, 'UTF8')), 'hex')"
+            for bits in (224, 256, 384, 512)
+        },
+    },
+    "mysql": {
+        "md5": "MD5({})",
+        "sha1": "SHA1({})",
+        **{f"sha{bits}": f"SHA2({{}}, {bits})" for bits in (224, 256, 384, 512)},
+    },
+    # Функции регистрируются в соединении, см. _create_sqlite_digest_functions
+    "sqlite": {
+        name: f"{name}({{}})"
+        for name in ("md5", "sha1", "sha224", "sha256", "sha384", "sha512")
+    },
+}
+
+
+SERVER_DIGEST_CHUNK_ROWS = 4096  # Записей в порции расчёта на стороне СУБД
+
+
+def server_digest_supported(
+    connection: Connectable, algorithm: Union[str, Iterable[str]]
+) -> bool:
+    """
+    Может ли СУБД защищаемой БД рассчитать контрольную сумму таблицы
+    по указанному алгоритму (или всем алгоритмам последовательности).
+    :param connection:
+    :param algorithm:
+    :return:
+    """
+    algorithms = [algorithm] if isinstance(algorithm, str) else list(algorithm)
+    functions = SERVER_DIGEST_FUNCTIONS.get(connection.engine.dialect.name, {})
+    return all(name in functions for name in algorithms)
+
+
+def _sqlite_digest(algorithm: str, value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.encode()
+    return hashlib.new(algorithm, value).hexdigest()
+
+
+def _create_sqlite_digest_functions(connection: Connectable):
+    """
+    Регистрирует в соединении SQLite функции SERVER_DIGEST_FUNCTIONS["sqlite"]:
+    hexdigest строки в кодировке UTF-8 (NULL для NULL).
+    :param connection:
+    :return:
+    """
+    for name in SERVER_DIGEST_FUNCTIONS["sqlite"]:
+        connection.connection.create_function(
+            name, 1, partial(_sqlite_digest, name), deterministic=True
         )
+
+
+def checksum_table_server(
+    connection: Connectable,
+    table: str,
+    pk_field: str,
+    algorithm: Union[str, Iterable[str]] = "md5",
+    condition: Optional[str] = None,
+    params: Optional[Dict] = None,
+    columns: Optional[List[str]] = None,
+    chunk_rows: Optional[int] = None,
+) -> Tuple[Union[str, Dict[str, str]], int]:
+    """
+    Рассчитывает контрольную сумму таблицы защищаемой базы данных
+    на стороне СУБД. Записи в порядке первичного ключа делятся на порции
+    по chunk_rows; СУБД возвращает контрольную сумму конкатенации
+    контрольных сумм текстового представления записей каждой порции,
+    клиент рассчитывает контрольную сумму конкатенации сумм порций.
+    Размер агрегируемой строки ограничен размером порции, по сети
+    передаётся одна сумма на порцию. Значение отличается
+    от рассчитанного checksum_table, поэтому способ расчёта хранится
+    вместе с эталоном (tables.digest_mode).
+    :param connection:
+    :param table:
+    :param pk_field:
+    :param algorithm: название алгоритма или последовательность названий,
+    см. SERVER_DIGEST_FUNCTIONS
+    :param condition: условие отбора записей, см. pk_range_condition
+    :param params: параметры условия
+    :param columns: защищаемые поля, по умолчанию - все
+    :param chunk_rows: число записей в порции, по умолчанию -
+    SERVER_DIGEST_CHUNK_ROWS; 0 - вся таблица одной строкой (способ расчёта
+    "server_concat" эталонов, добавленных до разбиения на порции)
+    :return: (контрольная сумма, число записей)
+    """
+    algorithms = [algorithm] if isinstance(algorithm, str) else list(algorithm)
+    if not server_digest_supported(connection, algorithms):
+        raise ParamError("СУБД не поддерживает расчёт по указанному алгоритму")
+    if chunk_rows is None:
+        chunk_rows = SERVER_DIGEST_CHUNK_ROWS
+    dialect = connection.engine.dialect.name
+    functions = SERVER_DIGEST_FUNCTIONS[dialect]
+    where_clause = f" WHERE {condition}" if condition else ""
+    ordered = ""
+    try:
+        if dialect == "postgresql":
+            row = (
+                "ROW(%s)::text" % ", ".join([f't."{column}"' for column in columns])
+                if columns
+                else "t::text"
+            )
+            pk = f't."{pk_field}"'
+            aggregate = "string_agg({value}, '' ORDER BY {order})"
+            source = f'"{table}" t'
+            divide = "/"
+        elif dialect == "sqlite":
+            _create_sqlite_digest_functions(connection)
+            if not columns:
+                columns = connection.execute(
+                    f'SELECT * FROM "{table}" LIMIT 0;'
+                ).keys()
+            row = " || ',' || ".join([f'quote("{column}")' for column in columns])
+            pk = f'"{pk_field}"'
+            # SQLite до 3.44 не поддерживает ORDER BY в агрегатной функции:
+            # group_concat получает записи в порядке подзапроса
+            aggregate = "group_concat({value}, '')"
+            source = f'(SELECT * FROM "{table}"{where_clause} ORDER BY {pk})'
+            where_clause = ""
+            ordered = " ORDER BY row_pk"
+            divide = "/"
+        else:
+            if not columns:
+                columns = connection.execute(
+                    f"SELECT * FROM `{table}` LIMIT 0;"
+                ).keys()
+            row = "CONCAT_WS(',', %s)" % ", ".join(
+                [f"QUOTE(`{column}`)" for column in columns]
+            )
+            pk = f"`{pk_field}`"
+            aggregate = "GROUP_CONCAT({value} ORDER BY {order} SEPARATOR '')"
+            source = f"`{table}`"
+            divide = "DIV"
+            # По умолчанию результат GROUP_CONCAT обрезается до 1024 байт
+            connection.execute(
+                "SET SESSION group_concat_max_len = 18446744073709551615;"
+            )
+        if not chunk_rows:
+            digests_str = ", ".join(
+                [
+                    functions[name].format(
+                        "COALESCE(%s, '')"
+                        % aggregate.format(
+                            value=functions[name].format(row), order=pk
+                        )
+                    )
+                    for name in algorithms
+                ]
+            )
+            *digests, count = connection.execute(
+                text(f"SELECT {digests_str}, COUNT(*) FROM {source}{where_clause};"),
+                params or {},
+            ).fetchone()
+        else:
+            # Номер порции - по номеру записи в порядке первичного ключа
+            row_digests_str = ", ".join(
+                [
+                    f"{functions[name].format(row)} AS row_digest_{number}"
+                    for number, name in enumerate(algorithms)
+                ]
+            )
+            chunk_digests_str = ", ".join(
+                [
+                    functions[name].format(
+                        aggregate.format(value=f"row_digest_{number}", order="row_pk")
+                    )
+                    for number, name in enumerate(algorithms)
+                ]
+            )
+            query = connection.execute(
+                text(
+                    f"SELECT {chunk_digests_str}, COUNT(*) FROM ("
+                    f"SELECT {pk} AS row_pk, "
+                    f"(ROW_NUMBER() OVER (ORDER BY {pk}) - 1) {divide} {chunk_rows} "
+                    f"AS chunk, {row_digests_str} FROM {source}{where_clause}{ordered}"
+                    ") chunks GROUP BY chunk ORDER BY chunk;"
+                ),
+                params or {},
+            )
+            hashers = [Hasher(name) for name in algorithms]
+            count = 0
+            for *chunk_digests, chunk_count in query:
+                for hasher, chunk_digest in zip(hashers, chunk_digests):
+                    hasher.update(chunk_digest.encode())
+                count += chunk_count
+            digests = [hasher.finalize() for hasher in hashers]
     except (OperationalError, ProgrammingError):
         raise ParamError("Не удалось выполнить запрос")
+    if isinstance(algorithm, str):
+        return digests[0], count
+    return dict(zip(algorithms, digests)), count
+
+
+def select_change_marker(connection: Connectable, table: str) -> Optional[str]:
+    """
+    Признак изменения таблицы по метаданным СУБД, не требующий чтения данных.
+    PostgreSQL: файл таблицы (меняется при TRUNCATE, VACUUM FULL) и счётчики
+    вставленных, изменённых и удалённых записей из pg_stat_user_tables;
+    счётчики обновляются с небольшой задержкой и сбрасываются вместе
+    со статистикой. MySQL: время создания и последнего изменения таблицы
+    из information_schema.TABLES; для InnoDB время изменения хранится
+    только в памяти и после перезапуска сервера неизвестно. Время хранится
+    с точностью до секунды, поэтому, пока не закончилась секунда последнего
+    изменения, следующее изменение признак не изменит.
+    Если признак получить нельзя или он ещё не устоялся, возвращается None.
+    Признак нужно читать до расчёта контрольной суммы и сохранять, только
+    если после расчёта он прочитан тем же.
+    :param connection:
+    :param table:
+    :return:
+    """
+    dialect = connection.engine.dialect.name
+    try:
+        if dialect == "postgresql":
+            query = connection.execute(
+                text(
+                    "SELECT c.relfilenode, s.n_tup_ins, s.n_tup_upd, s.n_tup_del "
+                    "FROM pg_class c "
+                    "INNER JOIN pg_stat_user_tables s ON s.relid = c.oid "
+                    "WHERE c.oid = to_regclass(:table);"
+                ),
+                {"table": _quote_name(connection, table)},
+            )
+        elif dialect == "mysql":
+            try:
+                # MySQL 8.0 кэширует information_schema.TABLES на сутки
+                connection.execute("SET SESSION information_schema_stats_expiry = 0;")
+            except (OperationalError, ProgrammingError):
+                pass  # В MySQL 5.7 кэша нет
+            query = connection.execute(
+                text(
+                    "SELECT CREATE_TIME, UPDATE_TIME, UPDATE_TIME < NOW() "
+                    "FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table;"
+                ),
+                {"table": table},
+            )
+        else:
+            return None
+        row = query.fetchone()
+    except (OperationalError, ProgrammingError):
+        return None
+    if not row or None in tuple(row):
+        return None
+    if dialect == "mysql":
+        *row, settled = row
+        if not settled:
+            return None
+    return ":".join([str(value) for value in row])
@@ -2,7 +2,8 @@ import json
 import sys
 from datetime import datetime
 from os.path import getsize
-from typing import Optional
+from time import perf_counter
+from typing import Dict, List, Optional
 
 from tabulate import tabulate
 
@@ -11,6 +12,8 @@ import integrity_lib as ilib
 COMMANDS = (
     "help",
     "check",
+    "check_all",
+    "quick_check",
     "full_check",
     "db_connect",
     "add",
@@ -20,22 +23,35 @@ COMMANDS = (
     "watch",
     "remove",
     "restore",
+    "rebaseline",
+    "locate",
+    "append",
 )
 
 
 OBJECTS = ("file", "table")
+ADD_OPTIONS = (
+    "watch",
+    "backup",
+    "merkle",
+    "server",
+    "partition",
+    "unordered",
+    "copy",
+)
 OBJECTS_PLURAL = ("files", "tables")
 DBMS = ("mysql", "postgresql")
 
 
 class REPL:
     def __init__(self):
-        self.aux_connection = ilib.connect_to_auxiliary_db()
-        self.aux_connection.execute("PRAGMA foreign_keys = ON;")
+        self.aux_connection = ilib.get_auxiliary_db()
         self.error = False  # Скрипты будут выполняться до первой ошибки
         self.connection = None
         self.backup_dir = None
         self.last_check_no_error = None
+        self.workers = None  # Процессов для массовой проверки, None - по числу ядер
+        self.table_workers = None  # Соединений для расчёта по таблице, None - по ilib
 
     def _get_database_id(self):
         return ilib.get_database_id(
@@ -73,61 +89,374 @@ class REPL:
                     strings.append(arg_str)
         return "\n".join(strings)
 
+    def _parse_algorithms(self, algorithms: str) -> Dict[str, int]:
+        """
+        Разбор списка алгоритмов через запятую; первый алгоритм - основной.
+        :param algorithms:
+        :return: словарь {название алгоритма: id}
+        """
+        return {
+            name: ilib.get_algorithm_id(self.aux_connection, name)
+            for name in algorithms.split(",")
+            if name
+        }
+
+    def _get_references(self, table: str, pk: int, checksum: str, algorithm: str):
+        references = {algorithm: checksum}
+        references.update(
+            ilib.get_extra_checksums(self.aux_connection, table, pk).get(pk, {})
+        )
+        return references
+
+    @staticmethod
+    def _digests_match(digests: Dict[str, str], references: Dict[str, str]) -> bool:
+        return all(
+            int(digests[algorithm], base=16) == int(checksum, base=16)
+            for algorithm, checksum in references.items()
+        )
+
+    def _insert_extra_checksums(
+        self, table: str, pk: int, algorithms: Dict[str, int], digests: Dict[str, str]
+    ):
+        checksums_table, fk_field = ilib.EXTRA_CHECKSUMS[table]
+        calculated_at = ilib.get_current_timestamp()
+        ilib.insert_many_into_aux_table(
+            self.aux_connection,
+            checksums_table,
+            [fk_field, "algorithm_id", "checksum", "calculated_at"],
+            [
+                (pk, algorithm_id, digests[name], calculated_at)
+                for name, algorithm_id in list(algorithms.items())[1:]
+            ],
+        )
+
+    def _save_merkle_tree(self, pk: int, path: str, algorithm: str, size: int):
+        chunk_size = ilib.MERKLE_CHUNK_SIZE
+        leaves = ilib.merkle_leaves(path, algorithm, chunk_size, size=size)
+        ilib.save_merkle_tree(
+            self.aux_connection,
+            pk,
+            chunk_size,
+            leaves,
+            ilib.merkle_root(leaves, algorithm),
+        )
+
+    def _changed_ranges(
+        self, pk: int, path: str, algorithm: str, size: int
+    ) -> Optional[List[str]]:
+        """
+        Диапазоны байтов файла, изменившихся относительно дерева Меркла.
+        :param pk:
+        :param path:
+        :param algorithm: основной алгоритм файла
+        :param size: эталонный размер файла
+        :return: None, если дерево для файла не построено
+        """
+        tree = ilib.get_merkle_tree(self.aux_connection, pk)
+        if tree is None:
+            return None
+        chunk_size, leaves, root = tree
+        if ilib.merkle_root(leaves, algorithm) != root:
+            raise ilib.DatabaseError("Дерево Меркла файла повреждено")
+        new_size = getsize(path)
+        new_leaves = ilib.merkle_leaves(path, algorithm, chunk_size, size=new_size)
+        return [
+            f"{start}-{end - 1}"
+            for start, end in ilib.merkle_changed_ranges(
+                leaves, new_leaves, chunk_size, size, new_size
+            )
+        ]
+
     def _add_file(
         self,
         path: str,
-        algorithm_id: int,
-        algorithm_name: str,
+        algorithms: Dict[str, int],
         watch: bool,
         backup: bool,
+        merkle: bool = False,
     ) -> str:
+        algorithm_name, algorithm_id = next(iter(algorithms.items()))
         try:
-            file = open(path, "rb")
+            digests, fingerprint = ilib.checksum_file_fingerprinted(
+                path, list(algorithms)
+            )
         except FileNotFoundError:
             self.error = True
             return f'Файл "{path}" не найден'
-        digest = ilib.calculate_checksum(file.read(), algorithm_name)
+        digest = digests[algorithm_name]
         if not digest:
             raise ilib.ParamError(
                 f'Не удалось рассчитать контрольную сумму файла "{path}"'
             )
         insert_params = {
             "path": path,
-            "file_size": str(getsize(path)),
-            "is_watched": str(int(watch)),
-            "algorithm_id": str(algorithm_id),
+            "file_size": getsize(path),
+            "is_watched": int(watch),
+            "algorithm_id": algorithm_id,
             "checksum": digest,
-            "is_correct": "1",
-            "calculated_at": str(ilib.get_current_timestamp()),
+            "is_correct": 1,
+            "calculated_at": ilib.get_current_timestamp(),
         }
-        ilib.insert_into_aux_table(
+        if fingerprint:
+            insert_params.update(zip(ilib.FINGERPRINT_FIELDS, fingerprint))
+        pk = ilib.insert_into_aux_table(
             self.aux_connection,
             "files",
             list(insert_params.keys()),
             list(insert_params.values()),
         )
+        self._insert_extra_checksums("files", pk, algorithms, digests)
+        if merkle:
+            self._save_merkle_tree(pk, path, algorithm_name, insert_params["file_size"])
         self.aux_connection.commit()
         message = f"Файл {path} добавлен"
         if backup:
-            file.seek(0)
-            if ilib.make_compressed_copy(file.read(), "file", digest, self.backup_dir):
+            with open(path, "rb") as file:
+                backup_data = file.read()
+            if ilib.make_compressed_copy(backup_data, "file", digest, self.backup_dir):
                 message += "\nСоздана сжатая резервная копия"
         return message
 
+    def _checksum_table(
+        self,
+        name: str,
+        pk_field: Optional[str],
+        algorithms,
+        digest_mode: Optional[str],
+        condition: Optional[str] = None,
+        params: Optional[Dict] = None,
+        row_format: Optional[int] = None,
+        columns: Optional[List[str]] = None,
+        row_filter: Optional[str] = None,
+    ):
+        """
+        :param condition: диапазон первичного ключа, см. ilib.pk_range_condition
+        :param params: параметры диапазона
+        :param row_format: формат записей, в котором рассчитан эталон
+        :param columns: защищаемые поля таблицы
+        :param row_filter: условие отбора защищаемых записей
+        """
+        pk_field = pk_field or "id"
+        row_filter = ilib.literal_condition(row_filter)
+        if digest_mode in ("server", "server_concat"):
+            return ilib.checksum_table_server(
+                self.connection,
+                name,
+                pk_field,
+                algorithms,
+                ilib.and_conditions(row_filter, condition),
+                params,
+                columns,
+                chunk_rows=0 if digest_mode == "server_concat" else None,
+            )
+        if digest_mode == "copy":
+            return ilib.checksum_table_copy(
+                self.connection,
+                name,
+                pk_field,
+                algorithms,
+                ilib.and_conditions(row_filter, condition),
+                params,
+                columns,
+            )
+        if digest_mode == "unordered":
+            return ilib.checksum_table_unordered(
+                self.connection,
+                name,
+                pk_field,
+                algorithms,
+                self.connection.connection.encoding,
+                # Диапазон читается одним соединением
+                self.table_workers if condition is None else 1,
+                condition=ilib.and_conditions(row_filter, condition),
+                params=params,
+                row_format=row_format,
+                columns=columns,
+            )
+        if condition is None:
+            return ilib.checksum_table_parallel(
+                self.connection,
+                name,
+                pk_field,
+                algorithms,
+                self.connection.connection.encoding,
+                self.table_workers,
+                row_format=row_format,
+                columns=columns,
+                condition=row_filter,
+            )
+        return ilib.checksum_table(
+            self.connection,
+            name,
+            pk_field,
+            algorithms,
+            self.connection.connection.encoding,
+            condition=ilib.and_conditions(row_filter, condition),
+            params=params,
+            row_format=row_format,
+            columns=columns,
+        )
+
+    @staticmethod
+    def _table_options(
+        row_format: Optional[int], column_list: Optional[str], row_filter: Optional[str]
+    ) -> Dict:
+        # Параметры расчёта контрольной суммы таблицы из записи tables
+        return {
+            "row_format": row_format,
+            "columns": column_list.split(",") if column_list else None,
+            "row_filter": row_filter,
+        }
+
+    def _settled_marker(self, name: str, marker: Optional[str]) -> Optional[str]:
+        """
+        Признак изменения таблицы, прочитанный до расчёта контрольной суммы,
+        если после расчёта он не изменился; иначе таблица могла измениться
+        во время расчёта и признак не сохраняется.
+        :param name:
+        :param marker: признак, прочитанный до расчёта
+        :return:
+        """
+        if marker and marker == ilib.select_change_marker(self.connection, name):
+            return marker
+        return None
+
+    def _partition_digests(
+        self,
+        name: str,
+        pk_field: Optional[str],
+        algorithms: List[str],
+        digest_mode: Optional[str],
+        bounds: List,
+        **options,
+    ) -> List[tuple]:
+        partitions = []
+        for i, lower in enumerate(bounds):
+            upper = bounds[i + 1] if i + 1 < len(bounds) else None
+            condition, params = ilib.pk_range_condition(
+                self.connection, pk_field or "id", lower, upper
+            )
+            digests, count = self._checksum_table(
+                name, pk_field, algorithms, digest_mode, condition, params, **options
+            )
+            partitions.append((lower, digests, count))
+        return partitions
+
+    def _save_table_partitions(
+        self,
+        pk: int,
+        name: str,
+        pk_field: Optional[str],
+        algorithms: List[str],
+        digest_mode: Optional[str],
+        **options,
+    ):
+        """
+        :param algorithms: алгоритмы таблицы, первый - основной
+        """
+        bounds = ilib.select_partition_bounds(self.connection, name, pk_field or "id")
+        # Первый диапазон не ограничен снизу, последний - сверху,
+        # чтобы добавленные записи попадали в один из диапазонов
+        bounds = [None, *bounds[1:]]
+        partitions = self._partition_digests(
+            name, pk_field, algorithms, digest_mode, bounds, **options
+        )
+        ilib.save_table_partitions(
+            self.aux_connection,
+            pk,
+            algorithms[0],
+            partitions,
+            {
+                algorithm: ilib.merkle_root(
+                    [digests[algorithm] for _, digests, _ in partitions], algorithm
+                )
+                for algorithm in algorithms
+            },
+        )
+
+    def _changed_partitions(
+        self,
+        pk: int,
+        name: str,
+        pk_field: Optional[str],
+        digest_mode: Optional[str],
+        **options,
+    ) -> Optional[List[str]]:
+        """
+        Диапазоны первичного ключа таблицы, записи в которых изменились.
+        Каждый диапазон читается один раз, его контрольные суммы по всем
+        алгоритмам, для которых они сохранены, сравниваются с сохранёнными.
+        :param pk:
+        :param name:
+        :param pk_field:
+        :param digest_mode:
+        :param options: параметры расчёта, см. _table_options
+        :return: None, если диапазоны для таблицы не построены
+        """
+        stored = ilib.get_table_partitions(self.aux_connection, pk)
+        if stored is None:
+            return None
+        partitions, roots = stored
+        for algorithm, root in roots.items():
+            checksums = [checksums[algorithm] for _, checksums, _ in partitions]
+            if ilib.merkle_root(checksums, algorithm) != root:
+                raise ilib.DatabaseError(
+                    "Контрольные суммы диапазонов таблицы повреждены"
+                )
+        bounds = [lower for lower, _, _ in partitions]
+        current = self._partition_digests(
+            name, pk_field, list(roots), digest_mode, bounds, **options
+        )
+        pk_field = pk_field or "id"
+        ranges = []
+        for (lower, checksums, count), (_, digests, new_count), upper in zip(
+            partitions, current, [*bounds[1:], None]
+        ):
+            if self._digests_match(digests, checksums):
+                continue
+            if lower is None and upper is None:
+                range_str = "все записи"
+            elif lower is None:
+                range_str = f"{pk_field} < {upper}"
+            elif upper is None:
+                range_str = f"{pk_field} >= {lower}"
+            else:
+                range_str = f"{lower} <= {pk_field} < {upper}"
+            ranges.append(f"{range_str} (записей: было {count}, стало {new_count})")
+        return ranges
+
     def _add_table(
         self,
         name: str,
         pk_field: Optional[str],
-        algorithm_id: int,
-        algorithm_name: str,
+        algorithms: Dict[str, int],
         backup: bool,
+        server: bool = False,
+        partition: bool = False,
+        unordered: bool = False,
+        columns: Optional[List[str]] = None,
+        row_filter: Optional[str] = None,
+        copy: bool = False,
     ) -> str:
-        count = ilib.select_count(self.connection, name)
-        full_data = ilib.select_all_from_table(self.connection, name, pk_field or "id")
-        digest = ilib.calculate_checksum(
-            bytes(full_data.encode(self.connection.connection.encoding)),
-            algorithm_name,
+        algorithm_name, algorithm_id = next(iter(algorithms.items()))
+        ilib.validate_table_selection(self.connection, name, columns, row_filter)
+        options = {"columns": columns, "row_filter": row_filter}
+        # Алгоритмы, отсутствующие в СУБД, рассчитываются на стороне клиента
+        postgresql = self.connection.engine.dialect.name == "postgresql"
+        if server and ilib.server_digest_supported(self.connection, algorithms):
+            digest_mode = "server"
+        elif copy and postgresql:
+            digest_mode = "copy"
+        elif unordered:
+            digest_mode = "unordered"
+        else:
+            digest_mode = "client"
+        marker = ilib.select_change_marker(self.connection, name)
+        digests, count = self._checksum_table(
+            name, pk_field, list(algorithms), digest_mode, **options
         )
+        marker = self._settled_marker(name, marker)
+        digest = digests[algorithm_name]
         database_id = self._get_database_id()
         if not digest:
             raise ilib.ParamError(
@@ -136,23 +465,44 @@ class REPL:
         insert_params = {
             "table_name": name,
             "checksum": digest,
-            "database_id": str(database_id),
-            "algorithm_id": str(algorithm_id),
-            "row_count": str(count),
-            "is_correct": "1",
-            "calculated_at": str(ilib.get_current_timestamp()),
+            "database_id": database_id,
+            "algorithm_id": algorithm_id,
+            "row_count": count,
+            "is_correct": 1,
+            "calculated_at": ilib.get_current_timestamp(),
             "pk_field": pk_field,
+            "digest_mode": digest_mode,
+            "row_format": ilib.ROW_FORMAT,
         }
-        ilib.insert_into_aux_table(
+        if marker:
+            insert_params["change_marker"] = marker
+        pk = ilib.insert_into_aux_table(
             self.aux_connection,
             "tables",
             list(insert_params.keys()),
             list(insert_params.values()),
         )
+        self._insert_extra_checksums("tables", pk, algorithms, digests)
+        if columns or row_filter:
+            ilib.update_table_selection(self.aux_connection, pk, columns, row_filter)
+        if partition:
+            self._save_table_partitions(
+                pk, name, pk_field, list(algorithms), digest_mode, **options
+            )
         self.aux_connection.commit()
         message = f"Таблица {name} добавлена"
         if not pk_field:
             message += '\nПРЕДУПРЕЖДЕНИЕ: в качестве первичного ключа было автоматически выбрано поле "id"'
+        if server and digest_mode != "server":
+            message += (
+                "\nПРЕДУПРЕЖДЕНИЕ: СУБД не поддерживает расчёт контрольной суммы "
+                "по выбранным алгоритмам, она рассчитана на стороне клиента"
+            )
+        elif copy and not postgresql:
+            message += (
+                "\nПРЕДУПРЕЖДЕНИЕ: выгрузка командой COPY поддерживается только "
+                "PostgreSQL, записи получены обычным запросом"
+            )
         return message
 
     def add(
@@ -169,21 +519,41 @@ class REPL:
             self.error = True
             return f'"{what}" не является правильным аргументом для команды "add"'
         try:
-            algo_id = ilib.get_algorithm_id(self.aux_connection, algorithm)
-        except ilib.ParamError as e:
+            algorithms = self._parse_algorithms(algorithm)
+        except ilib.IntegrityLibError as e:
             self.error = True
             return e.message
         backup = "backup" in opt_args
         try:
             if what == "file":
                 watch = "watch" in opt_args
-                return self._add_file(path_or_name, algo_id, algorithm, watch, backup)
+                merkle = "merkle" in opt_args
+                return self._add_file(path_or_name, algorithms, watch, backup, merkle)
             if what == "table":
                 if not self.connection:
                     return "Невозможно добавить таблицу без соединения с базой данных"
-                pk_field = opt_args[0] if opt_args else None
+                # Параметры вида columns=a,b и "where=условие"
+                values = dict(arg.split("=", 1) for arg in opt_args if "=" in arg)
+                pk_args = [
+                    arg for arg in opt_args if arg not in ADD_OPTIONS and "=" not in arg
+                ]
+                pk_field = pk_args[0] if pk_args else None
+                server = "server" in opt_args
+                partition = "partition" in opt_args
+                unordered = "unordered" in opt_args
+                copy = "copy" in opt_args
+                columns = values.get("columns")
                 return self._add_table(
-                    path_or_name, pk_field, algo_id, algorithm, backup
+                    path_or_name,
+                    pk_field,
+                    algorithms,
+                    backup,
+                    server,
+                    partition,
+                    unordered,
+                    columns.split(",") if columns else None,
+                    values.get("where"),
+                    copy,
                 )
         except (ilib.ParamError, ilib.ParamTypeError) as e:
             self.error = True
@@ -213,6 +583,9 @@ class REPL:
             self.error = True
             return f'"{dbms}" не является допустимой СУБД'
         try:
+            if self.connection:
+                self.connection.close()  # Соединение возвращается в пул
+                self.connection = None
             self.connection = ilib.connect_to_db(
                 ilib.make_connection_string(
                     dbms, login, password, host, port, database
@@ -231,59 +604,111 @@ class REPL:
         return f"Доступны следующие алгоритмы:\n{algo_formatted_list}"
 
     def _check_file(self, path: str) -> str:
-        pk, checksum, algorithm_name = ilib.get_reference_checksum(
-            self.aux_connection, "files", ("id", "checksum"), {"path": path}
+        pk, checksum, size, algorithm_name = ilib.get_reference_checksum(
+            self.aux_connection,
+            "files",
+            ("id", "checksum", "file_size"),
+            {"path": path},
         )
+        references = self._get_references("files", pk, checksum, algorithm_name)
         try:
-            file = open(path, "rb")
+            digests, fingerprint = ilib.checksum_file_fingerprinted(
+                path, list(references)
+            )
         except FileNotFoundError:
             self.error = True
             return f'Файл "{path}" не найден'
-        digest = ilib.calculate_checksum(file.read(), algorithm_name)
-        self.last_check_no_error = int(digest, base=16) == int(checksum, base=16)
+        self.last_check_no_error = self._digests_match(digests, references)
         if self.last_check_no_error:
+            if fingerprint:
+                ilib.update_file_fingerprints(self.aux_connection, [(pk, fingerprint)])
+                self.aux_connection.commit()
             return f'Целостность файла "{path}" соблюдена'
         else:
-            ilib.mark_as_incorrect(self.aux_connection, "files", pk)
-            ilib.insert_into_aux_table(
-                self.aux_connection,
-                "file_errors",
-                ["file_id", "checked_at", "manual"],
-                [str(pk), str(ilib.get_current_timestamp()), "1"],
-            )
+            ilib.register_violations(self.aux_connection, "files", [pk])
             self.aux_connection.commit()
-            return f'Целостность файла "{path}" нарушена!'
+            message = f'Целостность файла "{path}" нарушена!'
+            ranges = self._changed_ranges(pk, path, algorithm_name, size)
+            if ranges:
+                message += "\nИзменены байты: " + ", ".join(ranges)
+            return message
 
-    def _check_table(self, name: str) -> str:
-        pk, checksum, pk_field, algorithm_name = ilib.get_reference_checksum(
+    def _check_table(self, name: str, force: bool = False) -> str:
+        (
+            pk,
+            checksum,
+            pk_field,
+            digest_mode,
+            is_correct,
+            change_marker,
+            row_format,
+            column_list,
+            row_filter,
+            algorithm_name,
+        ) = ilib.get_reference_checksum(
             self.aux_connection,
             "tables",
-            ("id", "checksum", "pk_field"),
+            (
+                "id",
+                "checksum",
+                "pk_field",
+                "digest_mode",
+                "is_correct",
+                "change_marker",
+                "row_format",
+                "column_list",
+                "row_filter",
+            ),
             {
                 "table_name": name,
                 "database_id": self._get_database_id(),
             },
         )
-        full_data = ilib.select_all_from_table(self.connection, name, pk_field or "id")
-        digest = ilib.calculate_checksum(
-            bytes(full_data.encode(self.connection.connection.encoding)),
-            algorithm_name,
-        )
-        self.last_check_no_error = int(digest, base=16) == int(checksum, base=16)
+        # Признак берётся до чтения данных и сохраняется, только если
+        # не изменился за время расчёта, см. _settled_marker
+        marker = ilib.select_change_marker(self.connection, name)
+        if not force and is_correct and marker and marker == change_marker:
+            self.last_check_no_error = True
+            return (
+                f'Целостность таблицы "{name}" соблюдена '
+                "(по данным СУБД таблица не изменялась)"
+            )
+        options = self._table_options(row_format, column_list, row_filter)
+        references = self._get_references("tables", pk, checksum, algorithm_name)
+        partitions = ilib.get_table_partitions(self.aux_connection, pk)
+        # Если суммы диапазонов первичного ключа сохранены по всем алгоритмам
+        # таблицы, таблица проверяется по ним: изменённые диапазоны находятся
+        # за то же одно чтение таблицы
+        if partitions is not None and set(references) <= set(partitions[1]):
+            ranges = self._changed_partitions(
+                pk, name, pk_field, digest_mode, **options
+            )
+            self.last_check_no_error = not ranges
+        else:
+            digests, _ = self._checksum_table(
+                name, pk_field, list(references), digest_mode, **options
+            )
+            self.last_check_no_error = self._digests_match(digests, references)
+            ranges = None
+            if not self.last_check_no_error and partitions is not None:
+                ranges = self._changed_partitions(
+                    pk, name, pk_field, digest_mode, **options
+                )
         if self.last_check_no_error:
+            marker = self._settled_marker(name, marker)
+            if marker != change_marker:
+                ilib.update_change_marker(self.aux_connection, pk, marker)
+                self.aux_connection.commit()
             return f'Целостность таблицы "{name}" соблюдена'
         else:
-            ilib.mark_as_incorrect(self.aux_connection, "tables", pk)
-            ilib.insert_into_aux_table(
-                self.aux_connection,
-                "table_errors",
-                ["table_id", "checked_at"],
-                [str(pk), str(ilib.get_current_timestamp())],
-            )
+            ilib.register_violations(self.aux_connection, "tables", [pk])
             self.aux_connection.commit()
-            return f'Целостность таблицы "{name}" нарушена!'
+            message = f'Целостность таблицы "{name}" нарушена!'
+            if ranges:
+                message += "\nИзменены записи: " + "; ".join(ranges)
+            return message
 
-    def check(self, what: str = None, path_or_name: str = None) -> str:
+    def check(self, what: str = None, path_or_name: str = None, *opt_args) -> str:
         if not all([what, path_or_name]):
             self.error = True
             return 'Недостаточно параметров для команды "check"'
@@ -297,7 +722,387 @@ class REPL:
                 if not self.connection:
                     self.error = True
                     return "Невозможно проверить таблицу без соединения с базой данных"
-                return self._check_table(path_or_name)
+                force = "force" in opt_args
+                workers = [arg for arg in opt_args if arg != "force"]
+                table_workers = self.table_workers
+                try:
+                    if workers:
+                        self.table_workers = int(workers[0])
+                except ValueError:
+                    self.error = True
+                    return f'"{workers[0]}" не является допустимым числом соединений'
+                try:
+                    return self._check_table(path_or_name, force)
+                finally:
+                    self.table_workers = table_workers
+        except ilib.IntegrityLibError as e:
+            self.error = True
+            return e.message
+
+    def check_all(self, what: str = None, *opt_args) -> str:
+        if not what:
+            self.error = True
+            return 'Недостаточно параметров для команды "check_all"'
+        if what != "files":
+            self.error = True
+            return f'"{what}" не является правильным аргументом для команды "check_all"'
+        quick = "quick" in opt_args
+        workers = [arg for arg in opt_args if arg != "quick"]
+        try:
+            workers = int(workers[0]) if workers else self.workers
+        except ValueError:
+            self.error = True
+            return f'"{workers[0]}" не является допустимым числом процессов'
+        try:
+            inventory = ilib.select_files_inventory(self.aux_connection)
+            extra_checksums = ilib.get_extra_checksums(self.aux_connection, "files")
+            paths, references = {}, {}
+            skipped = 0
+            for pk, path, checksum, algorithm, is_correct, *fingerprint in inventory:
+                if (
+                    quick
+                    and is_correct
+                    and self._fingerprint_unchanged(path, fingerprint)
+                ):
+                    skipped += 1
+                    continue
+                paths[pk] = path
+                references[pk] = {algorithm: checksum, **extra_checksums.get(pk, {})}
+            tasks = [(pk, paths[pk], tuple(references[pk])) for pk in paths]
+            violated, missing, fingerprints, pending = [], [], [], []
+            total_size = 0
+            started_at = perf_counter()
+            for pk, digests, size, fingerprint in ilib.checksum_files_parallel(
+                tasks, workers
+            ):
+                path = paths[pk]
+                total_size += size
+                if digests is None:
+                    missing.append(path)
+                    continue
+                if self._digests_match(digests, references[pk]):
+                    if fingerprint:
+                        fingerprints.append((pk, fingerprint))
+                    continue
+                violated.append(path)
+                pending.append(pk)
+                if len(pending) >= ilib.BATCH_SIZE:
+                    ilib.register_violations(self.aux_connection, "files", pending)
+                    self.aux_connection.commit()
+                    pending.clear()
+            ilib.register_violations(self.aux_connection, "files", pending)
+            ilib.update_file_fingerprints(self.aux_connection, fingerprints)
+            self.aux_connection.commit()
+            elapsed = perf_counter() - started_at
+        except ilib.IntegrityLibError as e:
+            self.aux_connection.commit()
+            self.error = True
+            return e.message
+        self.last_check_no_error = not violated
+        megabytes = total_size / 1024 / 1024
+        strings = [f'Целостность файла "{path}" нарушена!' for path in violated]
+        strings += [f'Файл "{path}" не найден' for path in missing]
+        strings.append(
+            f"Проверено файлов: {len(tasks)}, нарушена целостность: {len(violated)}, "
+            f"не найдено: {len(missing)}"
+            + (f", пропущено без изменений: {skipped}" if quick else "")
+        )
+        strings.append(
+            f"Обработано {megabytes:.1f} МБ за {elapsed:.2f} с "
+            f"({megabytes / elapsed if elapsed else 0:.1f} МБ/с, "
+            f"{len(tasks) / elapsed if elapsed else 0:.1f} файлов/с)"
+        )
+        return "\n".join(strings)
+
+    @staticmethod
+    def _fingerprint_unchanged(path: str, fingerprint) -> bool:
+        """
+        Совпадает ли сохранённый отпечаток метаданных файла с текущим.
+        :param path:
+        :param fingerprint: значения полей ilib.FINGERPRINT_FIELDS из БД
+        :return:
+        """
+        if None in fingerprint:
+            return False
+        try:
+            return ilib.file_fingerprint(path) == tuple(fingerprint)
+        except OSError:
+            return False
+
+    def quick_check(self, what: str = None, path_or_name: str = None) -> str:
+        if not all([what, path_or_name]):
+            self.error = True
+            return 'Недостаточно параметров для команды "quick_check"'
+        if what != "file":
+            self.error = True
+            return f'"{what}" не является правильным аргументом для команды "quick_check"'
+        try:
+            is_correct, *fingerprint, _ = ilib.get_reference_checksum(
+                self.aux_connection,
+                "files",
+                ("is_correct", *ilib.FINGERPRINT_FIELDS),
+                {"path": path_or_name},
+            )
+            # Отпечатку доверяем, только если последняя проверка прошла успешно
+            if is_correct and self._fingerprint_unchanged(path_or_name, fingerprint):
+                self.last_check_no_error = True
+                return (
+                    f'Целостность файла "{path_or_name}" соблюдена '
+                    "(метаданные не изменились)"
+                )
+            return self._check_file(path_or_name)
+        except ilib.IntegrityLibError as e:
+            self.error = True
+            return e.message
+
+    def _rebaseline_file(self, path: str) -> str:
+        pk, checksum, algorithm_name = ilib.get_reference_checksum(
+            self.aux_connection, "files", ("id", "checksum"), {"path": path}
+        )
+        references = self._get_references("files", pk, checksum, algorithm_name)
+        try:
+            digests, fingerprint = ilib.checksum_file_fingerprinted(
+                path, list(references)
+            )
+        except FileNotFoundError:
+            self.error = True
+            return f'Файл "{path}" не найден'
+        ilib.update_reference_checksums(
+            self.aux_connection,
+            "files",
+            pk,
+            algorithm_name,
+            digests,
+            dict(zip(ilib.FINGERPRINT_FIELDS, fingerprint))
+            if fingerprint
+            # Файл менялся во время расчёта - отпечаток не сохраняется
+            else {"file_size": getsize(path), "st_mtime_ns": None},
+        )
+        if ilib.get_merkle_tree(self.aux_connection, pk) is not None:
+            size = fingerprint[2] if fingerprint else getsize(path)
+            self._save_merkle_tree(pk, path, algorithm_name, size)
+        self.aux_connection.commit()
+        return f'Эталонные контрольные суммы файла "{path}" обновлены'
+
+    def _rebaseline_table(self, name: str) -> str:
+        (
+            pk,
+            checksum,
+            pk_field,
+            digest_mode,
+            column_list,
+            row_filter,
+            algorithm_name,
+        ) = ilib.get_reference_checksum(
+            self.aux_connection,
+            "tables",
+            ("id", "checksum", "pk_field", "digest_mode", "column_list", "row_filter"),
+            {
+                "table_name": name,
+                "database_id": self._get_database_id(),
+            },
+        )
+        # Эталон пересчитывается в текущем формате записей
+        options = self._table_options(ilib.ROW_FORMAT, column_list, row_filter)
+        if digest_mode == "server_concat":
+            digest_mode = "server"
+        references = self._get_references("tables", pk, checksum, algorithm_name)
+        marker = ilib.select_change_marker(self.connection, name)
+        digests, count = self._checksum_table(
+            name, pk_field, list(references), digest_mode, **options
+        )
+        marker = self._settled_marker(name, marker)
+        ilib.update_reference_checksums(
+            self.aux_connection,
+            "tables",
+            pk,
+            algorithm_name,
+            digests,
+            {
+                "row_count": count,
+                "change_marker": marker,
+                "row_format": ilib.ROW_FORMAT,
+                "digest_mode": digest_mode,
+            },
+        )
+        if ilib.get_table_partitions(self.aux_connection, pk) is not None:
+            self._save_table_partitions(
+                pk, name, pk_field, list(references), digest_mode, **options
+            )
+        self.aux_connection.commit()
+        return f'Эталонные контрольные суммы таблицы "{name}" обновлены'
+
+    def rebaseline(self, what: str = None, path_or_name: str = None) -> str:
+        if not all([what, path_or_name]):
+            self.error = True
+            return 'Недостаточно параметров для команды "rebaseline"'
+        if what not in OBJECTS:
+            self.error = True
+            return f'"{what}" не является правильным аргументом для команды "rebaseline"'
+        try:
+            if what == "file":
+                return self._rebaseline_file(path_or_name)
+            if what == "table":
+                if not self.connection:
+                    self.error = True
+                    return "Невозможно обновить таблицу без соединения с базой данных"
+                return self._rebaseline_table(path_or_name)
+        except ilib.IntegrityLibError as e:
+            self.error = True
+            return e.message
+
+    def _locate_table(self, name: str) -> str:
+        (
+            pk,
+            pk_field,
+            digest_mode,
+            row_format,
+            column_list,
+            row_filter,
+            _,
+        ) = ilib.get_reference_checksum(
+            self.aux_connection,
+            "tables",
+            (
+                "id",
+                "pk_field",
+                "digest_mode",
+                "row_format",
+                "column_list",
+                "row_filter",
+            ),
+            {
+                "table_name": name,
+                "database_id": self._get_database_id(),
+            },
+        )
+        ranges = self._changed_partitions(
+            pk,
+            name,
+            pk_field,
+            digest_mode,
+            **self._table_options(row_format, column_list, row_filter),
+        )
+        if ranges is None:
+            self.error = True
+            return f'Для таблицы "{name}" не построены диапазоны первичного ключа'
+        if not ranges:
+            return f'Изменений в таблице "{name}" не обнаружено'
+        return f'Изменены записи таблицы "{name}": ' + "; ".join(ranges)
+
+    def locate(self, what: str = None, path: str = None) -> str:
+        if not all([what, path]):
+            self.error = True
+            return 'Недостаточно параметров для команды "locate"'
+        if what not in OBJECTS:
+            self.error = True
+            return f'"{what}" не является правильным аргументом для команды "locate"'
+        if what == "table":
+            if not self.connection:
+                self.error = True
+                return "Невозможно проверить таблицу без соединения с базой данных"
+            try:
+                return self._locate_table(path)
+            except ilib.IntegrityLibError as e:
+                self.error = True
+                return e.message
+        try:
+            pk, size, algorithm_name = ilib.get_reference_checksum(
+                self.aux_connection, "files", ("id", "file_size"), {"path": path}
+            )
+            ranges = self._changed_ranges(pk, path, algorithm_name, size)
+        except FileNotFoundError:
+            self.error = True
+            return f'Файл "{path}" не найден'
+        except ilib.IntegrityLibError as e:
+            self.error = True
+            return e.message
+        if ranges is None:
+            self.error = True
+            return f'Для файла "{path}" не построено дерево Меркла'
+        if not ranges:
+            return f'Изменений в файле "{path}" не обнаружено'
+        return f'Изменены байты файла "{path}": ' + ", ".join(ranges)
+
+    def _append_file(self, path: str, verify: bool = False) -> str:
+        pk, size, checksum, is_correct, algorithm_name = ilib.get_reference_checksum(
+            self.aux_connection,
+            "files",
+            ("id", "file_size", "checksum", "is_correct"),
+            {"path": path},
+        )
+        tree = ilib.get_merkle_tree(self.aux_connection, pk)
+        if tree is None:
+            self.error = True
+            return f'Для файла "{path}" не построено дерево Меркла'
+        if not is_correct:
+            self.error = True
+            return f'Целостность файла "{path}" нарушена, дописывание не принимается'
+        chunk_size, leaves, root = tree
+        if ilib.merkle_root(leaves, algorithm_name) != root:
+            raise ilib.DatabaseError("Дерево Меркла файла повреждено")
+        fingerprint = ilib.file_fingerprint(path)
+        new_size = fingerprint[2]
+        if new_size < size:
+            self.error = True
+            return f'Размер файла "{path}" уменьшился, дописывание не принимается'
+        # Суммы по COMBINABLE_ALGORITHMS продлеваются без чтения прежней части
+        # файла, остальные (и все при verify) проверяются по ней целиком;
+        # листья прочитанных блоков сверяются с сохранёнными
+        references = self._get_references("files", pk, checksum, algorithm_name)
+        first_leaf, prefix, digests, old_leaves, new_leaves = ilib.extend_checksums(
+            path, references, size, new_size, algorithm_name, chunk_size, verify
+        )
+        ranges = ilib.merkle_changed_ranges(
+            leaves, leaves[:first_leaf] + old_leaves, chunk_size, size, size
+        )
+        if ranges or not self._digests_match(
+            prefix, {name: references[name] for name in prefix}
+        ):
+            self.last_check_no_error = False
+            ilib.register_violations(self.aux_connection, "files", [pk])
+            self.aux_connection.commit()
+            message = f'Целостность файла "{path}" нарушена!'
+            if ranges:
+                message += "\nИзменены байты: " + ", ".join(
+                    f"{start}-{end - 1}" for start, end in ranges
+                )
+            return message
+        leaves = leaves[:first_leaf] + new_leaves
+        ilib.update_reference_checksums(
+            self.aux_connection,
+            "files",
+            pk,
+            algorithm_name,
+            digests,
+            dict(zip(ilib.FINGERPRINT_FIELDS, fingerprint))
+            if ilib.file_fingerprint(path) == fingerprint
+            # Файл продолжает дописываться - принимается только прочитанная часть
+            else {"file_size": new_size, "st_mtime_ns": None},
+        )
+        ilib.save_merkle_tree(
+            self.aux_connection,
+            pk,
+            chunk_size,
+            leaves,
+            ilib.merkle_root(leaves, algorithm_name),
+        )
+        self.aux_connection.commit()
+        self.last_check_no_error = True
+        return f'Дописанные в файл "{path}" данные приняты ({new_size - size} байт)'
+
+    def append(self, what: str = None, path: str = None, *opt_args) -> str:
+        if not all([what, path]):
+            self.error = True
+            return 'Недостаточно параметров для команды "append"'
+        if what != "file":
+            self.error = True
+            return f'"{what}" не является правильным аргументом для команды "append"'
+        try:
+            return self._append_file(path, "verify" in opt_args)
+        except FileNotFoundError:
+            self.error = True
+            return f'Файл "{path}" не найден'
         except ilib.IntegrityLibError as e:
             self.error = True
             return e.message
@@ -348,7 +1153,6 @@ class REPL:
                     self.aux_connection,
                     "files",
                     "path",
-                    "file_id",
                 )
                 header = "Файл"
             if what == "tables":
@@ -356,12 +1160,11 @@ class REPL:
                     self.aux_connection,
                     "tables",
                     "table_name",
-                    "table_id",
                 )
                 header = "Таблица"
             results = [
                 (name, datetime.fromtimestamp(checked_at))
-                for name, checked_at in results
+                for name, checked_at, _ in results
                 if checked_at is not None
             ]
             return tabulate(results, (header, "Дата проверки"), "github")
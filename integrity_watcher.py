@@ -1,3 +1,5 @@
+import sqlite3
+from queue import Empty, Queue
 from sys import platform
 
 from watchdog.events import FileClosedEvent, PatternMatchingEventHandler
@@ -7,26 +9,52 @@ import integrity_lib as ilib
 
 
 class DatabaseEventHandler(PatternMatchingEventHandler):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending = Queue()  # Пути изменённых файлов до записи в БД
+
     def on_any_event(self, event):
         if not isinstance(event, FileClosedEvent):
-            with ilib.connect_to_auxiliary_db() as connection:
-                try:
-                    pk = ilib.select_file_id(connection, event.src_path)
-                    ilib.mark_as_incorrect(connection, "files", pk)
-                    ilib.insert_into_aux_table(
-                        connection,
-                        "file_errors",
-                        ["file_id", "checked_at", "manual"],
-                        [str(pk), str(ilib.get_current_timestamp()), "0"],
-                    )
-                    connection.commit()
-                except ilib.IntegrityLibError:
-                    pass
+            self.pending.put(event.src_path)
+
+    def flush(self, connection: sqlite3.Connection):
+        """
+        Регистрация нарушений целостности файлов, события изменения которых
+        накоплены с предыдущего вызова; повторные события одного файла
+        дают одну запись в журнале ошибок. Пути файлов, нарушения которых
+        записать не удалось, возвращаются в очередь до следующего вызова.
+        :param connection:
+        :return:
+        """
+        paths = set()
+        while True:
+            try:
+                paths.add(self.pending.get_nowait())
+            except Empty:
+                break
+        if not paths:
+            return
+        # Записываются порциями по BATCH_SIZE файлов, каждая в своей транзакции
+        unsaved = list(paths)
+        try:
+            file_ids = list(ilib.select_file_ids(connection, paths).items())
+            unsaved = [path for path, _ in file_ids]
+            for start in range(0, len(file_ids), ilib.BATCH_SIZE):
+                batch = file_ids[start : start + ilib.BATCH_SIZE]
+                ilib.register_violations(
+                    connection, "files", [pk for _, pk in batch], manual=False
+                )
+                connection.commit()
+                unsaved = unsaved[len(batch) :]
+        except ilib.IntegrityLibError:
+            connection.rollback()
+            for path in unsaved:
+                self.pending.put(path)
 
 
 def main():
-    with ilib.connect_to_auxiliary_db() as connection:
-        file_paths = ilib.select_watched_files(connection)
+    connection = ilib.get_auxiliary_db()
+    file_paths = ilib.select_watched_files(connection)
     observer = Observer()
     event_handler = DatabaseEventHandler(file_paths, ignore_directories=True)
     observer.schedule(event_handler, "E:\\", recursive=True)
@@ -34,9 +62,12 @@ def main():
     try:
         while observer.is_alive():
             observer.join(1)
+            event_handler.flush(connection)
     finally:
         observer.stop()
         observer.join()
+        event_handler.flush(connection)
+        ilib.close_auxiliary_db()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,236 @@
+import os
+import threading
+import unittest
+import zlib
+from concurrent.futures import Future
+from queue import Queue
+
+import integrity_gost
+import integrity_lib as ilib
+
+try:
+    import pygost
+except ImportError:
+    pygost = None
+
+# ГОСТ Р 34.11-2012, RFC 6986 (раздел 10): сообщения M1, M2 и значения
+# хэш-функции; в RFC они записаны от старшего байта, т.е. в обратном порядке
+RFC6986_M1 = b"012345678901234567890123456789012345678901234567890123456789012"
+RFC6986_M2 = bytes.fromhex(
+    "fbe2e5f0eee3c820fbeafaebef20fffbf0e1e0f0f520e0ed20e8ece0ebe5f0f2f120fff0"
+    "eeec20f120faf2fee5e2202ce8f6f3ede220e8e6eee1e8f0f2d1202ce8f0f2e5e220e5d1"
+)[::-1]
+RFC6986_VECTORS = {
+    ("gost_512", RFC6986_M1): (
+        "486f64c1917879417fef082b3381a4e211c324f074654c38823a7b76f830ad00"
+        "fa1fbae42b1285c0352f227524bc9ab16254288dd6863dccd5b9f54a1ad0541b"
+    ),
+    ("gost_256", RFC6986_M1): (
+        "00557be5e584fd52a449b16b0251d05d27f94ab76cbaa6da890b59d8ef1e159d"
+    ),
+    ("gost_512", RFC6986_M2): (
+        "28fbc9bada033b1460642bdcddb90c3fb3e56c497ccd0f62b8a2ad4935e85f03"
+        "7613966de4ee00531ae60f3b5a47f8dae06915d5f2f194996fcabf2622e6881e"
+    ),
+    ("gost_256", RFC6986_M2): (
+        "508f7e553c06501d749a66fc28c6cac0b005746d97537fa85d9e40904efed29d"
+    ),
+}
+# ГОСТ Р 34.11-94 с узлами замены id-GostR3411-94-CryptoProParamSet
+GOST94_CRYPTOPRO_VECTORS = {
+    b"": "981e5f3ca30c841487830f84fb433e13ac1101569b9c13584ac483234cd656c0",
+    b"a": "e74c52dd282183bf37af0079c9f78055715a103f17e3133ceff1aacf2f403011",
+    b"abc": "b285056dbf18d7392d7677369524dd14747459ed8143997e163b2986f92fd42c",
+    b"message digest": (
+        "bc6041dd2aa401ebfa6e9886734174febdb4729aa972d60f549ac39b29721ba0"
+    ),
+    b"The quick brown fox jumps over the lazy dog": (
+        "9004294a361a508c586fe53d1f1b02746765e71b765472786e4770d565830a76"
+    ),
+}
+# CRC-64 по ISO 3309 с нулевыми начальным значением и итоговой маской
+CRC64_VECTORS = {
+    b"": "0000000000000000",
+    b"a": "5bb0000000000000",
+    b"123456789": "46a5a9388a5beffe",
+    b"The quick brown fox jumps over the lazy dog": "b10eb1b03e5a1d71",
+}
+
+
+class GostTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = ilib.GOST_BACKEND
+        ilib.GOST_BACKEND = "tables"
+
+    def tearDown(self):
+        ilib.GOST_BACKEND = self.backend
+
+    def test_streebog_rfc6986(self):
+        for (algorithm, message), expected in RFC6986_VECTORS.items():
+            with self.subTest(algorithm=algorithm, message=message[:8]):
+                digest = integrity_gost.new(algorithm, message).digest()
+                self.assertEqual(digest[::-1].hex(), expected)
+                self.assertEqual(
+                    ilib.calculate_checksum(message, algorithm), digest.hex()
+                )
+
+    def test_gost94_cryptopro(self):
+        for message, expected in GOST94_CRYPTOPRO_VECTORS.items():
+            with self.subTest(message=message):
+                self.assertEqual(
+                    integrity_gost.new("gost94", message).hexdigest(), expected
+                )
+                self.assertEqual(ilib.calculate_checksum(message, "gost94"), expected)
+
+    def test_streaming_matches_single_call(self):
+        data = os.urandom(1000)
+        for algorithm in ilib.GOST_ALGORITHMS:
+            with self.subTest(algorithm=algorithm):
+                hasher = integrity_gost.new(algorithm)
+                for start in range(0, len(data), 77):
+                    hasher.update(data[start : start + 77])
+                copy = hasher.copy()
+                self.assertEqual(
+                    hasher.digest(), integrity_gost.new(algorithm, data).digest()
+                )
+                copy.update(b"x")
+                self.assertEqual(
+                    copy.digest(), integrity_gost.new(algorithm, data + b"x").digest()
+                )
+
+
+@unittest.skipIf(pygost is None, "pygost не установлен")
+class GostBackendTest(unittest.TestCase):
+    def test_backends_match(self):
+        data = os.urandom(10000)
+        for algorithm in ilib.GOST_ALGORITHMS:
+            # Границы блоков: 32 байта для ГОСТ Р 34.11-94, 64 - для Стрибога
+            for size in (0, 1, 31, 32, 33, 63, 64, 65, 1000, len(data)):
+                with self.subTest(algorithm=algorithm, size=size):
+                    digests = []
+                    for backend in ("tables", "pygost"):
+                        hasher = ilib.Hasher(algorithm, backend)
+                        for start in range(0, size, 77):
+                            hasher.update(data[start : min(start + 77, size)])
+                        digests.append(hasher.finalize())
+                    self.assertEqual(digests[0], digests[1])
+
+
+class OffloadedHasherTest(unittest.TestCase):
+    def setUp(self):
+        self.gost_pool = ilib._gost_pool
+        self.offloaded_hasher = ilib.OffloadedHasher
+        self.slots = threading.BoundedSemaphore(1)
+        ilib._gost_pool = lambda: (None, None, self.slots)
+
+    def tearDown(self):
+        ilib._gost_pool = self.gost_pool
+        ilib.OffloadedHasher = self.offloaded_hasher
+
+    def test_update_after_worker_exit(self):
+        # Процесс расчёта завершился с ошибкой, очередь к нему заполнена
+        self.slots.acquire()
+        hasher = ilib.OffloadedHasher.__new__(ilib.OffloadedHasher)
+        hasher.algorithm = "gost_256"
+        hasher._slots = self.slots
+        hasher._chunks = Queue(1)
+        hasher._chunks.put(b"x")
+        hasher._future = Future()
+        hasher._future.set_exception(RuntimeError())
+        hasher._finished = False
+        with self.assertRaises(ilib.ParamError):
+            hasher.update(b"y")
+        self.assertTrue(self.slots.acquire(blocking=False))
+
+    def test_slot_released_on_constructor_error(self):
+        def offloaded_hasher(algorithm):
+            raise RuntimeError()
+
+        ilib.OffloadedHasher = offloaded_hasher
+        with self.assertRaises(RuntimeError):
+            ilib.make_hasher("gost_256", ilib.GOST_OFFLOAD_MIN_SIZE)
+        self.assertTrue(self.slots.acquire(blocking=False))
+
+
+class Crc64Test(unittest.TestCase):
+    def test_known_answers(self):
+        for message, expected in CRC64_VECTORS.items():
+            with self.subTest(message=message):
+                self.assertEqual(ilib.calculate_checksum(message, "crc64"), expected)
+
+    def test_vectorized_matches_scalar(self):
+        for size in (ilib.CRC64_NP_MIN_SIZE - 1, ilib.CRC64_NP_MIN_SIZE, 100003):
+            with self.subTest(size=size):
+                data = os.urandom(size)
+                self.assertEqual(
+                    ilib.Crc64(data).crc,
+                    ilib._crc64_update_scalar(0, memoryview(data)),
+                )
+
+    def test_streaming_matches_single_call(self):
+        data = os.urandom(300000)
+        crc = ilib.Crc64()
+        for start in range(0, len(data), 65537):
+            crc.update(data[start : start + 65537])
+        self.assertEqual(crc.hexdigest(), ilib.Crc64(data).hexdigest())
+
+
+class CombineTest(unittest.TestCase):
+    def test_combine_matches_sequential(self):
+        first, second = os.urandom(1000), os.urandom(70001)
+        for algorithm in ilib.COMBINABLE_ALGORITHMS:
+            for tail in (second, b""):
+                with self.subTest(algorithm=algorithm, length=len(tail)):
+                    self.assertEqual(
+                        int(
+                            ilib.combine_checksums(
+                                algorithm,
+                                ilib.calculate_checksum(first, algorithm),
+                                ilib.calculate_checksum(tail, algorithm),
+                                len(tail),
+                            ),
+                            16,
+                        ),
+                        int(ilib.calculate_checksum(first + tail, algorithm), 16),
+                    )
+
+    def test_combine_functions(self):
+        first, second = os.urandom(333), os.urandom(4444)
+        self.assertEqual(
+            ilib.combine_crc32(zlib.crc32(first), zlib.crc32(second), len(second)),
+            zlib.crc32(first + second),
+        )
+        self.assertEqual(
+            ilib.combine_adler32(
+                zlib.adler32(first), zlib.adler32(second), len(second)
+            ),
+            zlib.adler32(first + second),
+        )
+        self.assertEqual(
+            ilib.combine_crc64(
+                ilib.Crc64(first).crc, ilib.Crc64(second).crc, len(second)
+            ),
+            ilib.Crc64(first + second).crc,
+        )
+
+    def test_hasher_combine(self):
+        parts = [os.urandom(size) for size in (10, 20000, 1, 9000)]
+        for algorithm in ilib.COMBINABLE_ALGORITHMS:
+            with self.subTest(algorithm=algorithm):
+                hasher = ilib.Hasher(algorithm)
+                for part in parts:
+                    other = ilib.Hasher(algorithm)
+                    other.update(part)
+                    hasher.combine(other, len(part))
+                self.assertEqual(
+                    hasher.finalize(),
+                    ilib.calculate_checksum(b"".join(parts), algorithm),
+                )
+
+    def test_not_combinable(self):
+        with self.assertRaises(ilib.ParamError):
+            ilib.combine_checksums("sha256", "00", "00", 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import integrity_lib as ilib
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class MigrationTest(unittest.TestCase):
+    """
+    Обновление схемы вспомогательной БД, созданной по db_init.sql
+    до всех изменений MIGRATIONS.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.aux_db_path = ilib.AUX_DB_PATH
+        ilib.AUX_DB_PATH = os.path.join(self.directory.name, "integrity_db.db")
+        with open(os.path.join(PACKAGE_DIR, "db_init.sql")) as init_script:
+            baseline = sqlite3.connect(ilib.AUX_DB_PATH)
+            baseline.executescript(init_script.read())
+        # Повторные записи, которые раньше не исключались уникальными индексами
+        baseline.executescript(
+            """
+            INSERT INTO databases (id, connection) VALUES
+                (1, 'db'), (2, 'db'), (3, 'other');
+            INSERT INTO files (id, path, is_correct) VALUES
+                (1, 'a', 0), (2, 'a', 1), (3, 'b', 1);
+            INSERT INTO file_errors (file_id, checked_at, manual) VALUES
+                (1, 10, 1), (1, 30, 0), (2, 50, 1);
+            INSERT INTO tables (id, database_id, table_name, is_correct) VALUES
+                (1, 1, 't', 0), (2, 2, 't', 0), (3, 3, 't', 0);
+            INSERT INTO table_errors (table_id, checked_at) VALUES
+                (1, 5), (2, 7), (3, 20), (3, 40);
+            """
+        )
+        baseline.commit()
+        baseline.close()
+        self.cwd = os.getcwd()
+        os.chdir(PACKAGE_DIR)
+        self.connection = ilib.connect_to_auxiliary_db()
+
+    def tearDown(self):
+        self.connection.close()
+        ilib.AUX_DB_PATH = self.aux_db_path
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def select(self, query: str) -> list:
+        return self.connection.execute(query).fetchall()
+
+    def counters(self, table: str) -> list:
+        return self.select(
+            f"SELECT id, last_error_at, error_count FROM {table} ORDER BY id;"
+        )
+
+    def test_user_version(self):
+        self.assertEqual(self.select("PRAGMA user_version;"), [(len(ilib.MIGRATIONS),)])
+
+    def test_duplicates_removed(self):
+        self.assertEqual(
+            self.select("SELECT id FROM databases ORDER BY id;"), [(1,), (3,)]
+        )
+        self.assertEqual(self.select("SELECT id FROM files ORDER BY id;"), [(1,), (3,)])
+        self.assertEqual(
+            self.select("SELECT file_id, checked_at FROM file_errors ORDER BY id;"),
+            [(1, 10), (1, 30)],
+        )
+        # Таблица повторного соединения переносится на первое из них
+        self.assertEqual(
+            self.select("SELECT id, database_id FROM tables ORDER BY id;"),
+            [(1, 1), (3, 3)],
+        )
+        self.assertEqual(
+            self.select("SELECT table_id, checked_at FROM table_errors ORDER BY id;"),
+            [(1, 5), (3, 20), (3, 40)],
+        )
+
+    def test_error_counters_backfilled(self):
+        self.assertEqual(self.counters("files"), [(1, 30, 2), (3, None, 0)])
+        self.assertEqual(self.counters("tables"), [(1, 5, 1), (3, 40, 2)])
+
+    def test_error_counters_triggers(self):
+        self.connection.execute(
+            "INSERT INTO file_errors (file_id, checked_at, manual) VALUES (3, 60, 1);"
+        )
+        self.connection.execute("DELETE FROM file_errors WHERE checked_at = 30;")
+        self.connection.execute(
+            "INSERT INTO table_errors (table_id, checked_at) VALUES (1, 3);"
+        )
+        self.assertEqual(self.counters("files"), [(1, 10, 1), (3, 60, 1)])
+        self.assertEqual(self.counters("tables"), [(1, 5, 2), (3, 40, 2)])
+        # Журналы ошибок удаляются каскадно вместе с объектами
+        self.connection.execute("DELETE FROM files WHERE id = 1;")
+        self.connection.execute("DELETE FROM databases WHERE id = 3;")
+        self.assertEqual(self.select("SELECT file_id FROM file_errors;"), [(3,)])
+        self.assertEqual(
+            self.select("SELECT DISTINCT table_id FROM table_errors;"), [(1,)]
+        )
+        self.assertEqual(self.counters("tables"), [(1, 5, 2)])
+
+
+if __name__ == "__main__":
+    unittest.main()
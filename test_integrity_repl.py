@@ -0,0 +1,329 @@
+import os
+import tempfile
+import types
+import unittest
+
+from sqlalchemy import create_engine, text
+
+import integrity_lib as ilib
+from integrity_repl import REPL
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class ReplConnection:
+    """
+    Соединение SQLAlchemy с SQLite в роли соединения REPL с защищаемой БД:
+    кодировка соединения DB-API берётся из connection.connection.encoding.
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+        self.connection = types.SimpleNamespace(encoding="utf8")
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class ReplTestCase(unittest.TestCase):
+    """
+    REPL со вспомогательной БД во временном каталоге и защищаемой БД SQLite.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        self.aux_db_path = ilib.AUX_DB_PATH
+        # db_init.sql открывается из текущего каталога
+        os.chdir(PACKAGE_DIR)
+        ilib.close_auxiliary_db()
+        ilib.AUX_DB_PATH = os.path.join(self.directory.name, "integrity_db.db")
+        self.engine = create_engine(
+            f"sqlite:///{self.directory.name}/protected.db",
+            connect_args={"check_same_thread": False},
+        )
+        self.connection = self.engine.connect()
+        self.repl = REPL()
+        self.repl.connection = ReplConnection(self.connection)
+        self.repl.aux_connection.execute(
+            "INSERT INTO databases (id, connection) VALUES (1, 'protected');"
+        )
+        self.repl.aux_connection.commit()
+        self.repl._get_database_id = lambda: 1
+
+    def tearDown(self):
+        ilib.close_auxiliary_db()
+        ilib.AUX_DB_PATH = self.aux_db_path
+        self.connection.close()
+        self.engine.dispose()
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def execute(self, *statements: str):
+        for statement in statements:
+            self.connection.execute(text(statement))
+
+    def select_table(self, name: str, field: str):
+        return self.repl.aux_connection.execute(
+            f"SELECT {field} FROM tables WHERE table_name = ?;", (name,)
+        ).fetchone()[0]
+
+
+class RowFormatTest(ReplTestCase):
+    def setUp(self):
+        super().setUp()
+        self.execute(
+            "CREATE TABLE t (id INTEGER PRIMARY KEY, a TEXT, b TEXT);",
+            "CREATE TABLE u (id INTEGER PRIMARY KEY, a TEXT, b TEXT);",
+            "INSERT INTO t VALUES (1, 'ab', 'c');",
+            "INSERT INTO u VALUES (1, 'a', 'bc');",
+        )
+
+    def checksum(self, name: str, row_format: int) -> str:
+        return ilib.checksum_table(
+            self.connection, name, "id", "md5", row_format=row_format
+        )[0]
+
+    def test_binary_format_is_unambiguous(self):
+        self.assertEqual(
+            self.checksum("t", ilib.ROW_FORMAT_TEXT),
+            self.checksum("u", ilib.ROW_FORMAT_TEXT),
+        )
+        self.assertNotEqual(
+            self.checksum("t", ilib.ROW_FORMAT_BINARY),
+            self.checksum("u", ilib.ROW_FORMAT_BINARY),
+        )
+
+    def test_rebaseline_upgrades_row_format(self):
+        self.repl.add("md5", "table", "t", "id")
+        self.assertEqual(self.select_table("t", "row_format"), ilib.ROW_FORMAT_BINARY)
+        # Эталон, рассчитанный до появления двоичного формата
+        self.repl.aux_connection.execute(
+            "UPDATE tables SET checksum = ?, row_format = ? WHERE table_name = 't';",
+            (self.checksum("t", ilib.ROW_FORMAT_TEXT), ilib.ROW_FORMAT_TEXT),
+        )
+        self.repl.aux_connection.commit()
+        self.repl.check("table", "t", "force")
+        self.assertTrue(self.repl.last_check_no_error)
+        self.repl.rebaseline("table", "t")
+        self.assertEqual(self.select_table("t", "row_format"), ilib.ROW_FORMAT_BINARY)
+        self.assertEqual(
+            self.select_table("t", "checksum"),
+            self.checksum("t", ilib.ROW_FORMAT_BINARY),
+        )
+        self.execute("UPDATE t SET a = 'a', b = 'bc';")
+        self.repl.check("table", "t", "force")
+        self.assertFalse(self.repl.last_check_no_error)
+
+
+class SelectionTest(ReplTestCase):
+    def setUp(self):
+        super().setUp()
+        self.execute(
+            "CREATE TABLE t (id INTEGER PRIMARY KEY, a TEXT, b TEXT);",
+            "INSERT INTO t VALUES (1, '10:00', 'x');",
+            "INSERT INTO t VALUES (2, '11:00', 'y');",
+        )
+
+    def assert_rejected(self, *opt_args: str):
+        message = self.repl.add("md5", "table", "t", "id", *opt_args)
+        self.assertTrue(self.repl.error, message)
+        self.repl.error = False
+        self.assertIsNone(
+            self.repl.aux_connection.execute(
+                "SELECT id FROM tables WHERE table_name = 't';"
+            ).fetchone()
+        )
+
+    def test_rejects_statement_separator(self):
+        self.assert_rejected("where=a = 'x'; DROP TABLE t")
+
+    def test_rejects_invalid_condition(self):
+        self.assert_rejected("where=c = 1")
+        self.assert_rejected("where=a = 'x') OR (")
+
+    def test_rejects_column_names(self):
+        self.assert_rejected('columns=a,b"')
+        self.assert_rejected("columns=a,,b")
+        self.assert_rejected("columns=a,c")
+
+    def test_valid_selection(self):
+        self.repl.add("md5", "table", "t", "id", "columns=id,a", "where=a > '10:30'")
+        self.assertFalse(self.repl.error)
+        self.assertEqual(self.select_table("t", "column_list"), "id,a")
+        self.assertEqual(self.select_table("t", "row_count"), 1)
+
+
+class PartitionTest(ReplTestCase):
+    def setUp(self):
+        super().setUp()
+        self.partition_rows = ilib.PARTITION_ROWS
+        ilib.PARTITION_ROWS = 10
+        self.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, a TEXT);")
+        for i in range(40):
+            self.execute(f"INSERT INTO t VALUES ({i}, 'v{i}');")
+        self.repl.add("crc32,sha256", "table", "t", "id", "partition")
+        self.table_id = self.select_table("t", "id")
+        # Условия всех запросов к таблице: None - чтение таблицы целиком
+        self.conditions = []
+        self.checksum_table = ilib.checksum_table
+
+        def checksum_table(*args, **kwargs):
+            self.conditions.append(kwargs.get("condition"))
+            return self.checksum_table(*args, **kwargs)
+
+        ilib.checksum_table = checksum_table
+
+    def tearDown(self):
+        ilib.checksum_table = self.checksum_table
+        ilib.PARTITION_ROWS = self.partition_rows
+        super().tearDown()
+
+    def test_partitions_cover_all_algorithms(self):
+        partitions, roots = ilib.get_table_partitions(
+            self.repl.aux_connection, self.table_id
+        )
+        self.assertEqual(set(roots), {"crc32", "sha256"})
+        self.assertEqual(len(partitions), 4)
+        for _, checksums, count in partitions:
+            self.assertEqual(set(checksums), {"crc32", "sha256"})
+            self.assertEqual(count, 10)
+
+    def test_check_reads_table_once(self):
+        self.execute("UPDATE t SET a = 'x' WHERE id = 25;")
+        message = self.repl.check("table", "t", "force")
+        self.assertFalse(self.repl.last_check_no_error)
+        self.assertIn("20 <= id < 30", message)
+        self.assertEqual(len(self.conditions), 4)
+        self.assertNotIn(None, self.conditions)
+
+    def test_check_compares_extra_algorithm(self):
+        # Сохранённая сумма диапазона по SHA-256 (и корень) не совпадает
+        # с данными, а сумма по CRC-32 совпадает
+        self.repl.aux_connection.execute(
+            "UPDATE table_partition_checksums SET checksum = ? WHERE id = ("
+            "SELECT c.id FROM table_partition_checksums c "
+            "INNER JOIN table_partitions p ON p.id = c.partition_id "
+            "WHERE p.table_id = ? AND p.lower_bound = 10);",
+            ("0" * 64, self.table_id),
+        )
+        partitions, _ = ilib.get_table_partitions(
+            self.repl.aux_connection, self.table_id
+        )
+        self.repl.aux_connection.execute(
+            "UPDATE table_checksums SET partition_root = ? WHERE table_id = ?;",
+            (
+                ilib.merkle_root(
+                    [checksums["sha256"] for _, checksums, _ in partitions], "sha256"
+                ),
+                self.table_id,
+            ),
+        )
+        self.repl.aux_connection.commit()
+        message = self.repl.check("table", "t", "force")
+        self.assertFalse(self.repl.last_check_no_error)
+        self.assertIn("10 <= id < 20", message)
+
+    def test_partitions_without_extra_algorithm(self):
+        # Диапазоны, построенные до появления сумм по дополнительным алгоритмам
+        self.repl.aux_connection.execute("DELETE FROM table_partition_checksums;")
+        self.repl.aux_connection.execute(
+            "UPDATE table_checksums SET partition_root = NULL;"
+        )
+        self.repl.aux_connection.commit()
+        self.execute("UPDATE t SET a = 'x' WHERE id = 5;")
+        message = self.repl.check("table", "t", "force")
+        self.assertFalse(self.repl.last_check_no_error)
+        self.assertIn("id < 10", message)
+        self.assertEqual(self.conditions[0], None)
+
+    def test_corrupted_partition_root(self):
+        self.repl.aux_connection.execute(
+            "UPDATE table_checksums SET partition_root = '00' WHERE table_id = ?;",
+            (self.table_id,),
+        )
+        self.repl.aux_connection.commit()
+        message = self.repl.check("table", "t", "force")
+        self.assertTrue(self.repl.error)
+        self.assertIn("Контрольные суммы диапазонов таблицы повреждены", message)
+
+
+class AppendTest(ReplTestCase):
+    def setUp(self):
+        super().setUp()
+        self.merkle_chunk_size = ilib.MERKLE_CHUNK_SIZE
+        ilib.MERKLE_CHUNK_SIZE = 16
+        self.path = os.path.join(self.directory.name, "log")
+        self.data = bytes(range(100))
+        with open(self.path, "wb") as file:
+            file.write(self.data)
+        # Смещения всех чтений файла
+        self.offsets = []
+        self.hash_range = ilib._hash_range
+
+        def hash_range(path, hasher, offset, length, *args):
+            self.offsets.append(offset)
+            return self.hash_range(path, hasher, offset, length, *args)
+
+        ilib._hash_range = hash_range
+
+    def tearDown(self):
+        ilib._hash_range = self.hash_range
+        ilib.MERKLE_CHUNK_SIZE = self.merkle_chunk_size
+        super().tearDown()
+
+    def add(self, algorithm: str):
+        self.repl.add(algorithm, "file", self.path, "merkle")
+        self.offsets.clear()
+
+    def write(self, offset: int, data: bytes):
+        with open(self.path, "r+b") as file:
+            file.seek(offset)
+            file.write(data)
+        self.data = self.data[:offset] + data + self.data[offset + len(data) :]
+
+    def assert_accepted(self, message: str, algorithm: str):
+        self.assertTrue(self.repl.last_check_no_error, message)
+        pk, checksum = self.repl.aux_connection.execute(
+            "SELECT id, checksum FROM files WHERE path = ?;", (self.path,)
+        ).fetchone()
+        self.assertEqual(
+            int(checksum, 16), int(ilib.calculate_checksum(self.data, algorithm), 16)
+        )
+        _, leaves, _ = ilib.get_merkle_tree(self.repl.aux_connection, pk)
+        self.assertEqual(leaves, ilib.merkle_leaves(self.path, algorithm, 16))
+
+    def test_combinable_reads_tail_once(self):
+        self.add("crc32")
+        self.write(100, b"tail" * 10)
+        message = self.repl.append("file", self.path)
+        # Чтение с блока, содержащего прежний конец файла, без повторов
+        self.assertEqual(self.offsets, [96, 100])
+        self.assert_accepted(message, "crc32")
+
+    def test_changed_boundary_block(self):
+        self.add("crc32")
+        self.write(98, b"xx" + b"tail")
+        message = self.repl.append("file", self.path)
+        self.assertFalse(self.repl.last_check_no_error)
+        self.assertIn("96-99", message)
+
+    def test_verify_reads_prefix(self):
+        self.add("crc32")
+        self.write(10, b"x")
+        self.write(100, b"tail")
+        message = self.repl.append("file", self.path, "verify")
+        self.assertEqual(self.offsets, [0, 100])
+        self.assertFalse(self.repl.last_check_no_error)
+        self.assertIn("0-15", message)
+
+    def test_not_combinable_reads_prefix(self):
+        self.add("sha256")
+        self.write(100, b"tail")
+        message = self.repl.append("file", self.path)
+        self.assertEqual(self.offsets, [0, 100])
+        self.assert_accepted(message, "sha256")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,266 @@
+import hashlib
+import os
+import tempfile
+import types
+import unittest
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects.postgresql import psycopg2
+from sqlalchemy.pool import QueuePool
+
+import integrity_lib as ilib
+
+
+class FakeCursor:
+    """
+    Курсор psycopg2 без сервера: mogrify подставляет параметры
+    по правилам psycopg2, copy_expert запоминает команду.
+    """
+
+    rowcount = 0
+
+    def __init__(self):
+        self.statements = []
+
+    def mogrify(self, query, params):
+        quoted = {
+            name: str(value) if isinstance(value, int) else f"'{value}'"
+            for name, value in params.items()
+        }
+        return (query % quoted).encode()
+
+    def copy_expert(self, statement, file):
+        self.statements.append(statement)
+
+    def close(self):
+        pass
+
+
+class CopyTableTest(unittest.TestCase):
+    def setUp(self):
+        self.cursor = FakeCursor()
+        dialect = psycopg2.dialect()
+        self.connection = types.SimpleNamespace(
+            engine=types.SimpleNamespace(
+                dialect=dialect,
+                url=types.SimpleNamespace(drivername="postgresql"),
+            ),
+            dialect=dialect,
+            connection=types.SimpleNamespace(cursor=lambda: self.cursor),
+        )
+
+    def test_percent_literals(self):
+        ilib.copy_table(
+            self.connection,
+            "t",
+            "id",
+            None,
+            "id % 10 = :rest AND name LIKE '50%'",
+            {"rest": 3},
+        )
+        self.assertEqual(
+            self.cursor.statements,
+            [
+                b"COPY (SELECT * FROM \"t\" WHERE id % 10 = 3 AND name LIKE '50%' "
+                b'ORDER BY "id") TO STDOUT'
+            ],
+        )
+
+    def test_percent_without_params(self):
+        ilib.copy_table(self.connection, "t", "id", None, "name LIKE '%x'", binary=True)
+        self.assertEqual(
+            self.cursor.statements,
+            [
+                b"COPY (SELECT * FROM \"t\" WHERE name LIKE '%x' "
+                b'ORDER BY "id") TO STDOUT (FORMAT binary)'
+            ],
+        )
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        # Пул на 3 соединения, одно из которых занято вызывающим
+        self.engine = create_engine(
+            f"sqlite:///{os.path.join(self.directory.name, 'protected.db')}",
+            poolclass=QueuePool,
+            pool_size=3,
+            max_overflow=0,
+            pool_timeout=0.1,
+            connect_args={"check_same_thread": False},
+        )
+        self.connection = self.engine.connect()
+        self.connection.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY, a TEXT)"))
+        for i in range(100):
+            self.connection.execute(text("INSERT INTO t VALUES (:i, 'a');"), {"i": i})
+
+    def tearDown(self):
+        self.connection.close()
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def checksum(self, workers: int) -> str:
+        return ilib.checksum_table_parallel(
+            self.connection, "t", "id", "md5", workers=workers
+        )[0]
+
+    def test_workers_within_pool(self):
+        self.assertEqual(
+            self.checksum(2), ilib.checksum_table(self.connection, "t", "id", "md5")[0]
+        )
+        self.assertEqual(self.engine.pool.checkedout(), 1)
+
+    def test_workers_above_pool(self):
+        with self.assertRaises(ilib.ParamError):
+            self.checksum(4)
+        self.assertEqual(self.engine.pool.checkedout(), 1)
+
+    def test_pool_exhausted(self):
+        other = self.engine.connect()
+        try:
+            with self.assertRaises(ilib.ParamError):
+                self.checksum(2)
+            # Соединения, взятые до исчерпания пула, возвращены
+            self.assertEqual(self.engine.pool.checkedout(), 2)
+        finally:
+            other.close()
+
+
+class ServerDigestTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        self.connection = self.engine.connect()
+        self.connection.execute(
+            text("CREATE TABLE t (id INTEGER PRIMARY KEY, a TEXT, b INTEGER)")
+        )
+        # Записи вставляются не в порядке первичного ключа
+        for i in reversed(range(10)):
+            self.connection.execute(
+                text("INSERT INTO t VALUES (:i, :a, :b);"),
+                {"i": i, "a": f"v'{i}", "b": i * 10 if i % 3 else None},
+            )
+
+    def tearDown(self):
+        self.connection.close()
+        self.engine.dispose()
+
+    @staticmethod
+    def rows(ids) -> list:
+        # Текстовое представление записей: quote() полей через запятую
+        return [
+            f"{i},'v''{i}',{i * 10 if i % 3 else 'NULL'}".encode() for i in ids
+        ]
+
+    @staticmethod
+    def digest(algorithm: str, data: bytes) -> str:
+        return hashlib.new(algorithm, data).hexdigest()
+
+    def expected(self, algorithm: str, ids, chunk_rows: int) -> str:
+        row_digests = [self.digest(algorithm, row) for row in self.rows(ids)]
+        if not chunk_rows:
+            return self.digest(algorithm, "".join(row_digests).encode())
+        chunks = [
+            "".join(row_digests[i : i + chunk_rows]).encode()
+            for i in range(0, len(row_digests), chunk_rows)
+        ]
+        return self.digest(
+            algorithm, "".join(self.digest(algorithm, c) for c in chunks).encode()
+        )
+
+    def checksum(self, chunk_rows: int, condition=None, params=None):
+        return ilib.checksum_table_server(
+            self.connection,
+            "t",
+            "id",
+            ["md5", "sha256"],
+            condition,
+            params,
+            chunk_rows=chunk_rows,
+        )
+
+    def test_chunked(self):
+        digests, count = self.checksum(4)
+        self.assertEqual(count, 10)
+        for algorithm in ("md5", "sha256"):
+            self.assertEqual(digests[algorithm], self.expected(algorithm, range(10), 4))
+
+    def test_concat(self):
+        digests, count = self.checksum(0)
+        self.assertEqual(count, 10)
+        for algorithm in ("md5", "sha256"):
+            self.assertEqual(digests[algorithm], self.expected(algorithm, range(10), 0))
+        self.assertNotEqual(digests, self.checksum(4)[0])
+
+    def test_row_filter(self):
+        for chunk_rows in (0, 3):
+            digests, count = self.checksum(chunk_rows, '"id" >= :lower', {"lower": 5})
+            self.assertEqual(count, 5)
+            self.assertEqual(
+                digests["md5"], self.expected("md5", range(5, 10), chunk_rows)
+            )
+
+    def test_empty_table(self):
+        self.connection.execute(text("DELETE FROM t;"))
+        for chunk_rows in (0, 4):
+            digests, count = self.checksum(chunk_rows)
+            self.assertEqual(count, 0)
+            self.assertEqual(digests["md5"], self.digest("md5", b""))
+
+
+class UnorderedTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = create_engine(
+            f"sqlite:///{os.path.join(self.directory.name, 'protected.db')}",
+            poolclass=QueuePool,
+            pool_size=5,
+            connect_args={"check_same_thread": False},
+        )
+        self.connection = self.engine.connect()
+        # Одинаковые записи с неравномерно распределёнными ключами,
+        # вставленные в разном порядке
+        ids = [i * i for i in range(50)]
+        for table, order in (("t", ids), ("u", reversed(ids))):
+            self.connection.execute(
+                text(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, a TEXT)")
+            )
+            for i in order:
+                self.connection.execute(
+                    text(f"INSERT INTO {table} VALUES (:i, :a);"), {"i": i, "a": str(i)}
+                )
+        self.select_partition_bounds = ilib.select_partition_bounds
+
+        def select_partition_bounds(*args, **kwargs):
+            self.fail("Диапазоны разбиты по номерам записей")
+
+        ilib.select_partition_bounds = select_partition_bounds
+
+    def tearDown(self):
+        ilib.select_partition_bounds = self.select_partition_bounds
+        self.connection.close()
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def checksum(self, table: str, workers: int, algorithm="crc32"):
+        return ilib.checksum_table_unordered(
+            self.connection, table, "id", algorithm, workers=workers
+        )
+
+    def test_workers_match(self):
+        for algorithm in ("crc32", ["md5", "sha256"]):
+            expected = self.checksum("t", 1, algorithm)
+            self.assertEqual(expected[1], 50)
+            for workers in (2, 3, 4):
+                self.assertEqual(self.checksum("t", workers, algorithm), expected)
+
+    def test_row_order(self):
+        for workers in (1, 3):
+            self.assertEqual(self.checksum("t", workers), self.checksum("u", workers))
+
+    def test_empty_table(self):
+        self.connection.execute(text("DELETE FROM t;"))
+        self.assertEqual(self.checksum("t", 3), self.checksum("t", 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+import integrity_lib as ilib
+from integrity_watcher import DatabaseEventHandler
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class FlushTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        self.aux_db_path = ilib.AUX_DB_PATH
+        self.batch_size = ilib.BATCH_SIZE
+        self.register_violations = ilib.register_violations
+        # db_init.sql открывается из текущего каталога
+        os.chdir(PACKAGE_DIR)
+        ilib.close_auxiliary_db()
+        ilib.AUX_DB_PATH = os.path.join(self.directory.name, "integrity_db.db")
+        self.connection = ilib.get_auxiliary_db()
+        self.paths = ["a", "b", "c"]
+        self.connection.executemany(
+            "INSERT INTO files (path, is_correct) VALUES (?, 1);",
+            [(path,) for path in self.paths],
+        )
+        self.connection.commit()
+        self.handler = DatabaseEventHandler(patterns=self.paths)
+        for path in self.paths:
+            self.handler.pending.put(path)
+
+    def tearDown(self):
+        ilib.register_violations = self.register_violations
+        ilib.BATCH_SIZE = self.batch_size
+        ilib.close_auxiliary_db()
+        ilib.AUX_DB_PATH = self.aux_db_path
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def errors(self) -> list:
+        return self.connection.execute(
+            "SELECT f.path FROM file_errors e "
+            "INNER JOIN files f ON f.id = e.file_id ORDER BY f.path;"
+        ).fetchall()
+
+    def test_failed_write_keeps_paths(self):
+        ilib.BATCH_SIZE = 1
+        calls = []
+
+        def register_violations(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise ilib.DatabaseError("Не удалось выполнить запрос")
+            return self.register_violations(*args, **kwargs)
+
+        ilib.register_violations = register_violations
+        self.handler.flush(self.connection)
+        self.assertEqual(len(self.errors()), 1)
+        self.assertEqual(self.handler.pending.qsize(), 2)
+        ilib.register_violations = self.register_violations
+        self.handler.flush(self.connection)
+        # Каждое нарушение записано один раз
+        self.assertEqual(self.errors(), [(path,) for path in self.paths])
+        self.assertTrue(self.handler.pending.empty())
+
+
+if __name__ == "__main__":
+    unittest.main()